@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from core import coherence, delegation, participation, publishing, search, turnout
+        search.connect_signals()
+        publishing.connect_signals()
+        turnout.connect_signals()
+        delegation.connect_signals()
+        coherence.connect_signals()
+        participation.connect_signals()
@@ -0,0 +1,197 @@
+"""
+Cross-process coherence of per-process caches of derived data.
+
+Every kind of data that caches depend on has a version counter in `EntityVersion`
+(VOTERS, SURVEYS, VOTES). Model save/delete signals and the bulk code paths that bypass
+signals (`update()`, raw SQL, `bulk_create`) call `bump()`, which increments the counter
+in the writing transaction, so other processes see the new version together with the
+new data.
+
+The counters are read with one query on a tiny table, the first time a request uses a
+`LocalCache` (or `version()`); requests that use no cache, such as the login page, do not
+query them. A `LocalCache` is emptied when one of its entities' versions has changed since
+the last check in this process. Values are therefore at most one request old in another
+process, and immediately fresh in the process that made the change (its caches are emptied
+when the transaction commits).
+
+Only removing or bulk-loading votes bumps VOTES. Online votes go to open surveys, and
+caches of vote totals only hold closed surveys. Cache misses are built from the primary
+database: data read from a lagging replica must not be stored under the current version.
+Outside requests (jobs, commands) every cache access checks the versions first. Versions
+and cached values are kept per database, i.e. per organization (core.tenancy). A database
+without the version table yet (not migrated) is treated as having no versions.
+"""
+import threading
+from itertools import islice
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from core import metrics
+from core.db_routers import primary_alias, primary_reads
+from core.models import Ballot, EntityVersion, Option, Survey, Vote, Voter
+
+VOTERS = "voters"
+SURVEYS = "surveys"  # surveys, their options and ballots
+VOTES = "votes"
+
+_lock = threading.Lock()
+_seen = {}  # database alias -> {entity: version at this process's last check}
+_caches = []
+_request = threading.local()  # `active`: serving a request; `checked`: versions read during it
+
+
+class LocalCache:
+    """
+    Per-process dict (one per organization) of values derived from `entities`, emptied when
+    any of their versions changes. Values are shared between requests and threads: treat them
+    as read-only.
+    """
+
+    def __init__(self, name, entities, max_entries=10000):
+        self.name = name
+        self.entities = frozenset(entities)
+        self.max_entries = max_entries
+        self._data = {}  # database alias -> {key: value}
+        self._generation = 0
+        _caches.append(self)
+
+    def get_or_set(self, key, build):
+        """The cached value for `key`, or `build()` (run against the primary) stored and returned."""
+        _ensure_checked()
+        alias = primary_alias()
+        try:
+            value = self._data[alias][key]
+        except KeyError:
+            pass
+        else:
+            metrics.record_cache(self.name, True)
+            return value
+        metrics.record_cache(self.name, False)
+        generation = self._generation
+        with primary_reads():
+            value = build()
+        with _lock:
+            # Skip the store if the cache was emptied meanwhile: `value` may predate that change.
+            if generation == self._generation:
+                data = self._data.setdefault(alias, {})
+                if len(data) >= self.max_entries:
+                    for old in list(islice(data, self.max_entries // 2)):  # oldest entries first
+                        del data[old]
+                data[key] = value
+        return value
+
+    def clear(self, alias=None):
+        """Empty the organization's values (all of them without `alias`)."""
+        with _lock:
+            self._generation += 1
+            if alias is None:
+                self._data = {}
+            else:
+                self._data.pop(alias, None)
+
+
+def _invalidate(entities, alias):
+    for cache in _caches:
+        if cache.entities & entities:
+            cache.clear(alias)
+
+
+def reset():
+    """Empty every cache and forget the versions seen, e.g. after a test rolled the database back."""
+    for cache in _caches:
+        cache.clear()
+    with _lock:
+        _seen.clear()
+
+
+def check():
+    """Read the current versions and empty the caches whose entities changed; one query."""
+    alias = primary_alias()
+    try:
+        versions = dict(EntityVersion.objects.using(alias).values_list("name", "version"))
+    except DatabaseError:  # table not created yet (unmigrated database)
+        return
+    seen = _seen.get(alias, {})
+    changed = {name for name in set(versions) | set(seen) if versions.get(name, 0) != seen.get(name, 0)}
+    if changed:
+        _invalidate(changed, alias)
+        _seen[alias] = versions
+
+
+def _ensure_checked():
+    """Check once per request, on first use; outside requests, on every use."""
+    if getattr(_request, "active", False):
+        if _request.checked:
+            return
+        _request.checked = True
+    check()
+
+
+def version(entity):
+    """Version of `entity` as of this process's last check (for keys in shared caches)."""
+    _ensure_checked()
+    return _seen.get(primary_alias(), {}).get(entity, 0)
+
+
+class _Bumped:
+    """
+    on_commit callback of `bump()`: empties this process's caches of `entities`. While it is
+    queued, it records that they were bumped in the transaction; Django drops it when the
+    transaction (or the savepoint that queued it) rolls back, and runs it on commit.
+    """
+
+    def __init__(self, entities, alias):
+        self.entities, self.alias = entities, alias
+
+    def __call__(self):
+        _invalidate(self.entities, self.alias)
+
+
+def _bumped(connection):
+    """Entities already bumped in the connection's current transaction."""
+    return {entity for _, func, _ in connection.run_on_commit if isinstance(func, _Bumped) for entity in func.entities}
+
+
+def bump(*entities):
+    """Advance the versions of `entities` (once per transaction); this process's caches are emptied on commit."""
+    alias = primary_alias()
+    new = set(entities) - _bumped(transaction.get_connection(alias))
+    if not new:
+        return
+    updated = EntityVersion.objects.filter(name__in=new).update(version=F("version") + 1)
+    if updated < len(new):
+        EntityVersion.objects.bulk_create([EntityVersion(name=name, version=1) for name in new], ignore_conflicts=True)
+    transaction.on_commit(_Bumped(new, alias), using=alias)
+
+
+class CoherenceMiddleware:
+    """Mark the request so the entity versions are checked once, when it first uses a LocalCache."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _request.active, _request.checked = True, False
+        try:
+            return self.get_response(request)
+        finally:
+            _request.active = False
+
+
+# ----- Signal handlers -----
+_SENDERS = {Voter: VOTERS, Survey: SURVEYS, Option: SURVEYS, Ballot: SURVEYS}
+
+
+def _changed(sender, **kwargs):
+    bump(_SENDERS[sender])
+
+
+def _vote_deleted(sender, **kwargs):
+    bump(VOTES)
+
+
+def connect_signals():
+    for model in _SENDERS:
+        post_save.connect(_changed, sender=model, dispatch_uid=f"coherence_{model.__name__.lower()}_saved")
+        post_delete.connect(_changed, sender=model, dispatch_uid=f"coherence_{model.__name__.lower()}_deleted")
+    post_delete.connect(_vote_deleted, sender=Vote, dispatch_uid="coherence_vote_deleted")
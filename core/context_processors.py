@@ -6,6 +6,9 @@ def voter_context(request):
     """Add current voter to context when logged in (via session)."""
     if not request.session.get("voter_id"):
         return {}
+    voter = getattr(request, "voter", None)  # already loaded (and cached) by voter_required
+    if voter is not None:
+        return {"voter": voter}
     try:
         voter = Voter.objects.get(pk=request.session["voter_id"], is_active=True)
         return {"voter": voter}
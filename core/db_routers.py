@@ -0,0 +1,98 @@
+"""
+Database routing: each organization's data lives in its own database (core.tenancy), and
+read-only voter and results traffic can be served by that database's replica.
+
+Every model goes to the current organization's primary database ("default" without
+tenancy); code that opens transactions itself passes `using=primary_alias()`. Views opt in
+to replica reads with `core.decorators.read_replica` (code outside a request, e.g. jobs,
+uses `replica_reads()`). All writes go to the primary, and `ReplicaPinningMiddleware`
+keeps a session on the primary for a short while after it wrote something so it reads
+its own writes. Without a configured replica everything stays on the primary.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from core import tenancy
+
+PIN_SESSION_KEY = "_db_pinned_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def primary_alias():
+    """The current organization's primary database."""
+    return tenancy.current().alias
+
+
+def replica_alias(primary=None):
+    """The replica of `primary` (default: the current organization's database), or None when none is defined."""
+    primary = primary or primary_alias()
+    if primary == tenancy.DEFAULT_ALIAS:
+        alias = getattr(settings, "DATABASE_REPLICA_ALIAS", None)
+    else:
+        alias = f"{primary}_replica"
+    return alias if alias and alias in settings.DATABASES else None
+
+
+@contextmanager
+def replica_reads():
+    """Route core model reads in this block to the replica (if one is configured)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary in this block, even inside `replica_reads()` (e.g. to publish final data)."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class TenantRouter:
+    def db_for_read(self, model, **hints):
+        primary = primary_alias()
+        if model._meta.app_label == "core" and _replica_reads.get():
+            return replica_alias(primary) or primary
+        return primary
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so instances loaded from the replica are never saved back to it.
+        return primary_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Within one organization only: its primary and its replica.
+        return _primary_of(obj1._state.db) == _primary_of(obj2._state.db)
+
+
+def _primary_of(alias):
+    if alias == getattr(settings, "DATABASE_REPLICA_ALIAS", None):
+        return tenancy.DEFAULT_ALIAS
+    return alias.removesuffix("_replica") if alias.startswith("tenant_") else alias
+
+
+class ReplicaPinningMiddleware:
+    """After a write request, pin the session to the primary for DATABASE_REPLICA_PIN_SECONDS.
+
+    Sets `request.db_pinned`, which `read_replica` views check before using the replica.
+    """
+    def __init__(self, get_response):
+        primaries = [tenancy.DEFAULT_ALIAS] + [org.alias for org in tenancy.organizations()]
+        if not any(replica_alias(alias) for alias in primaries):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.db_pinned = request.session.get(PIN_SESSION_KEY, 0) > time.time()
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            request.session[PIN_SESSION_KEY] = time.time() + settings.DATABASE_REPLICA_PIN_SECONDS
+        return response
@@ -2,22 +2,31 @@ from functools import wraps
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib.auth.views import redirect_to_login
+from core import coherence, metrics
+
+_active_voters = coherence.LocalCache("voters", [coherence.VOTERS])  # voter id -> active Voter or None
 
 
 def voter_required(view_func):
-    """Restrict view to authenticated voters (session has voter_id, voter exists and is active)."""
+    """Restrict view to authenticated voters (session has voter_id, voter exists and is active).
+
+    The voter is read from a per-process cache kept coherent by core.coherence; `request.voter`
+    is shared with other requests, so views must not modify it.
+    """
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
         voter_id = request.session.get("voter_id")
         if not voter_id:
+            metrics.voter_auth.inc(result="no_session")
             request.session["next_after_voter_login"] = request.get_full_path()
             return redirect("core:login")
         from core.models import Voter
-        try:
-            voter = Voter.objects.get(pk=voter_id, is_active=True)
-        except Voter.DoesNotExist:
+        voter = _active_voters.get_or_set(voter_id, lambda: Voter.objects.filter(pk=voter_id, is_active=True).first())
+        if voter is None:
+            metrics.voter_auth.inc(result="inactive")
             request.session.flush()
             return redirect("core:login")
+        metrics.voter_auth.inc(result="ok")
         request.voter = voter
         return view_func(request, *args, **kwargs)
     return _wrapped
@@ -33,3 +42,16 @@ def staff_required(view_func):
             return redirect("core:login")
         return view_func(request, *args, **kwargs)
     return _wrapped
+
+
+def read_replica(view_func):
+    """Serve the view's core model reads from the read replica, unless the session is
+    pinned to the primary after a recent write (see core.db_routers)."""
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if getattr(request, "db_pinned", False):
+            return view_func(request, *args, **kwargs)
+        from core.db_routers import replica_reads
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+    return _wrapped
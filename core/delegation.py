@@ -0,0 +1,330 @@
+"""
+Proxy voting: delegations between voters resolved into precomputed effective weights.
+
+A voter may give their vote to another voter for all surveys (general delegation) or for
+one survey; a survey delegation replaces the general one for that survey. Delegations chain
+(A -> B -> C: C votes with all three weights). Delegations from or to an inactive voter are
+ignored. A chain that runs into a cycle is void, so everyone on it keeps their own vote.
+
+`resolve()` finds the end of every chain in one pass over the graph, each voter visited
+once. The result is stored as `EffectiveWeight` rows: one per voter involved in a
+delegation, per scope (the general scope, plus every survey that has delegations of its
+own). Voters without a row vote with `Voter.vote_weight`, so voting reads one indexed row.
+
+When a delegation or an involved voter changes, `refresh()` recomputes only the connected
+parts of the graph around the changed voters. `rebuild()` (also `python manage.py
+rebuild_delegations`) recomputes everything.
+
+Weights are recorded when a vote is cast, so a delegation affects only later votes.
+`check()` refuses a delegation whose delegator has already voted in its scope, where the
+weight would count twice, and one whose receiving voter (the end of the delegate's chain)
+has already voted there, where the weight would be lost.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from core.db_routers import primary_alias
+from core.models import Delegation, EffectiveWeight, Vote, Voter
+
+GENERAL = None  # scope of delegations that apply to every survey
+IN_BATCH = 500
+
+
+def _batches(ids, size=IN_BATCH):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def resolve(targets):
+    """
+    {delegator: end of their chain} for a {delegator: delegate} map; None for chains that
+    run into a cycle. Each voter is walked once: a walk stops at a voter already resolved.
+    """
+    root = {}
+    for start in targets:
+        if start in root:
+            continue
+        path, on_path, node = [], set(), start
+        while node in targets and node not in root and node not in on_path:
+            path.append(node)
+            on_path.add(node)
+            node = targets[node]
+        if node in root:
+            end = root[node]
+        elif node in on_path:
+            end = None  # cycle
+        else:
+            end = node  # does not delegate
+        for voter in path:
+            root[voter] = end
+    return root
+
+
+def _edges(survey_id):
+    """{delegator: delegate} in effect for a scope: survey delegations override general ones."""
+    delegations = Delegation.objects.filter(delegator__is_active=True, delegate__is_active=True)
+    scopes = Q(survey__isnull=True) if survey_id is GENERAL else Q(survey__isnull=True) | Q(survey_id=survey_id)
+    targets = {}
+    # General rows first, so a survey row for the same delegator wins.
+    for delegator, delegate, _ in delegations.filter(scopes).values_list("delegator_id", "delegate_id", "survey_id").order_by(F("survey_id").asc(nulls_first=True)):
+        targets[delegator] = delegate
+    return targets
+
+
+def _rows(survey_id, targets, voters, own):
+    """EffectiveWeight rows of `voters`, a union of whole components of the graph."""
+    part = {d: targets[d] for d in voters if d in targets}
+    root = resolve(part)
+    received = defaultdict(Decimal)
+    for delegator, end in root.items():
+        if end is not None:
+            received[end] += own[delegator]
+    rows = []
+    for voter in voters:
+        end = root.get(voter)
+        if end is not None:
+            rows.append(EffectiveWeight(voter_id=voter, survey_id=survey_id, weight=Decimal(0), delegate_id=end))
+        else:
+            rows.append(EffectiveWeight(voter_id=voter, survey_id=survey_id, weight=own[voter] + received[voter]))
+    return rows
+
+
+def _subgraph(seeds):
+    """
+    Delegation rows in effect (active voters, any scope) of the part of the graph connected
+    to `seeds`: {row id: (delegator, delegate, survey_id)}, and the voters reached. Rows are
+    loaded outward from the seeds, a batched query per step, so the cost follows the size of
+    that part, not of the whole graph. The voters reached are whole components of every
+    scope's graph.
+    """
+    delegations = Delegation.objects.filter(delegator__is_active=True, delegate__is_active=True)
+    rows, reached, frontier = {}, set(), set(seeds)
+    while frontier:
+        reached |= frontier
+        found = set()
+        for batch in _batches(frontier):
+            for pk, delegator, delegate, survey_id in delegations.filter(
+                Q(delegator_id__in=batch) | Q(delegate_id__in=batch)
+            ).values_list("pk", "delegator_id", "delegate_id", "survey_id"):
+                rows[pk] = (delegator, delegate, survey_id)
+                found.update((delegator, delegate))
+        frontier = found - reached
+    return rows, reached
+
+
+def _scope_targets(rows, survey_id):
+    """{delegator: delegate} of loaded rows in effect for a scope: survey rows override general ones."""
+    targets = {}
+    for delegator, delegate, row_survey in sorted(rows, key=lambda row: row[2] is not None):
+        if row_survey is GENERAL or row_survey == survey_id:
+            targets[delegator] = delegate
+    return targets
+
+
+def _survey_scopes():
+    return set(Delegation.objects.filter(survey__isnull=False).values_list("survey_id", flat=True).distinct())
+
+
+def refresh(voter_ids, survey_ids=()):
+    """
+    Recompute effective weights around the given voters (delegators and old/new delegates
+    of a changed delegation, or a voter whose weight or status changed) in every scope.
+    Only the part of the graph connected to them is loaded and rewritten; a survey scope
+    holds rows for the general delegations in that part too, so its voters never fall back
+    to a general row that counts a delegation the survey overrides. `survey_ids` names
+    survey scopes that may have lost their last delegation.
+    """
+    seeds = set(voter_ids)
+    if not seeds:
+        return
+    # Direct neighbours too: when a voter leaves the graph (deactivated), each part it held
+    # together contains one of them.
+    for batch in _batches(set(seeds)):
+        for pair in Delegation.objects.filter(Q(delegator_id__in=batch) | Q(delegate_id__in=batch)).values_list("delegator_id", "delegate_id"):
+            seeds.update(pair)
+    rows, reached = _subgraph(seeds)
+    rows = list(rows.values())
+    general = [row for row in rows if row[2] is GENERAL]
+    own = {}
+    for batch in _batches(reached):
+        own.update(Voter.objects.filter(pk__in=batch).values_list("pk", "vote_weight"))
+    with transaction.atomic(using=primary_alias()):
+        scopes = _survey_scopes()
+        for batch in _batches(reached):
+            EffectiveWeight.objects.filter(voter_id__in=batch).delete()
+        new = []
+        # A general row in this part puts its voters in every survey scope; otherwise only
+        # the scopes of the part's own survey rows have rows here.
+        in_part = scopes if general else {row[2] for row in rows} - {GENERAL}
+        for survey_id in [GENERAL, *sorted(in_part & scopes)]:
+            scope_rows = [row for row in rows if row[2] is GENERAL or row[2] == survey_id]
+            voters = {voter for row in scope_rows for voter in row[:2]}
+            new.extend(_rows(survey_id, _scope_targets(scope_rows, survey_id), voters, own))
+        EffectiveWeight.objects.bulk_create(new, batch_size=IN_BATCH)
+        for survey_id in set(survey_ids) - scopes:
+            EffectiveWeight.objects.filter(survey_id=survey_id).delete()
+
+
+def rebuild():
+    """Recompute every scope from scratch; return the number of rows written."""
+    written = 0
+    with transaction.atomic(using=primary_alias()):
+        EffectiveWeight.objects.all().delete()
+        own = dict(Voter.objects.filter(Q(delegations_given__isnull=False) | Q(delegations_received__isnull=False)).values_list("pk", "vote_weight"))
+        general = _edges(GENERAL)
+        general_voters = set(general) | set(general.values())
+        for survey_id in [GENERAL, *sorted(_survey_scopes())]:
+            targets = general if survey_id is GENERAL else _edges(survey_id)
+            voters = set(targets) | set(targets.values()) | (general_voters if survey_id is not GENERAL else set())
+            rows = _rows(survey_id, targets, voters, own)
+            EffectiveWeight.objects.bulk_create(rows, batch_size=IN_BATCH)
+            written += len(rows)
+    return written
+
+
+# ----- Lookups -----
+def weight_for(voter, survey_id=GENERAL):
+    """(weight to record, voter the vote was delegated to or None): one indexed lookup."""
+    scope = Q(survey__isnull=True)
+    if survey_id is not GENERAL:
+        scope |= Q(survey_id=survey_id)
+    rows = EffectiveWeight.objects.filter(scope, voter=voter).select_related("delegate")
+    row = rows.order_by(F("survey_id").desc(nulls_last=True)).first()
+    if row is None:
+        return voter.vote_weight, None
+    return row.weight, row.delegate
+
+
+def weights_for(voter, survey_ids):
+    """{survey_id: (weight, delegate or None)} for one voter and many surveys, in one query."""
+    rows = {
+        row.survey_id: row
+        for row in EffectiveWeight.objects.filter(voter=voter).filter(Q(survey__isnull=True) | Q(survey_id__in=list(survey_ids))).select_related("delegate")
+    }
+    general = rows.get(GENERAL)
+    result = {}
+    for survey_id in survey_ids:
+        row = rows.get(survey_id, general)
+        result[survey_id] = (row.weight, row.delegate) if row is not None else (voter.vote_weight, None)
+    return result
+
+
+def table(voter_ids):
+    """{(voter_id, survey_id or None): (weight, delegate_id)} of the given voters, for bulk checks (see `lookup`)."""
+    result = {}
+    for batch in _batches(set(voter_ids)):
+        for voter_id, survey_id, weight, delegate_id in EffectiveWeight.objects.filter(voter_id__in=batch).values_list("voter_id", "survey_id", "weight", "delegate_id"):
+            result[(voter_id, survey_id)] = (weight, delegate_id)
+    return result
+
+
+def lookup(weights, voter_id, survey_id, own_weight):
+    """Like `weight_for`, from a `table()`: (weight, delegate_id or None)."""
+    return weights.get((voter_id, survey_id)) or weights.get((voter_id, GENERAL)) or (own_weight, None)
+
+
+def scope_rows(survey):
+    """
+    The EffectiveWeight rows that may apply to votes on `survey`, for use in subqueries:
+    filter them on one voter and take the first (`[:1]`), as `weight_for` does. A voter's
+    row in the survey's scope comes before their general row; the survey scope only holds
+    the voters its delegations reach. Ballot questions follow the general scope.
+    """
+    scope = Q(survey__isnull=True)
+    if survey.ballot_id is None:
+        scope |= Q(survey=survey)
+    return EffectiveWeight.objects.filter(scope).order_by(F("survey_id").desc(nulls_last=True))
+
+
+# ----- Changes -----
+def _chain_end(delegator, delegate, survey_id):
+    """
+    (voter at the end of `delegate`'s chain in the scope or None, whether the chain leads
+    back to `delegator`). The end is None for a chain that runs into another cycle (void).
+    Follows one row per step.
+    """
+    delegations = Delegation.objects.filter(delegator__is_active=True, delegate__is_active=True)
+    scope = Q(survey__isnull=True) if survey_id is GENERAL else Q(survey__isnull=True) | Q(survey_id=survey_id)
+    node, seen = delegate.pk, set()
+    while node not in seen:
+        if node == delegator.pk:
+            return None, True
+        seen.add(node)
+        target = delegations.filter(scope, delegator_id=node).order_by(F("survey_id").desc(nulls_last=True)).values_list("delegate_id", flat=True).first()
+        if target is None:
+            return node, False
+        node = target
+    return None, False
+
+
+def check(delegator, delegate, survey=None):
+    """Reason the delegation cannot be made, or None."""
+    if delegator.pk == delegate.pk:
+        return "A voter cannot delegate to themselves."
+    open_votes = Vote.objects.filter(survey__end_date_time__gt=timezone.now())
+    if survey is not None:
+        if survey.ballot_id:
+            return "Ballot questions follow the voter's general delegation."
+        if survey.is_closed:
+            return "This survey has closed."
+        if Vote.objects.filter(survey=survey, voter=delegator).exists():
+            return f"{delegator.full_name} has already voted on this survey."
+    elif open_votes.filter(voter=delegator).exists():
+        return f"{delegator.full_name} has already voted on an open survey; delegate per survey instead."
+    end, cycle = _chain_end(delegator, delegate, survey.pk if survey is not None else GENERAL)
+    if cycle:
+        return f"{delegate.full_name} already delegates (directly or through others) to {delegator.full_name}."
+    if end is None:
+        return None
+    # The weight moves to the end of the chain; a vote it already cast would not carry it.
+    holder = delegate if end == delegate.pk else Voter.objects.get(pk=end)
+    via = "" if end == delegate.pk else f" (who votes for {delegate.full_name})"
+    if survey is not None:
+        if Vote.objects.filter(survey=survey, voter_id=end).exists():
+            return f"{holder.full_name}{via} has already voted on this survey; the delegated vote would be lost."
+    elif open_votes.filter(voter_id=end).exists():
+        return f"{holder.full_name}{via} has already voted on an open survey; the delegated vote would be lost there. Delegate per survey instead."
+    return None
+
+
+def assign(delegator, delegate, survey=None):
+    """Create or replace the delegator's delegation in that scope and update the weights."""
+    with transaction.atomic(using=primary_alias()):
+        current = Delegation.objects.filter(delegator=delegator, survey=survey).first()
+        seeds = {delegator.pk, delegate.pk}
+        if current is not None:
+            seeds.add(current.delegate_id)
+            current.delete()
+        delegation = Delegation.objects.create(delegator=delegator, delegate=delegate, survey=survey)
+        refresh(seeds)
+    return delegation
+
+
+def revoke(delegation):
+    """Delete a delegation and update the weights."""
+    with transaction.atomic(using=primary_alias()):
+        delegation.delete()
+        refresh({delegation.delegator_id, delegation.delegate_id}, [delegation.survey_id] if delegation.survey_id else ())
+
+
+def involved(voter_ids):
+    """Subset of `voter_ids` that take part in any delegation."""
+    found = set()
+    for batch in _batches(set(voter_ids)):
+        found.update(Delegation.objects.filter(delegator_id__in=batch).values_list("delegator_id", flat=True))
+        found.update(Delegation.objects.filter(delegate_id__in=batch).values_list("delegate_id", flat=True))
+    return found
+
+
+# ----- Signal handlers -----
+def _voter_saved(sender, instance, created, **kwargs):
+    if not created and involved([instance.pk]):
+        refresh([instance.pk])
+
+
+def connect_signals():
+    post_save.connect(_voter_saved, sender=Voter, dispatch_uid="delegation_voter_saved")
@@ -0,0 +1,163 @@
+"""
+Chunked deletion of voters and surveys with their votes and options.
+
+`Model.delete()` makes Django's collector load every dependent Vote and delete everything
+in one transaction, which holds the SQLite write lock for seconds on large histories.
+These functions delete dependents with set-based DELETE statements of at most
+DELETE_CHUNK_SIZE rows, each in its own short transaction. Then they delete the parent rows
+and update what is derived from them: the search index, the published results pages,
+the voters' participation summaries and the cached turnout timelines.
+
+Voters are deactivated and surveys unpublished first, so no new votes arrive while the
+chunks run. Large deletions run as the `delete_records` background job (core/jobs.py).
+"""
+from django.conf import settings
+from django.db import connections, router, transaction
+from core import coherence, delegation, participation, publishing, search, turnout
+from core.db_routers import primary_alias
+from core.models import Delegation, EffectiveWeight, Option, Participation, Survey, Vote, Voter, VoteSubmission
+
+VOTERS = "voters"
+SURVEYS = "surveys"
+IN_BATCH = 500  # parent ids per statement, well below SQLite's bound-parameter limit
+
+
+def _batches(ids, size=IN_BATCH):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class _Progress:
+    def __init__(self, total, callback):
+        self.done, self.total, self.callback = 0, total, callback
+
+    def add(self, rows):
+        self.done += rows
+        if self.callback is not None:
+            self.callback(min(self.done, self.total), self.total)
+
+
+def _sql(model):
+    connection = connections[router.db_for_write(model)]
+    return connection, connection.ops.quote_name(model._meta.db_table)
+
+
+def _delete_chunked(model, column, parent_ids, progress, chunk_size):
+    """DELETE rows of `model` whose `column` is in `parent_ids`, chunk_size rows per transaction."""
+    connection, table = _sql(model)
+    column = connection.ops.quote_name(column)
+    for batch in _batches(parent_ids):
+        placeholders = ", ".join(["%s"] * len(batch))
+        sql = (
+            f"DELETE FROM {table} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE {column} IN ({placeholders}) LIMIT %s)"
+        )
+        while True:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(sql, [*batch, chunk_size])
+                deleted = cursor.rowcount
+            progress.add(deleted)
+            if deleted < chunk_size:
+                break
+
+
+def _delete_where(model, column, ids):
+    """Plain set-based DELETE (no collector, no signals); call inside a transaction."""
+    connection, table = _sql(model)
+    column = connection.ops.quote_name(column)
+    deleted = 0
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(batch))})", batch)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def _count(model, column, ids):
+    return sum(model.objects.filter(**{f"{column}__in": batch}).count() for batch in _batches(ids))
+
+
+def _existing(model, ids):
+    return [pk for batch in _batches(ids) for pk in model.objects.filter(pk__in=batch).values_list("pk", flat=True)]
+
+
+def delete_voters(pks, progress=None, chunk_size=None):
+    """Delete voters and their votes in chunks; return (voters deleted, votes deleted)."""
+    chunk_size = chunk_size or settings.DELETE_CHUNK_SIZE
+    pks = _existing(Voter, pks)
+    surveys = set()
+    for batch in _batches(pks):
+        Voter.objects.filter(pk__in=batch).update(is_active=False)
+        surveys.update(Vote.objects.filter(voter_id__in=batch).values_list("survey_id", flat=True).distinct())
+    coherence.bump(coherence.VOTERS)  # other processes stop letting them in
+    votes = _count(Vote, "voter_id", pks)
+    tracker = _Progress(votes + len(pks), progress)
+    _delete_chunked(Vote, "voter_id", pks, tracker, chunk_size)
+    with transaction.atomic(using=primary_alias()):
+        # Votes that slipped in since deactivation go in the same transaction as the voters.
+        _delete_where(Vote, "voter_id", pks)
+        _delete_where(VoteSubmission, "voter_id", pks)
+        _delete_where(Participation, "voter_id", pks)
+        neighbours = _delegation_neighbours(pks)
+        for column in ("voter_id", "delegate_id"):
+            _delete_where(EffectiveWeight, column, pks)
+        for column in ("delegator_id", "delegate_id"):
+            _delete_where(Delegation, column, pks)
+        deleted = _delete_where(Voter, "id", pks)
+        search.remove(search.VOTER, pks)
+        coherence.bump(coherence.VOTERS, coherence.VOTES)
+    tracker.add(deleted)
+    delegation.refresh(neighbours)
+    turnout.invalidate(surveys)
+    publishing.refresh(surveys)
+    return deleted, votes
+
+
+def _delegation_neighbours(pks):
+    """Voters, other than `pks`, on either end of a delegation that involves one of `pks`."""
+    found = set()
+    for batch in _batches(pks):
+        found.update(Delegation.objects.filter(delegator_id__in=batch).values_list("delegate_id", flat=True))
+        found.update(Delegation.objects.filter(delegate_id__in=batch).values_list("delegator_id", flat=True))
+    return found - set(pks)
+
+
+def delete_surveys(pks, progress=None, chunk_size=None):
+    """Delete surveys with their votes and options in chunks; return (surveys deleted, votes deleted)."""
+    chunk_size = chunk_size or settings.DELETE_CHUNK_SIZE
+    pks = _existing(Survey, pks)
+    voters = set()
+    for batch in _batches(pks):
+        Survey.objects.filter(pk__in=batch).update(is_published=False)
+        voters.update(Vote.objects.filter(survey_id__in=batch).values_list("voter_id", flat=True).distinct())
+    coherence.bump(coherence.SURVEYS)
+    votes = _count(Vote, "survey_id", pks)
+    tracker = _Progress(votes + _count(Option, "survey_id", pks) + len(pks), progress)
+    _delete_chunked(Vote, "survey_id", pks, tracker, chunk_size)
+    with transaction.atomic(using=primary_alias()):
+        _delete_where(Vote, "survey_id", pks)
+        _delete_where(VoteSubmission, "survey_id", pks)
+        _delete_where(EffectiveWeight, "survey_id", pks)
+        _delete_where(Delegation, "survey_id", pks)
+        tracker.add(_delete_where(Option, "survey_id", pks))
+        deleted = _delete_where(Survey, "id", pks)
+        search.remove(search.SURVEY, pks)
+        coherence.bump(coherence.SURVEYS, coherence.VOTES)
+    tracker.add(deleted)
+    participation.refresh(voters)
+    turnout.invalidate(pks)
+    if settings.RESULTS_PUBLISH_ENABLED:
+        for pk in pks:
+            publishing.unpublish_survey(pk)
+        publishing.publish_index()
+    return deleted, votes
+
+
+def dependent_rows(kind, pks):
+    """Number of vote rows a deletion would remove (used to decide inline vs background)."""
+    return _count(Vote, "voter_id" if kind == VOTERS else "survey_id", pks)
+
+
+def delete(kind, pks, progress=None):
+    return (delete_voters if kind == VOTERS else delete_surveys)(pks, progress=progress)
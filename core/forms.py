@@ -1,7 +1,7 @@
 import re
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
-from core.models import Voter, Survey, Option, Vote
+from core.models import Voter, Ballot, Survey, Option, Vote
 
 
 # ----- EnterPass login -----
@@ -49,12 +49,67 @@ class SurveyForm(forms.ModelForm):
 
     class Meta:
         model = Survey
-        fields = ["question_text", "end_date_time", "is_published"]
+        fields = ["question_text", "kind", "end_date_time", "is_published"]
+        labels = {"kind": "Voting method"}
         widgets = {
             "question_text": forms.Textarea(attrs={"rows": 3, "class": "form-control"}),
+            "kind": forms.Select(attrs={"class": "form-select"}),
             "is_published": forms.CheckboxInput(attrs={"class": "form-check-input"}),
         }
 
+    def clean_kind(self):
+        kind = self.cleaned_data["kind"]
+        if self.instance.pk and kind != self.instance.kind and self.instance.votes.exists():
+            raise forms.ValidationError("The voting method cannot change once votes have been cast.")
+        return kind
+
+
+class BallotQuestionForm(SurveyForm):
+    """Edit form for a ballot question; end time and publish flag belong to the ballot."""
+    end_date_time = None
+
+    class Meta(SurveyForm.Meta):
+        fields = ["question_text"]
+
+
+# ----- Ballot (admin) -----
+class BallotForm(forms.ModelForm):
+    end_date_time = forms.SplitDateTimeField(
+        widget=forms.SplitDateTimeWidget(
+            date_attrs={"type": "date", "class": "form-control"},
+            time_attrs={"type": "time", "class": "form-control"},
+        ),
+        label="End date/time",
+    )
+    questions = forms.CharField(
+        widget=forms.Textarea(attrs={"rows": 14, "class": "form-control font-monospace"}),
+        help_text="One block per question: the question on the first line, then one option per line. Separate questions with a blank line.",
+    )
+
+    class Meta:
+        model = Ballot
+        fields = ["title", "end_date_time", "is_published"]
+        widgets = {
+            "title": forms.TextInput(attrs={"class": "form-control"}),
+            "is_published": forms.CheckboxInput(attrs={"class": "form-check-input"}),
+        }
+
+    def clean_questions(self):
+        """Parse the blocks into [(question_text, [option_text, ...]), ...]."""
+        blocks = re.split(r"\n\s*\n", self.cleaned_data["questions"].strip())
+        questions = []
+        for n, block in enumerate(blocks, 1):
+            lines = [line.strip().lstrip("-*").strip() for line in block.splitlines()]
+            lines = [line for line in lines if line]
+            if len(lines) < 3:
+                raise forms.ValidationError(f"Question {n} needs at least 2 options.")
+            if any(len(line) > 500 for line in lines[1:]):
+                raise forms.ValidationError(f"Question {n}: options are limited to 500 characters.")
+            questions.append((lines[0], lines[1:]))
+        if len(questions) < 2:
+            raise forms.ValidationError("A ballot needs at least 2 questions; create a single survey instead.")
+        return questions
+
 
 class OptionFormSet(forms.BaseInlineFormSet):
     def clean(self):
@@ -91,6 +146,62 @@ class VoteForm(forms.Form):
         self.fields["option"].queryset = survey.options.all()
 
 
+class RankedVoteForm(forms.Form):
+    """One select per preference (1st choice, 2nd choice, ...); only the first is required."""
+    def __init__(self, survey, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = list(survey.options.all())
+        choices = [("", "—")] + [(o.pk, o.option_text) for o in options]
+        for rank in range(1, len(options) + 1):
+            self.fields[f"rank_{rank}"] = forms.TypedChoiceField(
+                label=f"Choice {rank}",
+                choices=choices,
+                coerce=int,
+                empty_value=None,
+                required=rank == 1,
+                widget=forms.Select(attrs={"class": "form-select"}),
+                error_messages={"required": "Choose at least your first preference."},
+            )
+
+    def clean(self):
+        data = super().clean()
+        ranking, skipped = [], False
+        for name in self.fields:
+            option_id = data.get(name)
+            if option_id is None:
+                skipped = True
+            elif skipped:
+                raise forms.ValidationError("Fill in your preferences in order, without gaps.")
+            elif option_id in ranking:
+                raise forms.ValidationError("Each option can be ranked only once.")
+            else:
+                ranking.append(option_id)
+        data["ranking"] = ranking
+        return data
+
+
+class BallotVoteForm(forms.Form):
+    """One radio group per unanswered ballot question, validated in a single pass.
+
+    Choices come from the questions' prefetched options, so validation runs no queries.
+    """
+    def __init__(self, questions, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.questions = list(questions)
+        for survey in self.questions:
+            self.fields[f"q{survey.pk}"] = forms.TypedChoiceField(
+                label=survey.question_text,
+                choices=[(o.pk, o.option_text) for o in survey.options.all()],
+                coerce=int,
+                widget=forms.RadioSelect(attrs={"class": "form-check-input"}),
+                error_messages={"required": "Please answer this question."},
+            )
+
+    def selections(self):
+        """[(survey, option_id), ...] for every question; call after is_valid()."""
+        return [(survey, self.cleaned_data[f"q{survey.pk}"]) for survey in self.questions]
+
+
 # ----- Add user (admin) -----
 class VoterCreateForm(forms.ModelForm):
     class Meta:
@@ -102,15 +213,61 @@ class VoterCreateForm(forms.ModelForm):
         }
 
 
+# ----- Import users (admin) -----
+class VoterImportForm(forms.Form):
+    file = forms.FileField(
+        label="Excel file (.xlsx)",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".xlsx"}),
+    )
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith(".xlsx"):
+            raise forms.ValidationError("Upload an .xlsx file.")
+        return f
+
+
+class SurveyImportForm(forms.Form):
+    file = forms.FileField(
+        label="Survey definitions (.json, .yaml or .xlsx)",
+        help_text="Surveys without a published value are published; an end date without a time means the end of that day.",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".json,.yaml,.yml,.xlsx"}),
+    )
+
+    def clean_file(self):
+        from core.survey_import import FORMATS
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith(FORMATS):
+            raise forms.ValidationError("Upload a .json, .yaml or .xlsx file.")
+        return f
+
+
+# ----- Paper votes import (admin) -----
+class PaperVoteImportForm(forms.Form):
+    file = forms.FileField(
+        label="Paper ballots (.xlsx or .csv)",
+        help_text="Columns: EnterPass or Voter ID, Survey ID, Option (text or id), optional Weight.",
+        widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".xlsx,.csv"}),
+    )
+    allow_closed = forms.BooleanField(
+        label="Accept votes for surveys that have already closed",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
+
+    def clean_file(self):
+        f = self.cleaned_data["file"]
+        if not f.name.lower().endswith((".xlsx", ".csv")):
+            raise forms.ValidationError("Upload an .xlsx or .csv file.")
+        return f
+
+
 # ----- Vote reset (admin) -----
 class VoteResetForm(forms.Form):
-    survey = forms.ModelChoiceField(queryset=Survey.objects.all().order_by("-end_date_time"), label="Survey", widget=forms.Select(attrs={"class": "form-select"}))
-    voter = forms.ModelChoiceField(queryset=Voter.objects.filter(is_active=True).order_by("full_name"), label="User", widget=forms.Select(attrs={"class": "form-select"}))
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Optional: filter voters by survey (only those who voted) after survey is selected via JS or second step
-        pass
+    """Survey and voter ids picked through the typeahead lookups (admin_lookup_surveys/voters).
+    Any voter who voted qualifies, deactivated ones included."""
+    survey = forms.ModelChoiceField(queryset=Survey.objects.all(), widget=forms.HiddenInput, error_messages={"required": "Choose a survey."})
+    voter = forms.ModelChoiceField(queryset=Voter.objects.all(), widget=forms.HiddenInput, error_messages={"required": "Choose a user."})
 
     def clean(self):
         data = super().clean()
@@ -120,3 +277,20 @@ class VoteResetForm(forms.Form):
             if not Vote.objects.filter(survey=survey, voter=voter).exists():
                 raise forms.ValidationError("This user has not voted on the selected survey.")
         return data
+
+
+# ----- Delegation (admin) -----
+class DelegationForm(forms.Form):
+    """Delegator, delegate and optional survey picked through the typeahead lookups; see core.delegation."""
+    delegator = forms.ModelChoiceField(queryset=Voter.objects.filter(is_active=True), widget=forms.HiddenInput, error_messages={"required": "Choose the user who delegates."})
+    delegate = forms.ModelChoiceField(queryset=Voter.objects.filter(is_active=True), widget=forms.HiddenInput, error_messages={"required": "Choose the user who receives the vote."})
+    survey = forms.ModelChoiceField(queryset=Survey.objects.all(), required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        from core.delegation import check
+        data = super().clean()
+        if data.get("delegator") and data.get("delegate"):
+            reason = check(data["delegator"], data["delegate"], data.get("survey"))
+            if reason:
+                raise forms.ValidationError(reason)
+        return data
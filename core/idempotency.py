@@ -0,0 +1,84 @@
+"""
+Idempotent vote submission.
+
+Each vote form on the survey page carries a one-time token (`{% vote_token %}`). The POST
+that records the vote stores a `VoteSubmission` under that token, in the same transaction
+as the votes. A repeated POST of the same form (a double tap, or a retry by the browser or
+a proxy after a lost response) finds its token with one indexed lookup. It is answered
+with the original outcome before any survey, option or Vote check runs. When two copies
+are in flight at once, the unique constraints make the second one's transaction fail, and
+it then replays the first one's row.
+
+Nothing is stored when a form is rendered, so GETs stay read-only. Nothing is stored for
+POSTs that recorded no vote either, so a corrected form can be sent again with the same
+token. Rows older than VOTE_TOKEN_TTL seconds are ignored, and deleted after a later
+submission commits (at most once a minute per process).
+"""
+import re
+import secrets
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.formats import time_format
+from core.db_routers import primary_alias
+from core.models import VoteSubmission
+
+FIELD = "submission_token"
+SWEEP_SECONDS = 60
+
+_TOKEN = re.compile(r"[0-9a-f]{32}\Z")
+_state = {"swept": 0.0}
+
+
+def new_token():
+    return secrets.token_hex(16)
+
+
+def token_from(request):
+    """The submission token of a vote POST, or None when missing or malformed."""
+    token = request.POST.get(FIELD, "")
+    return token if _TOKEN.match(token) else None
+
+
+def _cutoff():
+    return timezone.now() - timedelta(seconds=settings.VOTE_TOKEN_TTL)
+
+
+def find(voter, token):
+    """The voter's unexpired submission stored under `token`, or None."""
+    if token is None:
+        return None
+    return VoteSubmission.objects.filter(token=token, voter=voter, created_at__gt=_cutoff()).first()
+
+
+def record(voter, token, summary, survey=None, ballot=None):
+    """Store the outcome under `token` (if any); call in the transaction that wrote the votes."""
+    if token is None:
+        return
+    VoteSubmission.objects.create(token=token, voter=voter, survey=survey, ballot=ballot, summary=summary[:500])
+    transaction.on_commit(sweep, using=primary_alias())
+
+
+def message(submission):
+    """What the voter is told when a submission is replayed."""
+    recorded = time_format(timezone.localtime(submission.created_at), "H:i")
+    return f"{submission.summary} was already recorded at {recorded}; it was not submitted again."
+
+
+def forget(voter, survey):
+    """Drop the stored outcomes for a vote that was reset, so its old form cannot replay it."""
+    scope = Q(survey=survey) | Q(ballot_id=survey.ballot_id) if survey.ballot_id else Q(survey=survey)
+    VoteSubmission.objects.filter(scope, voter=voter).delete()
+
+
+def sweep(force=False):
+    """Delete expired rows, at most every SWEEP_SECONDS per process unless `force`."""
+    now = time.monotonic()
+    if not force and now - _state["swept"] < SWEEP_SECONDS:
+        return 0
+    _state["swept"] = now
+    deleted, _ = VoteSubmission.objects.filter(created_at__lte=_cutoff()).delete()
+    return deleted
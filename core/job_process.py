@@ -0,0 +1,21 @@
+"""
+Entry points for `run_jobs` worker processes.
+
+Spawned workers unpickle these functions before Django is configured, so this module must
+not import models at import time.
+"""
+import os
+
+
+def init_worker():
+    """Process pool initializer: configure Django in the spawned worker process."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "questionnaire_site.settings")
+    import django
+    django.setup()
+
+
+def execute(job_id, organization=None):
+    from core import tenancy
+    from core.jobs import execute as execute_job
+    with tenancy.activated(organization):
+        return execute_job(job_id)
@@ -0,0 +1,318 @@
+"""
+DB-backed background jobs: task registry, enqueueing, claiming and execution.
+
+Admin views call `enqueue()`; `python manage.py run_jobs` claims queued jobs and runs
+them in a process pool. Tasks are plain functions registered with `@task` and receive
+the job params plus a `JobRun` used to report progress and write the result file.
+"""
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from core import coherence, delegation, search, tenancy
+from core.db_routers import primary_alias, replica_reads
+from core.models import Job, Voter, Survey, Vote
+
+TASKS = {}
+
+ENTER_PASS_CHARS = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # avoid ambiguous 0/O, 1/I
+IMPORT_BATCH_SIZE = 500  # rows of a users import written per transaction
+
+
+def task(kind, label):
+    """Register `func(params, run)` as the handler for jobs of `kind`."""
+    def register(func):
+        TASKS[kind] = (label, func)
+        return func
+    return register
+
+
+def label_for(kind):
+    return TASKS[kind][0] if kind in TASKS else kind
+
+
+def artifact_root():
+    return tenancy.current().path(settings.JOB_ARTIFACT_ROOT)
+
+
+def enqueue(kind, params=None, user=None):
+    """Queue a job for the worker and return it."""
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    created_by = user if user is not None and user.is_authenticated else None
+    return Job.objects.create(kind=kind, params=params or {}, created_by=created_by)
+
+
+def save_upload(uploaded_file):
+    """Store an uploaded file under the artifact root; return its relative name for job params."""
+    name = f"uploads/{timezone.now():%Y%m%d%H%M%S}-{os.getpid()}-{Path(uploaded_file.name).name}"
+    path = artifact_root() / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as fh:
+        for chunk in uploaded_file.chunks():
+            fh.write(chunk)
+    return name
+
+
+class JobRun:
+    """Handle passed to a task: throttled progress updates and result file location."""
+    PROGRESS_INTERVAL = 0.5  # seconds between progress writes
+
+    def __init__(self, job):
+        self.job = job
+        self.message = ""
+        self.artifact = ""
+        self._last_write = 0.0
+
+    def progress(self, done, total=None):
+        now = time.monotonic()
+        finished = total is not None and done >= total
+        if not finished and now - self._last_write < self.PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+        fields = {"progress": done}
+        if total is not None:
+            fields["total"] = total
+        Job.objects.filter(pk=self.job.pk).update(**fields)
+
+    def artifact_path(self, filename):
+        """Path for this job's result file; it becomes downloadable once the job is done."""
+        self.artifact = f"job-{self.job.pk}/{filename}"
+        path = artifact_root() / self.artifact
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+
+def claim_next():
+    """Atomically move the oldest queued job to running; return its id or None."""
+    while True:
+        job_id = Job.objects.filter(status=Job.QUEUED).order_by("created_at", "id").values_list("pk", flat=True).first()
+        if job_id is None:
+            return None
+        claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(status=Job.RUNNING, started_at=timezone.now())
+        if claimed:
+            return job_id
+
+
+def fail_orphaned():
+    """Mark jobs left running by a stopped worker as failed."""
+    return Job.objects.filter(status=Job.RUNNING).update(
+        status=Job.FAILED,
+        message="Worker stopped before the job finished.",
+        finished_at=timezone.now(),
+    )
+
+
+def execute(job_id):
+    """Run one claimed job to completion, recording the outcome on the Job row."""
+    try:
+        job = Job.objects.get(pk=job_id)
+        run = JobRun(job)
+        try:
+            TASKS[job.kind][1](job.params, run)
+        except Exception as exc:
+            traceback.print_exc(file=sys.stderr)
+            Job.objects.filter(pk=job_id).update(
+                status=Job.FAILED,
+                message=f"{type(exc).__name__}: {exc}"[:2000],
+                finished_at=timezone.now(),
+            )
+            return Job.FAILED
+        Job.objects.filter(pk=job_id).update(
+            status=Job.DONE,
+            message=run.message,
+            artifact=run.artifact,
+            finished_at=timezone.now(),
+        )
+        return Job.DONE
+    finally:
+        connections.close_all()
+
+
+# ----- Tasks -----
+@task("export_users", "Users export")
+def export_users(params, run):
+    import openpyxl
+
+    total = Voter.objects.count()
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Users")
+    ws.append(["Full Name", "EnterPass", "Vote Weight", "Status"])
+    rows = Voter.objects.order_by("full_name").values_list("full_name", "enter_pass", "vote_weight", "is_active")
+    for i, (full_name, enter_pass, weight, is_active) in enumerate(rows.iterator(chunk_size=2000), 1):
+        ws.append([full_name, enter_pass, float(weight), "Active" if is_active else "Inactive"])
+        run.progress(i, total)
+    wb.save(run.artifact_path("users.xlsx"))
+    run.message = f"Exported {total} user(s)."
+
+
+@task("export_results", "Results workbook")
+def export_results(params, run):
+    """All surveys: per-option totals on one sheet, every named vote on another."""
+    with replica_reads():
+        _export_results(run)
+
+
+def _export_results(run):
+    import openpyxl
+
+    now = timezone.now()
+    total = Vote.objects.count()
+    totals = {
+        row["option_id"]: row
+        for row in Vote.objects.values("option_id").annotate(vote_count=Count("id"), weighted_total=Sum("recorded_weight"))
+    }
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Summary")
+    ws.append(["Survey ID", "Question", "End date/time", "Status", "Option", "Votes", "Weighted total"])
+    surveys = Survey.objects.order_by("-end_date_time").prefetch_related("options")
+    for survey in surveys:
+        status = "Closed" if now >= survey.end_date_time else "Open"
+        end = timezone.localtime(survey.end_date_time).replace(tzinfo=None)
+        for option in survey.options.all():
+            row = totals.get(option.pk, {})
+            ws.append([
+                survey.pk, survey.question_text, end, status, option.option_text,
+                row.get("vote_count", 0), float(row.get("weighted_total") or 0),
+            ])
+    ws = wb.create_sheet("Votes")
+    ws.append(["Survey ID", "Question", "Voter", "Option", "Recorded weight", "Voted at"])
+    votes = Vote.objects.order_by("survey_id", "voter__full_name").values_list(
+        "survey_id", "survey__question_text", "voter__full_name", "option__option_text", "recorded_weight", "created_at",
+    )
+    for i, (survey_id, question, voter_name, option_text, weight, created_at) in enumerate(votes.iterator(chunk_size=2000), 1):
+        ws.append([survey_id, question, voter_name, option_text, float(weight), timezone.localtime(created_at).replace(tzinfo=None)])
+        run.progress(i, total)
+    wb.save(run.artifact_path("results.xlsx"))
+    run.message = f"Exported {len(surveys)} survey(s), {total} vote(s)."
+
+
+@task("import_users", "Users import")
+def import_users(params, run):
+    """
+    Create or update voters from an .xlsx in the export layout
+    (Full Name, EnterPass, Vote Weight, Status). Rows with a known EnterPass update that
+    voter; rows without one create a voter with a generated EnterPass.
+
+    The sheet is read row by row and written in batches of IMPORT_BATCH_SIZE rows, each in
+    its own transaction, looking up only the EnterPass codes of that batch; neither the
+    sheet nor the voter table is loaded into memory. A failing import keeps the batches
+    written before the failure.
+    """
+    import openpyxl
+    from decimal import Decimal, InvalidOperation
+
+    wb = openpyxl.load_workbook(artifact_root() / params["upload"], read_only=True, data_only=True)
+    sheet = wb.active
+    rows = sheet.iter_rows(values_only=True)
+    header = [str(c or "").strip().lower() for c in next(rows, [])]
+    try:
+        name_col = header.index("full name")
+        weight_col = header.index("vote weight")
+    except ValueError:
+        raise ValueError("Header row must contain 'Full Name' and 'Vote Weight'.")
+    pass_col = header.index("enterpass") if "enterpass" in header else None
+    status_col = header.index("status") if "status" in header else None
+    total = max((sheet.max_row or 1) - 1, 0)  # from the sheet's dimensions; may count blank rows
+
+    created, updated, errors, batch = set(), 0, [], []
+    line = 1
+    for line, row in enumerate(rows, 2):
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            updated += _import_voter_batch(batch, created)
+            batch = []
+            run.progress(line - 2, max(total, line - 2))
+        row = list(row) + [None] * len(header)
+        full_name = str(row[name_col] or "").strip()
+        if not full_name:
+            continue
+        try:
+            weight = Decimal(str(row[weight_col])).quantize(Decimal("0.01"))
+        except (InvalidOperation, ValueError):
+            errors.append(f"row {line}: invalid vote weight")
+            continue
+        if weight < 0:
+            errors.append(f"row {line}: negative vote weight")
+            continue
+        is_active = status_col is None or str(row[status_col] or "").strip().lower() != "inactive"
+        code = str(row[pass_col] or "").strip().upper() if pass_col is not None else ""
+        batch.append((full_name, weight, is_active, code))
+    updated += _import_voter_batch(batch, created)
+    run.progress(line - 1, line - 1)
+    run.message = f"Created {len(created)}, updated {updated} user(s)."
+    if errors:
+        run.message += f" Skipped {len(errors)}: " + "; ".join(errors[:20])
+
+
+def _import_voter_batch(batch, created):
+    """
+    Write one batch of (full name, weight, is active, EnterPass) rows; return the number of
+    voters updated. `created` holds the EnterPass codes this import has created so far: a
+    later row repeating one gets a new voter with a generated code, as a row without one.
+    """
+    if not batch:
+        return 0
+    existing = Voter.objects.in_bulk({code for *_, code in batch if code and code not in created}, field_name="enter_pass")
+    to_create, to_update, unnamed = [], {}, []
+    for full_name, weight, is_active, code in batch:
+        if code in existing:
+            voter = existing[code]
+            voter.full_name, voter.vote_weight, voter.is_active = full_name, weight, is_active
+            to_update[code] = voter
+        elif code and code not in created:
+            created.add(code)
+            to_create.append(Voter(full_name=full_name, enter_pass=code, vote_weight=weight, is_active=is_active))
+        else:
+            unnamed.append(Voter(full_name=full_name, vote_weight=weight, is_active=is_active))
+    for voter, code in zip(unnamed, _new_enter_passes(len(unnamed), created)):
+        voter.enter_pass = code
+        created.add(code)
+    to_create += unnamed
+    to_update = list(to_update.values())
+    with transaction.atomic(using=primary_alias()):
+        Voter.objects.bulk_create(to_create, batch_size=500)
+        Voter.objects.bulk_update(to_update, ["full_name", "vote_weight", "is_active"], batch_size=500)
+        search.index_voters(to_create + to_update)
+        coherence.bump(coherence.VOTERS)
+        delegation.refresh(delegation.involved(v.pk for v in to_update))  # weights or status may have changed
+    return len(to_update)
+
+
+def _new_enter_passes(count, reserved):
+    """`count` random EnterPass codes that no voter has and that are not in `reserved`."""
+    from django.utils.crypto import get_random_string
+
+    codes = set()
+    for _ in range(100):
+        if len(codes) == count:
+            break
+        candidates = {get_random_string(4, ENTER_PASS_CHARS) for _ in range(count - len(codes))} - reserved - codes
+        codes |= candidates - set(Voter.objects.filter(enter_pass__in=candidates).values_list("enter_pass", flat=True))
+    if len(codes) < count:
+        raise ValueError("Could not generate unique EnterPass")
+    return list(codes)
+
+
+@task("delete_records", "Deletion")
+def delete_records(params, run):
+    """Chunked deletion of voters or surveys and their votes (see core/deletion.py)."""
+    from core import deletion
+
+    deleted, votes = deletion.delete(params["kind"], params["ids"], progress=run.progress)
+    run.message = f"Deleted {deleted} {params['kind']} and {votes} vote(s)."
+
+
+@task("import_paper_votes", "Paper votes import")
+def import_paper_votes(params, run):
+    """Validate and insert paper ballots (see core/paper_votes.py); the artifact is the per-row report."""
+    from core import paper_votes
+
+    rows = paper_votes.read_rows(artifact_root() / params["upload"])
+    report, accepted = paper_votes.ingest(rows, allow_closed=params.get("allow_closed", False), progress=run.progress)
+    paper_votes.write_report(report, run.artifact_path("paper-votes-report.xlsx"))
+    run.message = f"Recorded {accepted} of {len(report)} paper vote(s); rejected {len(report) - accepted}."
@@ -0,0 +1,235 @@
+"""
+Minimal asyncio HTTP/1.1 client and latency recorder for driving a running server.
+
+Used by `python manage.py vote_storm`. Only the standard library is needed: each simulated
+user is an `HttpSession` (one keep-alive connection plus a cookie jar), and every request
+is recorded per endpoint with its outcome class so the report can show throughput,
+errors and p50/p95/p99 latency.
+"""
+import asyncio
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+CSRF_INPUT_RE = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+TOKEN_FIELD = "submission_token"  # core.idempotency.FIELD: one-time token of each vote form
+
+
+class HttpError(Exception):
+    """Transport-level failure (connection refused/reset, malformed response)."""
+
+
+class HttpSession:
+    """One client: a keep-alive connection to `base_url` and the cookies it was given."""
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme != "http":
+            raise ValueError("Only http:// URLs are supported.")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._reader = self._writer = None
+
+    async def request(self, method, path, data=None, headers=None):
+        """Send one request; return (status, headers dict with lower-case names, body)."""
+        body = urlencode(data).encode() if data is not None else b""
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host_header}",
+            "Connection: keep-alive",
+            f"Content-Length: {len(body)}",
+        ]
+        if data is not None:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        lines.extend(f"{k}: {v}" for k, v in (headers or {}).items())
+        raw = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+        for attempt in (1, 2):
+            fresh = self._writer is None
+            try:
+                if fresh:
+                    self._reader, self._writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), self.timeout,
+                    )
+                self._writer.write(raw)
+                await self._writer.drain()
+                return await asyncio.wait_for(self._read_response(), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError, HttpError) as exc:
+                await self.close()
+                if fresh or attempt == 2:  # only retry a reused keep-alive connection the server dropped
+                    raise HttpError(f"{type(exc).__name__}: {exc}") from exc
+            except asyncio.TimeoutError:
+                await self.close()
+                raise
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise HttpError("connection closed")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HttpError(f"bad status line {status_line[:80]!r}")
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                cookie = SimpleCookie()
+                cookie.load(value)
+                for key, morsel in cookie.items():
+                    if morsel.value and morsel["max-age"] != "0":
+                        self.cookies[key] = morsel.value
+                    else:
+                        self.cookies.pop(key, None)
+            headers[name] = value
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await self._reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self._reader.read()
+            await self.close()
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, headers, body
+
+
+def csrf_token(body):
+    """The CSRF form token in an HTML page, or None."""
+    match = CSRF_INPUT_RE.search(body)
+    return match.group(1).decode() if match else None
+
+
+def vote_token(body, action):
+    """The one-time submission token of the form posting to `action` in an HTML page, or None."""
+    match = re.search(
+        rb'action="' + re.escape(action.encode()) + rb'"(?:(?!</form>).)*?name="' + TOKEN_FIELD.encode() + rb'" value="([^"]+)"',
+        body, re.S,
+    )
+    return match.group(1).decode() if match else None
+
+
+def vote_form(option_ids, rng, ranked=False):
+    """Fields of a random vote: `option`, or `rank_1`..`rank_N` (a random ranking) for a ranked survey."""
+    if not ranked:
+        return {"option": rng.choice(option_ids)}
+    ranking = rng.sample(option_ids, rng.randint(1, len(option_ids)))
+    return {f"rank_{rank}": option_id for rank, option_id in enumerate(ranking, 1)}
+
+
+def classify(status, body=b""):
+    """Outcome class of one response: ok, redirect, db_locked, server_error, csrf, ..."""
+    if status < 300:
+        return "ok"
+    if status < 400:
+        return "redirect"
+    if status == 403 and b"CSRF" in body:
+        return "csrf"
+    if status >= 500:
+        return "db_locked" if b"database is locked" in body or b"could not serialize" in body else "server_error"
+    return f"http_{status}"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    """Latency and outcome of every request, grouped by endpoint label."""
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> [seconds]
+        self.outcomes = {}  # (endpoint, outcome) -> count
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, endpoint, seconds, outcome):
+        self.samples.setdefault(endpoint, []).append(seconds)
+        key = (endpoint, outcome)
+        self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    async def timed(self, endpoint, session, method, path, data=None, expect=None):
+        """
+        Issue a request through `session` and record it. Returns (status, headers, body), or
+        None on failure; a non-error status outside `expect` (if given) counts as
+        `unexpected_<status>`, e.g. a login form re-rendered instead of redirecting.
+        """
+        start = time.perf_counter()
+        try:
+            status, headers, body = await session.request(method, path, data)
+        except asyncio.TimeoutError:
+            self.record(endpoint, time.perf_counter() - start, "timeout")
+            return None
+        except (HttpError, OSError):
+            self.record(endpoint, time.perf_counter() - start, "connection_error")
+            return None
+        outcome = classify(status, body)
+        if expect and outcome in ("ok", "redirect") and status not in expect:
+            outcome = f"unexpected_{status}"
+        self.record(endpoint, time.perf_counter() - start, outcome)
+        return (status, headers, body) if outcome in ("ok", "redirect") else None
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report_rows(self):
+        """One row per endpoint: name, requests, req/s, p50/p95/p99/max in ms, outcome counts."""
+        rows = []
+        for endpoint, values in self.samples.items():
+            values = sorted(values)
+            outcomes = {o: n for (e, o), n in sorted(self.outcomes.items()) if e == endpoint}
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(values),
+                "rate": len(values) / self.elapsed if self.elapsed else 0.0,
+                "p50": percentile(values, 50) * 1000,
+                "p95": percentile(values, 95) * 1000,
+                "p99": percentile(values, 99) * 1000,
+                "max": values[-1] * 1000,
+                "outcomes": outcomes,
+            })
+        return rows
+
+    def format_report(self):
+        lines = [f"{'Endpoint':<28}{'Requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  Outcomes"]
+        for row in self.report_rows():
+            outcomes = ", ".join(f"{o} {n}" for o, n in row["outcomes"].items())
+            lines.append(
+                f"{row['endpoint']:<28}{row['requests']:>9}{row['rate']:>8.1f}{row['p50']:>9.1f}"
+                f"{row['p95']:>9.1f}{row['p99']:>9.1f}{row['max']:>9.1f}  {outcomes}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,87 @@
+"""
+Time admin search queries against synthetic data.
+
+    python manage.py bench_search                     # 100k voters, 2k surveys
+    python manage.py bench_search --voters 20000 --budget-ms 20
+
+Synthetic voters and surveys are bulk-inserted and indexed in a transaction that is rolled
+back, so the database is left unchanged. Each query (full words, short prefixes, EnterPass
+codes, survey words, with and without a kind filter) runs --repeat times; the command fails
+when a query's median time exceeds --budget-ms.
+"""
+import statistics
+import time
+from datetime import timedelta
+from itertools import product
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core import search
+from core.db_routers import primary_alias
+from core.models import Option, Survey, Voter
+
+FIRST = ["Anna", "Bruno", "Carla", "Dmitri", "Elena", "Farid", "Greta", "Hugo", "Ines", "Jonas"]
+LAST = ["Novak", "Berger", "Costa", "Ivanova", "Larsen", "Moreau", "Okafor", "Rossi", "Schmidt", "Tanaka"]
+TOPICS = ["budget", "canteen", "parking", "holiday", "election", "statute", "garden", "library"]
+
+
+class Command(BaseCommand):
+    help = "Time ranked, paginated admin search queries on synthetic voters and surveys (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--voters", type=int, default=100000, help="Synthetic voters to add.")
+        parser.add_argument("--surveys", type=int, default=2000, help="Synthetic surveys (3 options each) to add.")
+        parser.add_argument("--repeat", type=int, default=20, help="Runs per query.")
+        parser.add_argument("--budget-ms", type=float, default=50.0, help="Fail when a query's median exceeds this.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=primary_alias()):
+            code = self._add_synthetic(options["voters"], options["surveys"])
+            queries = [
+                ("name", "Elena Larsen", None), ("prefix", "el la", None), ("short prefix", "gr", None),
+                ("voters only", "hugo", search.VOTER), ("EnterPass", code, search.VOTER),
+                ("survey words", "canteen budget", search.SURVEY), ("page 5", "anna", None, 5),
+            ]
+            rows = [(label, self._time(query, options["repeat"])) for label, *query in queries]
+            transaction.set_rollback(True)
+        self.stdout.write(f"{'Query':<16}{'hits':>6}{'median ms':>12}{'max ms':>10}")
+        slow = []
+        for label, (hits, median, worst) in rows:
+            self.stdout.write(f"{label:<16}{hits:>6}{median:>12.2f}{worst:>10.2f}")
+            if median > options["budget_ms"]:
+                slow.append(label)
+        if slow:
+            raise CommandError(f"Over the {options['budget_ms']:g} ms budget: " + ", ".join(slow))
+
+    @staticmethod
+    def _time(query, repeat):
+        text, kind, *page = query
+        samples = []
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            hits, _ = search.search(text, kind=kind, page=page[0] if page else 1)
+            samples.append((time.perf_counter() - start) * 1000)
+        return len(hits), statistics.median(samples), max(samples)
+
+    @staticmethod
+    def _add_synthetic(voter_count, survey_count):
+        """Insert and index the synthetic rows; return one of the new EnterPass codes."""
+        alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+        used = set(Voter.objects.values_list("enter_pass", flat=True))
+        codes = (c for c in ("".join(p) for p in product(alphabet, repeat=4)) if c not in used)
+        voters = [
+            Voter(full_name=f"{FIRST[i % 10]} {LAST[i // 10 % 10]} {i}", enter_pass=next(codes), vote_weight=1)
+            for i in range(voter_count)
+        ]
+        voters = Voter.objects.bulk_create(voters, batch_size=1000)
+        end = timezone.now() - timedelta(days=1)
+        surveys = Survey.objects.bulk_create([
+            Survey(question_text=f"Approve the {TOPICS[i % 8]} and {TOPICS[i // 8 % 8]} plan no. {i}?", end_date_time=end)
+            for i in range(survey_count)
+        ], batch_size=1000)
+        Option.objects.bulk_create(
+            [Option(survey=s, option_text=text) for s in surveys for text in ("Yes", "No", "Abstain")], batch_size=1000,
+        )
+        search.index_voters(voters)
+        search.index_surveys(surveys)
+        return voters[len(voters) // 2].enter_pass if voters else "AAAA"
@@ -0,0 +1,47 @@
+"""
+Measure cold start: `django.setup()` via wsgi.py/asgi.py plus the first request, in fresh
+interpreters, compared against the recorded budget in core.startup_bench. Runs against a
+freshly migrated scratch database and exits with an error when a median exceeds the budget.
+
+    python manage.py bench_startup
+    python manage.py bench_startup --runs 10 --entry asgi --path /surveys/
+"""
+import statistics
+from django.core.management.base import BaseCommand, CommandError
+from core.startup_bench import STARTUP_BUDGET, measure, over_budget, temporary_database
+
+
+class Command(BaseCommand):
+    help = "Benchmark cold django.setup() and first-request latency for the WSGI/ASGI entry points."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Cold starts per entry point (median is reported).")
+        parser.add_argument("--entry", choices=["wsgi", "asgi", "both"], default="both")
+        parser.add_argument("--path", default="/login/", help="Path of the first request.")
+
+    def handle(self, *args, **options):
+        entries = ["wsgi", "asgi"] if options["entry"] == "both" else [options["entry"]]
+        with temporary_database() as database:
+            failed = self._bench(entries, options, database)
+        if failed:
+            raise CommandError("Cold start exceeds the budget.")
+        self.stdout.write(self.style.SUCCESS("Within budget."))
+
+    def _bench(self, entries, options, database):
+        failed = False
+        for entry in entries:
+            samples = [measure(entry, options["path"], database) for _ in range(options["runs"])]
+            setup = statistics.median(s["setup_seconds"] for s in samples)
+            first = statistics.median(s["first_request_seconds"] for s in samples)
+            modules = max(s["modules"] for s in samples)
+            self.stdout.write(
+                f"{entry}: setup {setup * 1000:.0f} ms, first request {first * 1000:.0f} ms "
+                f"(HTTP {samples[0]['status']}), {modules} modules "
+                f"[budget {STARTUP_BUDGET['setup_seconds'] * 1000:.0f} ms / "
+                f"{STARTUP_BUDGET['first_request_seconds'] * 1000:.0f} ms / {STARTUP_BUDGET['modules']}]"
+            )
+            median = {**samples[0], "setup_seconds": setup, "first_request_seconds": first, "modules": modules}
+            for problem in over_budget(median):
+                failed = True
+                self.stdout.write(self.style.ERROR(f"  {problem}"))
+        return failed
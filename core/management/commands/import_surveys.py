@@ -0,0 +1,33 @@
+"""
+Create surveys in bulk from a JSON, YAML or XLSX definitions file (format: core/survey_import.py).
+
+    python manage.py import_surveys surveys.yaml
+    python manage.py import_surveys surveys.xlsx --dry-run   # validate only
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core import survey_import
+
+
+class Command(BaseCommand):
+    help = "Validate a survey definitions file and create all its surveys and options in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Definitions file (.json, .yaml/.yml or .xlsx).")
+        parser.add_argument("--dry-run", action="store_true", help="Validate the file without creating anything.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            with open(path, "rb") as fh:
+                definitions = survey_import.load(fh, path)
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        except survey_import.ImportErrors as exc:
+            for error in exc.errors:
+                self.stderr.write(error)
+            raise CommandError(f"Nothing imported: {exc}.")
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"{len(definitions)} survey(s) are valid (dry run, nothing created)."))
+            return
+        surveys = survey_import.create_surveys(definitions)
+        self.stdout.write(self.style.SUCCESS(f"Imported {len(surveys)} survey(s)."))
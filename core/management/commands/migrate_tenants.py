@@ -0,0 +1,39 @@
+"""
+Create or update the database of every organization (core.tenancy).
+
+    python manage.py migrate_tenants              # "default" and every organization in TENANTS
+    python manage.py migrate_tenants acme beta    # only these organizations
+
+Runs `migrate --database tenant_<slug>` for each one (the SQLite files go to TENANT_DB_ROOT).
+Staff users belong to one organization; create the first with
+`python manage.py createsuperuser --database tenant_<slug>`.
+"""
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from core import tenancy
+
+
+class Command(BaseCommand):
+    help = "Apply migrations to the database of every organization."
+
+    def add_arguments(self, parser):
+        parser.add_argument("slugs", nargs="*", metavar="SLUG", help="Organizations to migrate (default: all, and the default database).")
+
+    def handle(self, *args, **options):
+        if options["slugs"]:
+            unknown = [slug for slug in options["slugs"] if tenancy.get(slug) is None]
+            if unknown:
+                raise CommandError(f"Unknown organization(s): {', '.join(unknown)}")
+            organizations = [tenancy.get(slug) for slug in options["slugs"]]
+        else:
+            organizations = [tenancy.DEFAULT, *tenancy.organizations()]
+        for org in organizations:
+            database = settings.DATABASES[org.alias]
+            if database["ENGINE"] == "django.db.backends.sqlite3":
+                Path(database["NAME"]).parent.mkdir(parents=True, exist_ok=True)
+            self.stdout.write(f"Migrating {org.slug or 'the default organization'} ({org.alias})")
+            with tenancy.activated(org):
+                call_command("migrate", database=org.alias, interactive=False, verbosity=options["verbosity"], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"{len(organizations)} database(s) up to date."))
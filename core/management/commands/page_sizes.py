@@ -0,0 +1,90 @@
+"""
+Report bytes on the wire for the largest HTML pages, uncompressed and per content encoding.
+
+    python manage.py page_sizes                 # current data
+    python manage.py page_sizes --voters 50000  # add synthetic voters and votes first
+
+Synthetic data and the temporary staff user are created in a transaction that is rolled
+back, so the database is left unchanged.
+"""
+from datetime import timedelta
+from itertools import product
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.db_routers import primary_alias
+from core.middleware import get_brotli
+from core.models import Voter, Survey, Option, Vote
+
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+class Command(BaseCommand):
+    help = "Show response sizes (identity/gzip/br) for the user list, survey votes, results and survey list pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--voters", type=int, default=0, help="Synthetic voters (each voting on one closed survey) to add before measuring.")
+
+    def handle(self, *args, **options):
+        encodings = ENCODINGS if get_brotli() else ENCODINGS[:2]
+        with override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic(using=primary_alias()):
+            if options["voters"]:
+                self._add_synthetic(options["voters"])
+            rows = self._measure(encodings)
+            transaction.set_rollback(True)
+        self.stdout.write(f"{'Page':<24}" + "".join(f"{e:>12}" for e in encodings))
+        for name, sizes in rows:
+            self.stdout.write(f"{name:<24}" + "".join(f"{sizes[e]:>12,}" for e in encodings))
+        if "br" not in encodings:
+            self.stdout.write("(install 'brotli' to enable br)")
+
+    def _measure(self, encodings):
+        staff = User.objects.create(username="__page_sizes__", is_staff=True)
+        admin = Client()
+        admin.force_login(staff)
+        voter_client = Client()
+        voter = Voter.objects.filter(is_active=True).first()
+        if voter:
+            session = voter_client.session
+            session["voter_id"] = voter.pk
+            session.save()
+        busiest = Survey.objects.annotate(n=Count("votes")).order_by("-n").first()
+        busiest_closed = Survey.objects.filter(end_date_time__lte=timezone.now()).annotate(n=Count("votes")).order_by("-n").first()
+        pages = [("admin_user_list", admin, reverse("core:admin_user_list"))]
+        if busiest:
+            pages.append(("admin_survey_votes", admin, reverse("core:admin_survey_votes", args=[busiest.pk])))
+        if voter:
+            pages.append(("survey_list", voter_client, reverse("core:survey_list")))
+            if busiest_closed:
+                pages.append(("results_detail", voter_client, reverse("core:results_detail", args=[busiest_closed.pk])))
+        rows = []
+        for name, client, url in pages:
+            sizes = {}
+            for encoding in encodings:
+                response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                body = b"".join(response.streaming_content) if response.streaming else response.content
+                sizes[encoding] = len(body)
+            rows.append((name, sizes))
+        return rows
+
+    def _add_synthetic(self, count):
+        alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+        used = set(Voter.objects.values_list("enter_pass", flat=True))
+        codes = ("".join(p) for p in product(alphabet, repeat=4))
+        voters = []
+        for i, code in enumerate(c for c in codes if c not in used):
+            if i >= count:
+                break
+            voters.append(Voter(full_name=f"Synthetic Voter {i:06d}", enter_pass=code, vote_weight=1 + i % 3))
+        voters = Voter.objects.bulk_create(voters, batch_size=1000)
+        survey = Survey.objects.create(question_text="Synthetic survey for page size report", end_date_time=timezone.now() - timedelta(minutes=1))
+        options = Option.objects.bulk_create([Option(survey=survey, option_text=f"Option {n}") for n in range(1, 5)])
+        Vote.objects.bulk_create(
+            [Vote(survey=survey, voter=v, option=options[i % len(options)], recorded_weight=v.vote_weight) for i, v in enumerate(voters)],
+            batch_size=1000,
+        )
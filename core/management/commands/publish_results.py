@@ -0,0 +1,25 @@
+"""
+Render static results pages for all closed surveys (see core/publishing.py).
+
+    python manage.py publish_results           # (re)render every closed, published survey and the index
+    python manage.py publish_results --clean   # also delete trees left from an old SECRET_KEY
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core import publishing
+
+
+class Command(BaseCommand):
+    help = "Write static HTML results pages for closed surveys and the results index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clean", action="store_true", help="Remove published trees that no longer match SECRET_KEY or a served organization.")
+
+    def handle(self, *args, **options):
+        if not settings.RESULTS_PUBLISH_ENABLED:
+            raise CommandError("RESULTS_PUBLISH_ENABLED is False.")
+        count = publishing.publish_all()
+        self.stdout.write(self.style.SUCCESS(f"Published {count} results page(s) to {publishing.publish_root()}."))
+        if options["clean"]:
+            removed = publishing.remove_stale_trees()
+            self.stdout.write(f"Removed {removed} stale tree(s).")
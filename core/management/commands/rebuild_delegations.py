@@ -0,0 +1,11 @@
+"""Recompute every precomputed effective weight from the delegation records."""
+from django.core.management.base import BaseCommand
+from core import delegation
+
+
+class Command(BaseCommand):
+    help = "Recompute the effective vote weights of all delegations (proxy voting)."
+
+    def handle(self, *args, **options):
+        written = delegation.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Effective weights rebuilt ({written} row(s))."))
@@ -0,0 +1,11 @@
+"""Recompute every voter's participation summary from the votes."""
+from django.core.management.base import BaseCommand
+from core import participation
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-voter participation summaries (votes cast, weight, last vote)."
+
+    def handle(self, *args, **options):
+        written = participation.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Participation rebuilt ({written} voter(s) with votes)."))
@@ -0,0 +1,14 @@
+"""Rebuild the full-text search index from the voter, survey and option tables."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core import search
+from core.db_routers import primary_alias
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index (voters and surveys)."
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=primary_alias()):
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,245 @@
+"""
+Replay recorded production traffic (core/traffic.py) against a running server.
+
+    python manage.py replay_traffic var/traffic --output before.json          # build A
+    python manage.py replay_traffic var/traffic --speed 10 --baseline before.json  # build B
+
+Every recorded identity becomes one simulated client with its own keep-alive connection and
+cookies; its requests are issued in recorded order at their recorded offsets divided by
+--speed (0: as fast as possible), with at most --concurrency requests in flight. Voter
+identities are mapped onto active voters of the target database, and vote choices are drawn
+from --seed, so two runs against copies of the same seeded database send the same requests.
+Staff requests are skipped (they need a password). Requests recorded under /o/<slug>/
+(core.tenancy) are replayed there, with voters, surveys and options of that organization's
+database. Votes are real: replay against a copy.
+"""
+import asyncio
+import json
+import random
+import secrets
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve, reverse
+from core import tenancy, traffic
+from core.loadtest import TOKEN_FIELD, HttpSession, Recorder, vote_form
+from core.models import Option, Survey, Voter
+
+INVALID_ENTER_PASS = "----"  # recorded failed logins stay failed
+
+
+class Command(BaseCommand):
+    help = "Replay a recorded traffic trace against a running server and compare latency with a baseline run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace", nargs="+", help="Trace files (.jsonl, .jsonl.gz) or directories of them.")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Server to replay against (default: %(default)s).")
+        parser.add_argument("--speed", type=float, default=1.0, help="Time compression: 1 = as recorded, 10 = ten times faster, 0 = no pauses.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Maximum requests in flight at once.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the voter mapping and vote choices.")
+        parser.add_argument("--output", help="Write the latency report as JSON (the --baseline of a later run).")
+        parser.add_argument("--baseline", help="JSON report of an earlier run to compare with.")
+        parser.add_argument("--threshold", type=float, default=10.0, help="p95 increase in %% reported as a regression.")
+        parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error when any endpoint regressed.")
+
+    def handle(self, *args, **options):
+        records = traffic.read_trace(options["trace"])
+        if not records:
+            raise CommandError("The trace is empty.")
+        baseline = self._load_baseline(options["baseline"]) if options["baseline"] else None
+        flows, skipped = {}, 0
+        for record in records:
+            if record["id"].startswith(traffic.STAFF + ":"):
+                skipped += 1
+            else:
+                flows.setdefault(record["id"] or f"anonymous-{len(flows)}", []).append(record)
+        self.codes, self.options, self.questions, self.ranked = {}, {}, {}, set()
+        for slug, group in self._by_organization(flows).items():
+            with tenancy.activated(slug):
+                codes = self._map_voters(group, options["seed"])
+                choices, questions, ranked = self._choices([record for flow in group.values() for record in flow])
+            self.codes.update({(slug, identity): code for identity, code in codes.items()})
+            self.options.update({(slug, pk): ids for pk, ids in choices.items()})
+            self.questions.update({(slug, pk): ids for pk, ids in questions.items()})
+            self.ranked.update((slug, pk) for pk in ranked)
+
+        span = records[-1]["t"] - records[0]["t"]
+        self.stdout.write(
+            f"Replaying {len(records) - skipped} request(s) from {len(flows)} client(s), recorded over {span:.0f} s, "
+            f"at {options['speed']:g}x against {options['base_url']}" + (f"; skipped {skipped} staff request(s)" if skipped else "")
+        )
+        recorder = Recorder()
+        asyncio.run(self._replay(flows, records[0]["t"], recorder, options))
+        recorder.stop()
+        self.stdout.write("")
+        self.stdout.write(recorder.format_report())
+        self.stdout.write(f"\nElapsed {recorder.elapsed:.1f} s")
+
+        rows = recorder.report_rows()
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump({"speed": options["speed"], "seed": options["seed"], "elapsed": recorder.elapsed, "endpoints": rows}, fh, indent=1)
+            self.stdout.write(f"Report written to {options['output']}")
+        if baseline is not None:
+            regressions = self._compare(baseline, rows, options["threshold"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} endpoint(s) regressed: " + ", ".join(regressions))
+
+    def _load_baseline(self, path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return {row["endpoint"]: row for row in json.load(fh)["endpoints"]}
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
+
+    def _by_organization(self, flows):
+        """Split {identity: records} by the organization of each record's path: {slug: {identity: records}}."""
+        groups = {}
+        for identity, flow in flows.items():
+            for record in flow:
+                groups.setdefault(self._split(record["p"])[0], {}).setdefault(identity, []).append(record)
+        for slug in groups:
+            if slug and tenancy.get(slug) is None:
+                raise CommandError(f"The trace has requests for organization \"{slug}\", which is not in TENANTS.")
+        return groups
+
+    def _map_voters(self, flows, seed):
+        """Recorded voter identity -> EnterPass of an active voter (of the current organization), the same for every run."""
+        identities = sorted(i for i in flows if i.startswith(traffic.VOTER + ":"))
+        random.Random(seed).shuffle(identities)
+        codes = list(Voter.objects.filter(is_active=True).order_by("pk").values_list("enter_pass", flat=True))
+        if identities and not codes:
+            raise CommandError("The target database has no active voters.")
+        if len(codes) < len(identities):
+            self.stdout.write(self.style.WARNING(f"Only {len(codes)} active voter(s) for {len(identities)} recorded voter(s); some are shared."))
+        return {identity: codes[i % len(codes)] for i, identity in enumerate(identities)}
+
+    def _choices(self, records):
+        """Option ids per survey, question ids per ballot and the ranked surveys, for the vote POSTs in the trace."""
+        surveys, ballots = set(), set()
+        for record in records:
+            if record["m"] == "POST" and record["v"] in ("core:survey_vote", "core:ballot_vote"):
+                pk = self._pk(record["p"])
+                (surveys if record["v"] == "core:survey_vote" else ballots).add(pk)
+        questions = {}
+        for pk, ballot_id in Survey.objects.filter(ballot_id__in=ballots).order_by("position", "pk").values_list("pk", "ballot_id"):
+            questions.setdefault(ballot_id, []).append(pk)
+            surveys.add(pk)
+        options = {}
+        for pk, survey_id in Option.objects.filter(survey_id__in=surveys).order_by("pk").values_list("pk", "survey_id"):
+            options.setdefault(survey_id, []).append(pk)
+        ranked = set(Survey.objects.filter(pk__in=surveys, kind=Survey.RANKED).values_list("pk", flat=True))
+        return options, questions, ranked
+
+    @staticmethod
+    def _split(path):
+        """(organization slug or "", path inside it) of a recorded path."""
+        marker = f"/{settings.TENANT_PATH_PREFIX}/"
+        if not path.startswith(marker):
+            return "", path
+        slug, _, rest = path[len(marker):].partition("/")
+        return slug, "/" + rest
+
+    @classmethod
+    def _pk(cls, path):
+        try:
+            return resolve(cls._split(path)[1]).kwargs.get("pk")
+        except Resolver404:
+            return None
+
+    @classmethod
+    def _local(cls, path, name):
+        """URL of `name` in the organization of a recorded path."""
+        slug = cls._split(path)[0]
+        return (f"/{settings.TENANT_PATH_PREFIX}/{slug}" if slug else "") + reverse(name)
+
+    async def _replay(self, flows, t0, recorder, options):
+        limit = asyncio.Semaphore(max(1, options["concurrency"]))
+        started = time.perf_counter()
+
+        async def run(identity, flow):
+            rng = random.Random(f"{options['seed']}:{identity}")
+            session = HttpSession(options["base_url"], options["timeout"])
+            state = {"logged_in": set(), "tokens": {}}  # organizations (slugs) logged in to; vote form tokens by path
+            try:
+                for record in flow:
+                    if options["speed"] > 0:
+                        delay = started + (record["t"] - t0) / options["speed"] - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    async with limit:
+                        await self._request(session, recorder, identity, record, rng, state)
+            finally:
+                await session.close()
+
+        await asyncio.gather(*(run(identity, flow) for identity, flow in flows.items()))
+
+    async def _request(self, session, recorder, identity, record, rng, state):
+        method, path, view = record["m"], record["p"], record["v"]
+        slug = self._split(path)[0]
+        code = self.codes.get((slug, identity))
+        is_login = view == "core:login" and method == "POST"
+        if code and slug not in state["logged_in"] and not is_login:
+            await self._login(session, code, self._local(path, "core:login"))  # the recording started mid-session; not timed
+            state["logged_in"].add(slug)
+        data = None
+        if method == "POST":
+            if settings.CSRF_COOKIE_NAME not in session.cookies:
+                await session.request("GET", self._local(path, "core:login"))
+            data = {"csrfmiddlewaretoken": session.cookies.get(settings.CSRF_COOKIE_NAME, "")}
+            data.update(self._form(view, path, code, rng))
+            if view in ("core:survey_vote", "core:ballot_vote"):
+                # A vote form is offered once, so a client posting to the same vote URL again
+                # resubmits that form: same one-time token, replayed by core.idempotency.
+                data[TOKEN_FIELD] = state["tokens"].setdefault(path, secrets.token_hex(16))
+        await recorder.timed(f"{method} {view or path}", session, method, path, data)
+        if is_login:
+            state["logged_in"].discard(slug)
+            if code:
+                state["logged_in"].add(slug)
+        elif view == "core:voter_logout":
+            state["logged_in"].discard(slug)
+
+    def _form(self, view, path, code, rng):
+        if view == "core:login":
+            return {"enter_pass": code or INVALID_ENTER_PASS}
+        slug, pk = self._split(path)[0], self._pk(path)
+        if view == "core:survey_vote" and self.options.get((slug, pk)):
+            return vote_form(self.options[slug, pk], rng, (slug, pk) in self.ranked)
+        if view == "core:ballot_vote":
+            return {
+                f"q{q}": rng.choice(self.options[slug, q])
+                for q in self.questions.get((slug, pk), []) if self.options.get((slug, q))
+            }
+        return {}
+
+    async def _login(self, session, code, login_path):
+        await session.request("GET", login_path)
+        data = {"csrfmiddlewaretoken": session.cookies.get(settings.CSRF_COOKIE_NAME, ""), "enter_pass": code}
+        await session.request("POST", login_path, data)
+
+    def _compare(self, baseline, rows, threshold):
+        """Print p50/p95/p99 against the baseline run; return the endpoints whose p95 regressed."""
+        def change(old, new):
+            return (new - old) / old * 100 if old else 0.0
+
+        self.stdout.write("")
+        self.stdout.write(f"{'Endpoint (baseline -> now)':<28}" + "".join(f"{p + ' ms':>23}" for p in ("p50", "p95", "p99")))
+        regressions = []
+        for row in sorted(rows, key=lambda r: r["endpoint"]):
+            old = baseline.get(row["endpoint"])
+            if old is None:
+                self.stdout.write(f"{row['endpoint']:<28}  (not in baseline)")
+                continue
+            cells = "".join(
+                f"{old[p]:>7.1f} -> {row[p]:>6.1f} {change(old[p], row[p]):>+4.0f}%" for p in ("p50", "p95", "p99")
+            )
+            line = f"{row['endpoint']:<28}{cells}"
+            if change(old["p95"], row["p95"]) > threshold:
+                regressions.append(row["endpoint"])
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+        for endpoint in sorted(set(baseline) - {r["endpoint"] for r in rows}):
+            self.stdout.write(f"{endpoint:<28}  (only in baseline)")
+        return regressions
@@ -0,0 +1,105 @@
+"""
+Run queued background jobs (exports, imports) off the request path.
+
+    python manage.py run_jobs               # keep polling, 2 jobs at a time
+    python manage.py run_jobs --workers 4
+    python manage.py run_jobs --once        # drain the queue and exit (e.g. from cron)
+
+One pool serves the queues of every organization (core.tenancy), taking jobs from them in
+turn; --organization limits it to some. Run a single instance of this command per
+organization; jobs still marked running when it starts are treated as left over from a
+stopped worker and marked failed. Between jobs it also publishes the results pages of
+surveys that have closed (core.publishing, when RESULTS_PUBLISH_ENABLED).
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from core import job_process, jobs, publishing, tenancy
+from core.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS, help="Jobs run concurrently (default: JOB_WORKERS).")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue checks when idle.")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty instead of polling.")
+        parser.add_argument("--organization", action="append", metavar="SLUG", help="Only run jobs of this organization (repeatable; default: all).")
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        organizations = self._organizations(options["organization"])
+        for org in organizations:
+            with tenancy.activated(org):
+                orphaned = jobs.fail_orphaned()
+            if orphaned:
+                self.stdout.write(self.style.WARNING(f"Marked {orphaned} interrupted job(s) of {self._label(org)} as failed."))
+        # Children are spawned fresh and set Django up themselves; don't share connections.
+        connections.close_all()
+        ctx = multiprocessing.get_context("spawn")
+        self.stdout.write(f"Job worker started with {workers} process(es).")
+        running = {}
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=job_process.init_worker) as pool:
+            try:
+                while True:
+                    self._publish_closed(organizations)
+                    idle = 0
+                    while len(running) < workers and idle < len(organizations):
+                        org = organizations[0]
+                        organizations.append(organizations.pop(0))  # take the organizations' queues in turn
+                        with tenancy.activated(org):
+                            job_id = jobs.claim_next()
+                        if job_id is None:
+                            idle += 1
+                            continue
+                        idle = 0
+                        running[pool.submit(job_process.execute, job_id, org.slug)] = (org, job_id)
+                        self.stdout.write(f"  started job #{job_id} of {self._label(org)}")
+                    if not running:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll"])
+                        continue
+                    done, _ = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        org, job_id = running.pop(future)
+                        try:
+                            status = future.result()
+                        except Exception as exc:  # worker process died
+                            status = Job.FAILED
+                            with tenancy.activated(org):
+                                Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+                                    status=Job.FAILED, message=f"Worker error: {exc}", finished_at=timezone.now(),
+                                )
+                        self.stdout.write(f"  job #{job_id} of {self._label(org)} {status}")
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping; running jobs will be marked failed on next start.")
+                pool.shutdown(wait=False, cancel_futures=True)
+                return
+        self.stdout.write(self.style.SUCCESS("Queue empty."))
+
+    def _organizations(self, slugs):
+        if not slugs:
+            return [tenancy.current()] if os.environ.get(tenancy.ENV_VAR) else [tenancy.DEFAULT, *tenancy.organizations()]
+        unknown = [slug for slug in slugs if tenancy.get(slug) is None]
+        if unknown:
+            raise CommandError(f"Unknown organization(s): {', '.join(unknown)}")
+        return [tenancy.get(slug) for slug in slugs]
+
+    def _publish_closed(self, organizations):
+        """Write the results pages of surveys whose end time has passed (core.publishing)."""
+        for org in organizations:
+            with tenancy.activated(org):
+                published = publishing.publish_pending()
+            if published:
+                self.stdout.write(f"  published results of {published} closed survey(s) of {self._label(org)}")
+
+    @staticmethod
+    def _label(org):
+        return org.slug or "the default organization"
@@ -0,0 +1,36 @@
+"""
+Copy the primary SQLite database into the replica stand-in file, for exercising replica
+routing locally:
+
+    QUESTIONNAIRE_REPLICA_DB=replica.sqlite3 python manage.py sync_replica
+    QUESTIONNAIRE_REPLICA_DB=replica.sqlite3 python manage.py runserver
+
+Re-run it to simulate replication catching up. With QUESTIONNAIRE_TENANT set, it copies
+that organization's database to its "replica" file (core.tenancy). Real deployments replicate with the
+database server instead.
+"""
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.db_routers import primary_alias, replica_alias
+
+
+class Command(BaseCommand):
+    help = "Snapshot the primary SQLite database into the local replica stand-in."
+
+    def handle(self, *args, **options):
+        primary = primary_alias()
+        alias = replica_alias(primary)
+        if alias is None:
+            raise CommandError(f"No replica configured for {primary}; set QUESTIONNAIRE_REPLICA_DB (or the organization's \"replica\").")
+        databases = settings.DATABASES
+        if not all(databases[a]["ENGINE"] == "django.db.backends.sqlite3" for a in (primary, alias)):
+            raise CommandError("sync_replica only copies SQLite databases.")
+        source = sqlite3.connect(databases[primary]["NAME"])
+        target = sqlite3.connect(databases[alias]["NAME"])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied {databases[primary]['NAME']} to {databases[alias]['NAME']}."))
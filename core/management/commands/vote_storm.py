@@ -0,0 +1,127 @@
+"""
+Simulate a close-time vote storm against a running server.
+
+    python manage.py vote_storm                                  # newest open survey, all voters who have not voted
+    python manage.py vote_storm --survey 12 --voters 2000 --rate 100 --concurrency 200
+    python manage.py vote_storm --base-url http://127.0.0.1:8000 --double-submit 0.05
+
+Each simulated voter logs in with their EnterPass, loads the survey list and POSTs a vote
+for a random option (a random ranking on ranked surveys), on its own keep-alive connection
+and CSRF/session cookies. Voters arrive as a Poisson process at `--rate` per second with at
+most `--concurrency` in flight. Like a browser, a voter sends the vote form's one-time
+submission token, so a `--double-submit` repeats the same form and gets the first outcome
+replayed. The votes are real: run it against a test or staging database.
+"""
+import asyncio
+import random
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from core.loadtest import TOKEN_FIELD, HttpSession, Recorder, csrf_token, vote_form, vote_token
+from core.models import Survey, Vote, Voter
+
+
+class Command(BaseCommand):
+    help = "Drive login -> survey list -> vote for many voters against a running server and report latency and errors."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Server to load (default: %(default)s).")
+        parser.add_argument("--survey", type=int, help="Survey id (default: the open published survey closing soonest).")
+        parser.add_argument("--voters", type=int, help="Number of voters (default: every active voter who has not voted on it).")
+        parser.add_argument("--include-voted", action="store_true", help="Also use voters who already voted (their POSTs are duplicates).")
+        parser.add_argument("--rate", type=float, default=50.0, help="Mean voter arrivals per second (Poisson).")
+        parser.add_argument("--concurrency", type=int, default=100, help="Maximum voters in flight at once.")
+        parser.add_argument("--double-submit", type=float, default=0.0, help="Fraction of voters that POST their vote twice.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--seed", type=int, help="Random seed for arrivals and choices.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        survey = self._survey(options["survey"])
+        option_ids = list(survey.options.values_list("pk", flat=True))
+        voters = Voter.objects.filter(is_active=True).order_by("pk")
+        if not options["include_voted"]:
+            voters = voters.exclude(votes__survey=survey)
+        codes = list(voters.values_list("enter_pass", flat=True)[:options["voters"]])
+        if not codes or not option_ids:
+            raise CommandError("No eligible voters or no options on this survey.")
+        rng.shuffle(codes)
+        plans = [(code, vote_form(option_ids, rng, survey.is_ranked), rng.random() < options["double_submit"]) for code in codes]
+        votes_before = Vote.objects.filter(survey=survey).count()
+
+        self.stdout.write(
+            f"Survey {survey.pk} \"{survey.question_text[:60]}\": {len(plans)} voter(s) at "
+            f"{options['rate']:g}/s, concurrency {options['concurrency']}, against {options['base_url']}"
+        )
+        recorder = Recorder()
+        flows = asyncio.run(self._storm(survey, plans, recorder, rng, options))
+        recorder.stop()
+        new_votes = Vote.objects.filter(survey=survey).count() - votes_before
+
+        self.stdout.write("")
+        self.stdout.write(recorder.format_report())
+        self.stdout.write("")
+        completed = flows.get("voted", 0)
+        accepted = sum(n for (e, o), n in recorder.outcomes.items() if e.startswith("POST /surveys/") and o == "redirect")
+        self.stdout.write(f"Elapsed {recorder.elapsed:.1f} s; voter flows: " + ", ".join(f"{k} {v}" for k, v in sorted(flows.items())))
+        self.stdout.write(f"Throughput {completed / recorder.elapsed:.1f} completed voters/s, {new_votes / recorder.elapsed:.1f} votes stored/s")
+        self.stdout.write(f"Vote POSTs accepted {accepted}, votes stored {new_votes}, duplicates ignored {accepted - new_votes}")
+        errors = {o: n for (e, o), n in recorder.outcomes.items() if o not in ("ok", "redirect")}
+        if errors:
+            self.stdout.write(self.style.WARNING("Errors: " + ", ".join(f"{o} {n}" for o, n in sorted(errors.items()))))
+
+    def _survey(self, pk):
+        now = timezone.now()
+        if pk is not None:
+            survey = Survey.objects.filter(pk=pk).first()
+            if survey is None:
+                raise CommandError(f"Survey {pk} does not exist.")
+        else:
+            survey = Survey.objects.filter(is_published=True, end_date_time__gt=now, ballot__isnull=True).order_by("end_date_time").first()
+            if survey is None:
+                raise CommandError("No open published survey; pass --survey or publish one.")
+        if survey.ballot_id is not None:
+            raise CommandError(f"Survey {survey.pk} is a ballot question; ballots are voted as a whole.")
+        if not survey.is_published or survey.end_date_time <= now:
+            raise CommandError(f"Survey {survey.pk} is not open for voting.")
+        return survey
+
+    async def _storm(self, survey, plans, recorder, rng, options):
+        """Start one voter flow per plan at Poisson arrival times; return flow outcome counts."""
+        flows = {}
+        limit = asyncio.Semaphore(max(1, options["concurrency"]))
+        vote_path = reverse("core:survey_vote", args=[survey.pk])
+
+        async def run(plan):
+            async with limit:
+                session = HttpSession(options["base_url"], options["timeout"])
+                try:
+                    outcome = await self._voter_flow(session, recorder, vote_path, *plan)
+                finally:
+                    await session.close()
+            flows[outcome] = flows.get(outcome, 0) + 1
+
+        tasks = []
+        for plan in plans:
+            tasks.append(asyncio.create_task(run(plan)))
+            await asyncio.sleep(rng.expovariate(options["rate"]))
+        await asyncio.gather(*tasks)
+        return flows
+
+    async def _voter_flow(self, session, recorder, vote_path, code, choice, double_submit):
+        login_path, list_path = reverse("core:login"), reverse("core:survey_list")
+        response = await recorder.timed("GET /login/", session, "GET", login_path, expect=(200,))
+        if response is None:
+            return "login_page_failed"
+        data = {"csrfmiddlewaretoken": csrf_token(response[2]) or "", "enter_pass": code}
+        if await recorder.timed("POST /login/", session, "POST", login_path, data, expect=(302,)) is None:
+            return "login_failed"
+        response = await recorder.timed("GET /surveys/", session, "GET", list_path, expect=(200,))
+        if response is None:
+            return "list_failed"
+        # The form's one-time token makes a double submit a replay of the first (core.idempotency).
+        data = {"csrfmiddlewaretoken": csrf_token(response[2]) or "", TOKEN_FIELD: vote_token(response[2], vote_path) or "", **choice}
+        for _ in range(2 if double_submit else 1):
+            if await recorder.timed("POST /surveys/<pk>/vote/", session, "POST", vote_path, data, expect=(302,)) is None:
+                return "vote_failed"
+        return "voted"
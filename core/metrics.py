@@ -0,0 +1,357 @@
+"""
+In-process metrics: counters, gauges and histograms, exposed in the Prometheus text format.
+
+Each process keeps its values in memory (updates take a lock, so threads are safe) and
+`MetricsMiddleware` writes a JSON snapshot to METRICS_ROOT at most every
+METRICS_FLUSH_SECONDS. `/metrics/` merges the snapshots of all worker processes:
+counters and histograms are summed over every file (so totals survive worker restarts),
+gauges only over snapshots written within METRICS_STALE_SECONDS. Snapshots of processes
+that have exited and been silent that long are folded into one `retired.json` aggregate
+and deleted, so recycled workers do not leave files behind for every later scrape.
+
+Every value carries an `organization` label (core.tenancy): the slug of the organization
+the update was made for, or "default".
+
+Define metrics at module level with `counter()`, `gauge()` and `histogram()`:
+
+    votes = counter("qm_votes_total", "Votes submitted, by outcome.", ["kind", "result"])
+    votes.inc(kind="survey", result="recorded")
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from core import tenancy
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_metrics = {}  # name -> metric, in definition order
+_state = {"pid": None, "token": None, "flushed": 0.0}
+RETIRED = "retired"  # snapshot name of the sums of exited processes
+ORGANIZATION_LABEL = "organization"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return (tenancy.current().slug or "default",) + tuple(str(labels[n]) for n in self.labelnames)
+
+    def _update(self, labels, func):
+        key = self._key(labels)
+        with _lock:
+            _check_fork()
+            self.values[key] = func(self.values.get(key))
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda v: (v or 0) + amount)
+
+
+class Gauge(Metric):
+    """Summed over live processes, e.g. requests in progress."""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._update(labels, lambda v: value)
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda v: (v or 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Value per label set: [count per bucket (the last is +Inf), sum]."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+
+        def add(v):
+            v = v or [[0] * (len(self.buckets) + 1), 0.0]
+            v[0][index] += 1
+            v[1] += value
+            return v
+        self._update(labels, add)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} is already registered differently")
+            return existing
+        _metrics[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return _register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def _check_fork():
+    """A forked child starts from zero under its own snapshot file. Call with _lock held."""
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        if _state["pid"] is not None:
+            for metric in _metrics.values():
+                metric.values.clear()
+        _state.update(pid=pid, token=f"{pid}-{uuid.uuid4().hex[:8]}", flushed=0.0)
+
+
+# ----- Snapshots shared between processes -----
+def metrics_root():
+    return Path(settings.METRICS_ROOT)
+
+
+def flush(force=False):
+    """Write this process's snapshot if METRICS_FLUSH_SECONDS passed since the last one."""
+    now = time.monotonic()
+    with _lock:
+        _check_fork()
+        if not force and now - _state["flushed"] < settings.METRICS_FLUSH_SECONDS:
+            return
+        _state["flushed"] = now
+        snapshot = json.dumps({
+            name: [[list(key), value] for key, value in metric.values.items()]
+            for name, metric in _metrics.items() if metric.values
+        })
+        token = _state["token"]
+    root = metrics_root()
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f".{token}.tmp"
+    tmp.write_text(snapshot)
+    os.replace(tmp, root / f"{token}.json")
+
+
+def _merge_value(metric, current, value):
+    if current is None:
+        return value
+    if isinstance(metric, Histogram):
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+    return current + value
+
+
+def _merge_into(merged, snapshot, gauges=True):
+    for name, samples in snapshot.items():
+        metric = _metrics.get(name)
+        if metric is None or (isinstance(metric, Gauge) and not gauges):
+            continue
+        values = merged.setdefault(name, {})
+        for key, value in samples:
+            key = tuple(key)
+            if len(key) != len(metric.labelnames) + 1:
+                continue  # written with other labels (older version)
+            values[key] = _merge_value(metric, values.get(key), value)
+
+
+def _exited(path):
+    """Whether the process that wrote a snapshot (named <pid>-<random>) is gone."""
+    pid = path.stem.split("-", 1)[0]
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # exists, owned by another user
+    return False
+
+
+def retire(stale_before):
+    """
+    Fold the counters and histograms of snapshots from exited processes, silent since
+    `stale_before`, into the RETIRED snapshot and delete them. Returns how many were folded;
+    skipped (0) while another process is retiring.
+    """
+    import fcntl
+    root = metrics_root()
+    with open(root / ".retire.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        dead = []
+        for path in root.glob("*.json"):
+            try:
+                if path.stem != RETIRED and path.stat().st_mtime < stale_before and _exited(path):
+                    dead.append(path)
+            except OSError:
+                continue
+        if not dead:
+            return 0
+        retired_path = root / f"{RETIRED}.json"
+        merged = {}
+        try:
+            _merge_into(merged, json.loads(retired_path.read_text()))
+        except (OSError, ValueError):
+            pass
+        for path in dead:
+            try:
+                _merge_into(merged, json.loads(path.read_text()), gauges=False)
+            except (OSError, ValueError):
+                continue
+        tmp = root / f".{RETIRED}.tmp"
+        tmp.write_text(json.dumps({name: [[list(k), v] for k, v in values.items()] for name, values in merged.items()}))
+        os.replace(tmp, retired_path)
+        for path in dead:
+            path.unlink(missing_ok=True)
+    return len(dead)
+
+
+def collect():
+    """Merged values of every process: {name: {label values: value}}."""
+    flush(force=True)
+    stale_before = time.time() - settings.METRICS_STALE_SECONDS
+    retire(stale_before)
+    merged = {name: {} for name in _metrics}
+    for path in metrics_root().glob("*.json"):
+        try:
+            mtime = path.stat().st_mtime
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # removed or replaced while reading
+        _merge_into(merged, snapshot, gauges=mtime >= stale_before and path.stem != RETIRED)
+    return merged
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    merged = collect()
+    lines = []
+    for name, metric in _metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        labelnames = (ORGANIZATION_LABEL,) + metric.labelnames
+        for key, value in sorted(merged[name].items()):
+            if isinstance(metric, Histogram):
+                buckets, total = value
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labelnames, key, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, key)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labelnames, key)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ----- Application metrics -----
+http_requests = counter("qm_http_requests_total", "HTTP requests by view, method and status.", ["view", "method", "status"])
+http_latency = histogram("qm_http_request_duration_seconds", "Request latency by view.", ["view"])
+http_in_progress = gauge("qm_http_requests_in_progress", "Requests being served.")
+db_time = histogram("qm_db_time_seconds", "Time spent in database queries per request, by view.", ["view"])
+db_queries = counter("qm_db_queries_total", "Database queries by view and alias.", ["view", "alias"])
+votes = counter("qm_votes_total", "Vote submissions by kind (survey/ballot) and result.", ["kind", "result"])
+logins = counter("qm_logins_total", "Voter EnterPass logins by result.", ["result"])
+voter_auth = counter("qm_voter_auth_total", "voter_required checks by result.", ["result"])
+results_build = histogram("qm_results_build_seconds", "Time to aggregate a results page.", ["page"])
+cache_lookups = counter("qm_cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+
+
+def record_cache(cache, hit):
+    """Count one lookup in `cache`; hit ratio = hit / (hit + miss)."""
+    cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+
+
+class MetricsMiddleware:
+    """Per-view request count, latency and DB time; flushes this process's snapshot."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = {}  # alias -> [count, seconds]
+
+        def time_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats = query_stats.setdefault(context["connection"].alias, [0, 0.0])
+                stats[0] += 1
+                stats[1] += time.perf_counter() - start
+
+        http_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            http_in_progress.dec()
+        elapsed = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        http_requests.inc(view=view, method=request.method, status=response.status_code)
+        http_latency.observe(elapsed, view=view)
+        db_time.observe(sum(s[1] for s in query_stats.values()), view=view)
+        for alias, (count, _) in query_stats.items():
+            db_queries.inc(count, view=view, alias=alias)
+        flush()
+        return response
+
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        statements = [
+            "CREATE VIRTUAL TABLE core_search USING fts5("
+            "title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        ]
+        aggregate = "COALESCE(group_concat(o.option_text, ' '), '')"
+    elif connection.vendor == "postgresql":
+        statements = [
+            "CREATE TABLE core_search ("
+            "rowid bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL, "
+            "document tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')"
+            ") STORED)",
+            "CREATE INDEX core_search_document ON core_search USING GIN (document)",
+        ]
+        aggregate = "COALESCE(string_agg(o.option_text, ' '), '')"
+    else:
+        return
+    statements += [
+        "INSERT INTO core_search (rowid, title, body) SELECT id * 2, full_name, enter_pass FROM core_voter",
+        "INSERT INTO core_search (rowid, title, body) "
+        f"SELECT s.id * 2 + 1, s.question_text, {aggregate} "
+        "FROM core_survey s LEFT JOIN core_option o ON o.survey_id = s.id GROUP BY s.id",
+    ]
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS core_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_ballot"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='source',
+            field=models.CharField(choices=[('online', 'Online'), ('paper', 'Paper ballot')], default='online', max_length=10),
+        ),
+    ]
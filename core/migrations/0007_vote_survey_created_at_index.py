@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_vote_source'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['survey', 'created_at'], name='core_vote_survey__7ebd88_idx'),
+        ),
+    ]
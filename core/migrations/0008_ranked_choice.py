@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_vote_survey_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='kind',
+            field=models.CharField(choices=[('single', 'Single choice'), ('ranked', 'Ranked choice (instant runoff)')], default='single', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='ranking',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_ranked_choice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectiveWeight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('delegate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.voter')),
+                ('survey', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.survey')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_weights', to='core.voter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Delegation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delegate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delegations_received', to='core.voter')),
+                ('delegator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delegations_given', to='core.voter')),
+                ('survey', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='delegations', to='core.survey')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='effectiveweight',
+            constraint=models.UniqueConstraint(fields=('voter', 'survey'), name='effective_weight_per_scope'),
+        ),
+        migrations.AddConstraint(
+            model_name='effectiveweight',
+            constraint=models.UniqueConstraint(condition=models.Q(('survey__isnull', True)), fields=('voter',), name='effective_weight_general'),
+        ),
+        migrations.AddConstraint(
+            model_name='delegation',
+            constraint=models.UniqueConstraint(fields=('delegator', 'survey'), name='delegation_one_per_survey'),
+        ),
+        migrations.AddConstraint(
+            model_name='delegation',
+            constraint=models.UniqueConstraint(condition=models.Q(('survey__isnull', True)), fields=('delegator',), name='delegation_one_general'),
+        ),
+        migrations.AddConstraint(
+            model_name='delegation',
+            constraint=models.CheckConstraint(check=models.Q(('delegator', models.F('delegate')), _negated=True), name='delegation_not_self'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_delegation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntityVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_entity_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('summary', models.CharField(max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('ballot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.ballot')),
+                ('survey', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.survey')),
+                ('voter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.voter')),
+            ],
+        ),
+    ]
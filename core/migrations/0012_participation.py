@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_vote_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Participation',
+            fields=[
+                ('voter', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='participation', serialize=False, to='core.voter')),
+                ('votes_cast', models.PositiveIntegerField(default=0)),
+                ('weighted_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_vote_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        # Summaries of the votes already cast (same as `python manage.py rebuild_participation`).
+        migrations.RunSQL(
+            "INSERT INTO core_participation (voter_id, votes_cast, weighted_total, last_vote_at) "
+            "SELECT voter_id, COUNT(*), SUM(recorded_weight), MAX(created_at) FROM core_vote GROUP BY voter_id",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 
@@ -15,12 +16,47 @@ class Voter(models.Model):
         return self.full_name
 
 
+class Ballot(models.Model):
+    """Several surveys (questions) answered together and submitted as one vote."""
+    title = models.CharField(max_length=255)
+    end_date_time = models.DateTimeField(db_index=True)
+    is_published = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-end_date_time"]
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def is_closed(self):
+        from django.utils import timezone
+        return timezone.now() >= self.end_date_time
+
+    def sync_questions(self):
+        """Copy end time and publish flag to the ballot's questions."""
+        from core import coherence, publishing
+        self.questions.update(end_date_time=self.end_date_time, is_published=self.is_published)
+        coherence.bump(coherence.SURVEYS)  # update() sends no signals
+        questions = list(self.questions.values_list("pk", flat=True))
+        if self.is_closed or any(publishing.is_published(pk) for pk in questions):
+            publishing.republish_on_commit(questions)  # closed now, or pages out of date
+
+
 class Survey(models.Model):
-    """A single-question survey with multiple options (single-choice)."""
+    """A single-question survey with multiple options (single-choice or ranked); optionally one question of a Ballot."""
+    SINGLE = "single"
+    RANKED = "ranked"
+    KIND_CHOICES = [(SINGLE, "Single choice"), (RANKED, "Ranked choice (instant runoff)")]
+
     question_text = models.TextField()
     end_date_time = models.DateTimeField(db_index=True)
     is_published = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    ballot = models.ForeignKey(Ballot, null=True, blank=True, on_delete=models.CASCADE, related_name="questions")
+    position = models.PositiveIntegerField(default=0)  # order within the ballot
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=SINGLE)  # ballot questions are single choice
 
     class Meta:
         ordering = ["-end_date_time"]
@@ -33,6 +69,10 @@ class Survey(models.Model):
         from django.utils import timezone
         return timezone.now() >= self.end_date_time
 
+    @property
+    def is_ranked(self):
+        return self.kind == self.RANKED
+
 
 class Option(models.Model):
     """Selectable answer for a survey."""
@@ -48,15 +88,145 @@ class Option(models.Model):
 
 class Vote(models.Model):
     """A voter's selection of one option for a survey; weight recorded at vote time."""
+    ONLINE = "online"
+    PAPER = "paper"
+    SOURCE_CHOICES = [(ONLINE, "Online"), (PAPER, "Paper ballot")]
+
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name="votes")
     voter = models.ForeignKey(Voter, on_delete=models.CASCADE, related_name="votes")
     option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name="votes")
     recorded_weight = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default=ONLINE)  # paper: entered by staff import
+    ranking = models.BinaryField(null=True, blank=True)  # ranked surveys: option ids in preference order (core.ranked)
 
     class Meta:
         unique_together = [["survey", "voter"]]
+        indexes = [models.Index(fields=["survey", "created_at"])]  # turnout timeline
         ordering = ["survey", "voter"]
 
     def __str__(self):
         return f"{self.voter.full_name} -> {self.option.option_text}"
+
+    def ranked_option_ids(self):
+        """Preference order of a ranked vote; [option_id] for single-choice and paper votes."""
+        from core.ranked import decode_ranking
+        return list(decode_ranking(self.ranking)) if self.ranking else [self.option_id]
+
+
+class Participation(models.Model):
+    """
+    Per-voter summary of their votes, updated as votes are cast and removed
+    (core.participation). Voters without a row have not voted.
+    """
+    voter = models.OneToOneField(Voter, primary_key=True, on_delete=models.CASCADE, related_name="participation")
+    votes_cast = models.PositiveIntegerField(default=0)
+    weighted_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # sum of recorded weights
+    last_vote_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.voter_id}: {self.votes_cast} vote(s)"
+
+
+class Delegation(models.Model):
+    """A voter giving their vote to another voter (proxy), for every survey or for one survey."""
+    delegator = models.ForeignKey(Voter, on_delete=models.CASCADE, related_name="delegations_given")
+    delegate = models.ForeignKey(Voter, on_delete=models.CASCADE, related_name="delegations_received")
+    survey = models.ForeignKey(Survey, null=True, blank=True, on_delete=models.CASCADE, related_name="delegations")  # null: all surveys
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        constraints = [
+            models.UniqueConstraint(fields=["delegator", "survey"], name="delegation_one_per_survey"),
+            models.UniqueConstraint(fields=["delegator"], condition=models.Q(survey__isnull=True), name="delegation_one_general"),
+            models.CheckConstraint(check=~models.Q(delegator=models.F("delegate")), name="delegation_not_self"),
+        ]
+
+    def __str__(self):
+        return f"{self.delegator} -> {self.delegate}"
+
+
+class EffectiveWeight(models.Model):
+    """
+    Resolved weight of a voter involved in delegations (core.delegation), per scope: survey
+    null for the general scope, or a survey that has its own delegations. Voters without a
+    row vote with their own weight.
+    """
+    voter = models.ForeignKey(Voter, on_delete=models.CASCADE, related_name="effective_weights")
+    survey = models.ForeignKey(Survey, null=True, blank=True, on_delete=models.CASCADE, related_name="+")
+    weight = models.DecimalField(max_digits=10, decimal_places=2)  # 0 for a voter who delegated
+    delegate = models.ForeignKey(Voter, null=True, blank=True, on_delete=models.CASCADE, related_name="+")  # end of the chain
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["voter", "survey"], name="effective_weight_per_scope"),
+            models.UniqueConstraint(fields=["voter"], condition=models.Q(survey__isnull=True), name="effective_weight_general"),
+        ]
+
+
+class VoteSubmission(models.Model):
+    """
+    Outcome of a vote form POST, keyed by the form's one-time token, so a retried POST is
+    answered without voting again (core.idempotency). Kept for VOTE_TOKEN_TTL.
+    """
+    token = models.CharField(max_length=32, unique=True)
+    voter = models.ForeignKey(Voter, on_delete=models.CASCADE, related_name="+")
+    survey = models.ForeignKey(Survey, null=True, blank=True, on_delete=models.CASCADE, related_name="+")  # null: ballot
+    ballot = models.ForeignKey(Ballot, null=True, blank=True, on_delete=models.CASCADE, related_name="+")
+    summary = models.CharField(max_length=500)  # what was recorded, as shown to the voter
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.token} ({self.voter_id})"
+
+
+class EntityVersion(models.Model):
+    """Change counter of a kind of data (voters, surveys, ...), for per-process caches (core.coherence)."""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class Job(models.Model):
+    """Background task (export, import, ...) queued by an admin and run by `manage.py run_jobs`."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    artifact = models.CharField(max_length=255, blank=True)  # path relative to JOB_ARTIFACT_ROOT
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        return int(100 * self.progress / self.total) if self.total else 0
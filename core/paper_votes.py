@@ -0,0 +1,227 @@
+"""
+Bulk entry of votes cast on paper, from an .xlsx or .csv sheet.
+
+Columns (header row, any order): EnterPass or Voter ID, Survey ID, Option (option text
+or option id), and optionally Weight (checked against the voter's effective weight, which
+includes votes delegated to them; see core.delegation).
+
+All voters, surveys, options and existing votes referenced by the sheet are loaded with
+a few batched IN queries into dicts, every row is checked in memory, and the accepted
+rows are inserted with multi-row INSERT ... ON CONFLICT DO NOTHING RETURNING statements
+(SQLite 3.35+ and PostgreSQL; several times faster than `bulk_create` for 100k rows, with
+the same ignore-conflicts semantics). The returned keys are the rows this import inserted,
+so rows that lost a race to an online vote (or to another import) are rejected even when
+imports run concurrently. Each row gets an accepted/rejected line in the report. Runs as
+the `import_paper_votes` job (core/jobs.py).
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+from django.db import connections, router, transaction
+from django.utils import timezone
+from core import coherence, delegation, metrics, participation, publishing, turnout
+from core.models import Option, Survey, Vote, Voter
+
+IN_BATCH = 500
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+
+
+class SheetError(ValueError):
+    """The sheet as a whole cannot be read (missing columns, unsupported format)."""
+
+
+def _chunks(values, size=IN_BATCH):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _int(value):
+    text = _text(value)
+    return int(text) if text.isdigit() else None
+
+
+def read_rows(path):
+    """(line number, {column: value}) for every non-empty data row of an .xlsx or .csv file."""
+    if str(path).lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as fh:
+            rows = list(csv.reader(fh))
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    rows = iter(rows)
+    header = [_text(c).lower() for c in next(rows, [])]
+    columns = {}
+    for name, aliases in (
+        ("enter_pass", ("enterpass", "enter pass")),
+        ("voter_id", ("voter id", "voter_id")),
+        ("survey_id", ("survey id", "survey_id")),
+        ("option", ("option", "option text", "option id")),
+        ("weight", ("weight", "vote weight")),
+    ):
+        columns[name] = next((header.index(a) for a in aliases if a in header), None)
+    if columns["survey_id"] is None or columns["option"] is None:
+        raise SheetError("Header row must contain 'Survey ID' and 'Option'.")
+    if columns["enter_pass"] is None and columns["voter_id"] is None:
+        raise SheetError("Header row must contain 'EnterPass' or 'Voter ID'.")
+    result = []
+    for line, row in enumerate(rows, 2):
+        row = list(row) + [None] * len(header)
+        values = {name: (row[col] if col is not None else None) for name, col in columns.items()}
+        if any(_text(v) for v in values.values()):
+            result.append((line, values))
+    return result
+
+
+def _load_maps(rows):
+    codes = {_text(r["enter_pass"]).upper() for _, r in rows if _text(r["enter_pass"])}
+    voter_ids = {_int(r["voter_id"]) for _, r in rows if _int(r["voter_id"]) is not None}
+    survey_ids = {_int(r["survey_id"]) for _, r in rows if _int(r["survey_id"]) is not None}
+    fields = ("pk", "enter_pass", "vote_weight", "is_active")
+    voters_by_code, voters_by_id = {}, {}
+    for batch in _chunks(codes):
+        for voter in Voter.objects.filter(enter_pass__in=batch).values_list(*fields):
+            voters_by_code[voter[1]] = voter
+    for batch in _chunks(voter_ids):
+        for voter in Voter.objects.filter(pk__in=batch).values_list(*fields):
+            voters_by_id[voter[0]] = voter
+    surveys, options_by_id, options_by_text, voted = {}, {}, {}, set()
+    for batch in _chunks(survey_ids):
+        for pk, end, published in Survey.objects.filter(pk__in=batch).values_list("pk", "end_date_time", "is_published"):
+            surveys[pk] = (end, published)
+        for pk, survey_id, text in Option.objects.filter(survey_id__in=batch).values_list("pk", "survey_id", "option_text"):
+            options_by_id[pk] = survey_id
+            options_by_text[(survey_id, text.strip().casefold())] = pk
+        voted.update(Vote.objects.filter(survey_id__in=batch).values_list("survey_id", "voter_id"))
+    return voters_by_code, voters_by_id, surveys, options_by_id, options_by_text, voted
+
+
+def _insert(votes, created_at):
+    """
+    (survey_id, voter_id, option_id, weight) tuples; rows whose voter already voted are
+    skipped. Returns the set of (survey_id, voter_id) actually inserted.
+    """
+    connection = connections[router.db_for_write(Vote)]
+    ops = connection.ops
+    names = ("survey_id", "voter_id", "option_id", "recorded_weight", "created_at", "source")
+    columns = ", ".join(ops.quote_name(c) for c in names)
+    sql = (
+        f"INSERT INTO {ops.quote_name(Vote._meta.db_table)} ({columns}) VALUES {{values}} "
+        f"ON CONFLICT ({ops.quote_name('survey_id')}, {ops.quote_name('voter_id')}) DO NOTHING "
+        f"RETURNING {ops.quote_name('survey_id')}, {ops.quote_name('voter_id')}"
+    )
+    row = "(" + ", ".join(["%s"] * len(names)) + ")"
+    size = max(1, (connection.features.max_query_params or 5000 * len(names)) // len(names))
+    created_at = ops.adapt_datetimefield_value(created_at)
+    inserted = set()
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for batch in _chunks(votes, size):
+            params = []
+            for survey_id, voter_id, option_id, weight in batch:
+                params += [survey_id, voter_id, option_id, ops.adapt_decimalfield_value(weight, 10, 2), created_at, Vote.PAPER]
+            cursor.execute(sql.format(values=", ".join([row] * len(batch))), params)
+            inserted.update((survey_id, voter_id) for survey_id, voter_id in cursor.fetchall())
+    return inserted
+
+
+def ingest(rows, allow_closed=False, progress=None):
+    """
+    Validate and insert paper votes. Returns (report, accepted count); report rows are
+    (line, voter, survey, option, ACCEPTED/REJECTED, reason).
+    """
+    voters_by_code, voters_by_id, surveys, options_by_id, options_by_text, voted = _load_maps(rows)
+    weights = delegation.table({v[0] for v in voters_by_code.values()} | {v[0] for v in voters_by_id.values()})
+    now = timezone.now()
+    report, pending, seen = [], [], {}
+    for i, (line, row) in enumerate(rows, 1):
+        if progress is not None:
+            progress(i, len(rows) * 2)
+        code, voter_id = _text(row["enter_pass"]).upper(), _int(row["voter_id"])
+        voter = voters_by_code.get(code) if code else voters_by_id.get(voter_id)
+        survey_id = _int(row["survey_id"])
+        survey = surveys.get(survey_id)
+        option_text = _text(row["option"])
+        entry = [line, code or _text(row["voter_id"]), _text(row["survey_id"]), option_text]
+        option_id = None
+        if survey is not None:
+            option_id = options_by_text.get((survey_id, option_text.casefold()))
+            if option_id is None and _int(option_text) is not None and options_by_id.get(_int(option_text)) == survey_id:
+                option_id = _int(option_text)
+        reason = None
+        weight, delegate_id = delegation.lookup(weights, voter[0], survey_id, voter[2]) if voter is not None else (None, None)
+        if voter is None:
+            reason = "unknown voter"
+        elif not voter[3]:
+            reason = "voter is inactive"
+        elif survey is None:
+            reason = "unknown survey"
+        elif not survey[1]:
+            reason = "survey is not published"
+        elif survey[0] <= now and not allow_closed:
+            reason = "survey is closed"
+        elif option_id is None:
+            reason = "option is not part of this survey"
+        elif (survey_id, voter[0]) in voted:
+            reason = "voter already voted on this survey"
+        elif (survey_id, voter[0]) in seen:
+            reason = f"duplicate of row {seen[(survey_id, voter[0])]}"
+        elif delegate_id is not None:
+            reason = "voter has delegated their vote on this survey"
+        elif _text(row["weight"]):
+            try:
+                sheet_weight = Decimal(_text(row["weight"]))
+            except InvalidOperation:
+                reason = "weight is not a number"
+            else:
+                if sheet_weight != weight:
+                    reason = f"weight {sheet_weight} does not match the voter's weight {weight}"
+        if reason:
+            report.append(entry + [REJECTED, reason])
+            continue
+        seen[(survey_id, voter[0])] = line
+        pending.append((entry, (survey_id, voter[0], option_id, weight)))
+        report.append(None)  # filled in after the insert
+
+    inserted = _insert([vote for _, vote in pending], timezone.now())
+    results = iter(pending)
+    accepted = 0
+    for i, entry in enumerate(report):
+        if entry is not None:
+            continue
+        row_entry, vote = next(results)
+        if vote[:2] in inserted:
+            report[i] = row_entry + [ACCEPTED, ""]
+            accepted += 1
+        else:
+            report[i] = row_entry + [REJECTED, "voter already voted on this survey (online, during the import)"]
+        if progress is not None:
+            progress(len(rows) + i + 1, len(rows) * 2)
+    metrics.votes.inc(accepted, kind="paper", result="recorded")
+    if accepted:
+        coherence.bump(coherence.VOTES)  # may add votes to closed surveys
+        participation.refresh({voter_id for _, voter_id in inserted})
+    surveys = {vote[0] for _, vote in pending}
+    turnout.invalidate(surveys)  # created_at may predate a timeline's settled point
+    publishing.refresh(surveys)
+    return report, accepted
+
+
+def write_report(report, path):
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Report")
+    ws.append(["Row", "Voter", "Survey ID", "Option", "Result", "Reason"])
+    for entry in report:
+        ws.append(entry)
+    wb.save(path)
+
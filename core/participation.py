@@ -0,0 +1,90 @@
+"""
+Per-voter participation summary: votes cast, total recorded weight and last vote time.
+
+`Participation` rows are kept up to date as votes change, so the admin pages read one row
+per voter instead of aggregating `Vote`. A vote saved online (post_save signal) or a ballot
+(`record()` after its bulk insert) adds to the row in the same transaction. A deleted vote
+(post_delete signal, e.g. a vote reset) recomputes the voter's row from their remaining
+votes: a few indexed rows per voter. Bulk paths that bypass signals (paper vote imports,
+chunked survey deletion) call `refresh()` for the voters they touched.
+
+`rebuild()` (also `python manage.py rebuild_participation`) recomputes every row, e.g.
+after votes were changed with raw SQL.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from core.db_routers import primary_alias
+from core.models import Participation, Vote
+
+IN_BATCH = 500
+
+
+def _batches(ids, size=IN_BATCH):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def record(votes):
+    """Add newly inserted votes to their voters' rows; call in the transaction that inserted them."""
+    totals = defaultdict(lambda: [0, Decimal(0), None])
+    for vote in votes:
+        entry = totals[vote.voter_id]
+        entry[0] += 1
+        entry[1] += vote.recorded_weight
+        entry[2] = vote.created_at if entry[2] is None else max(entry[2], vote.created_at)
+    for voter_id, (count, weight, last) in totals.items():
+        changes = {
+            "votes_cast": F("votes_cast") + count,
+            "weighted_total": F("weighted_total") + weight,
+            # Greatest() is NULL on SQLite when either side is.
+            "last_vote_at": Coalesce(Greatest("last_vote_at", Value(last)), Value(last)),
+        }
+        if not Participation.objects.filter(voter_id=voter_id).update(**changes):
+            Participation.objects.bulk_create([Participation(voter_id=voter_id)], ignore_conflicts=True)
+            Participation.objects.filter(voter_id=voter_id).update(**changes)
+
+
+def _summaries(voter_ids):
+    rows = Vote.objects.filter(voter_id__in=voter_ids).values("voter_id").annotate(
+        count=Count("id"), weight=Sum("recorded_weight"), last=Max("created_at"),
+    ).order_by()
+    return [Participation(voter_id=r["voter_id"], votes_cast=r["count"], weighted_total=r["weight"], last_vote_at=r["last"]) for r in rows]
+
+
+def refresh(voter_ids):
+    """Recompute the rows of the given voters from their votes."""
+    with transaction.atomic(using=primary_alias()):
+        for batch in _batches(set(voter_ids)):
+            Participation.objects.filter(voter_id__in=batch).delete()
+            Participation.objects.bulk_create(_summaries(batch))
+
+
+def rebuild():
+    """Recompute every row; return the number of voters who have voted."""
+    written = 0
+    with transaction.atomic(using=primary_alias()):
+        Participation.objects.all().delete()
+        voter_ids = Vote.objects.values_list("voter_id", flat=True).distinct().order_by()
+        for batch in _batches(voter_ids):
+            written += len(Participation.objects.bulk_create(_summaries(batch)))
+    return written
+
+
+# ----- Signal handlers -----
+def _vote_saved(sender, instance, created, **kwargs):
+    if created:
+        record([instance])
+
+
+def _vote_deleted(sender, instance, **kwargs):
+    refresh([instance.voter_id])
+
+
+def connect_signals():
+    post_save.connect(_vote_saved, sender=Vote, dispatch_uid="participation_vote_saved")
+    post_delete.connect(_vote_deleted, sender=Vote, dispatch_uid="participation_vote_deleted")
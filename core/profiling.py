@@ -0,0 +1,173 @@
+"""
+On-demand profiling of single requests, for staff.
+
+While logged in as staff, add `?_profile=1` to any URL, or switch on "Profile my requests"
+on the admin Profiles page (a signed cookie). That request then runs under cProfile with
+its SQL captured; the pstats dump and a JSON summary are written to PROFILE_ROOT and listed
+in the admin area. Requests without the parameter or cookie only pay a dict lookup, and
+with PROFILER_ENABLED = False (the default; QUESTIONNAIRE_PROFILER=1 enables it) the
+middleware is not installed at all.
+"""
+import json
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from core import tenancy
+
+PROFILE_PARAM = "_profile"
+COOKIE_NAME = "qm_profile"
+COOKIE_SALT = "core.profiling"
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+
+def profile_root():
+    return tenancy.current().path(settings.PROFILE_ROOT)
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_PARAM not in request.GET and COOKIE_NAME not in request.COOKIES:
+            return self.get_response(request)
+        if not request.user.is_staff:
+            return self.get_response(request)
+        if PROFILE_PARAM not in request.GET and not request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT):
+            return self.get_response(request)
+        return self._profile(request)
+
+    def _profile(self, request):
+        import cProfile
+
+        queries = []
+
+        def capture_sql(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    "alias": context["connection"].alias,
+                    "sql": sql,
+                    "ms": round((time.perf_counter() - start) * 1000, 3),
+                })
+
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(capture_sql))
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+        profile_id = save_profile(request, response, profiler, queries, elapsed)
+        response["X-Profile-Id"] = profile_id
+        return response
+
+
+def save_profile(request, response, profiler, queries, elapsed):
+    """Write the pstats dump and JSON summary; prune to the newest PROFILE_KEEP profiles."""
+    now = timezone.now()
+    profile_id = f"{now:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+    root = profile_root()
+    root.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(root / f"{profile_id}.prof")
+    meta = {
+        "id": profile_id,
+        "created_at": now.isoformat(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "status": response.status_code,
+        "user": request.user.get_username(),
+        "total_ms": round(elapsed * 1000, 2),
+        "sql_count": len(queries),
+        "sql_ms": round(sum(q["ms"] for q in queries), 2),
+        "queries": queries,
+    }
+    (root / f"{profile_id}.json").write_text(json.dumps(meta))
+    for old in sorted(root.glob("*.json"))[:-settings.PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".prof").unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles(limit=50):
+    """Summaries of the newest profiles (without their SQL), newest first."""
+    profiles = []
+    for path in sorted(profile_root().glob("*.json"), reverse=True)[:limit]:
+        meta = json.loads(path.read_text())
+        meta.pop("queries", None)
+        profiles.append(meta)
+    return profiles
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in
+    parts = Path(filename).parts
+    short = "/".join(parts[-3:]) if len(parts) > 3 else filename
+    return f"{name} ({short}:{line})"
+
+
+def load_profile(profile_id, top=30, tree_depth=14, tree_min_pct=1.0):
+    """Summary, SQL, top functions and a pruned call tree for one profile; None if unknown."""
+    import pstats
+
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    root = profile_root()
+    meta_path, stats_path = root / f"{profile_id}.json", root / f"{profile_id}.prof"
+    if not meta_path.is_file() or not stats_path.is_file():
+        return None
+    meta = json.loads(meta_path.read_text())
+    stats = pstats.Stats(str(stats_path)).stats  # func -> (cc, nc, tottime, cumtime, callers)
+    total = sum(tt for _, _, tt, _, _ in stats.values()) or 1e-9
+
+    functions = [
+        {"label": _label(func), "calls": nc, "tottime_ms": tt * 1000, "cumtime_ms": ct * 1000, "pct": 100 * ct / total}
+        for func, (cc, nc, tt, ct, callers) in stats.items()
+    ]
+    meta["by_cumtime"] = sorted(functions, key=lambda f: f["cumtime_ms"], reverse=True)[:top]
+    meta["by_tottime"] = sorted(functions, key=lambda f: f["tottime_ms"], reverse=True)[:top]
+
+    # Call tree: invert the caller edges and walk from the entry points by cumulative time.
+    children = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    # Entry points have calls no profiled caller accounts for (Django's middleware chain
+    # re-enters the same wrapper, so the outermost one still has callers).
+    roots = sorted(
+        ((func, ct) for func, (cc, nc, tt, ct, callers) in stats.items() if nc > sum(e[1] for e in callers.values())),
+        key=lambda item: item[1], reverse=True,
+    )
+    tree = []
+
+    def walk(func, cumtime, depth, path):
+        pct = 100 * cumtime / total
+        if pct < tree_min_pct:
+            return
+        tree.append({"depth": depth, "indent": depth * 1.25, "label": _label(func), "cumtime_ms": cumtime * 1000, "pct": pct})
+        if depth >= tree_depth:
+            return
+        for child, child_time in sorted(children.get(func, []), key=lambda item: item[1], reverse=True):
+            if child not in path:
+                walk(child, child_time, depth + 1, path | {child})
+
+    for func, cumtime in roots:
+        walk(func, cumtime, 0, {func})
+    meta["tree"] = tree
+    return meta
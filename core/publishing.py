@@ -0,0 +1,255 @@
+"""
+Static HTML copies of final results, so results views skip the database once a survey closed.
+
+Results of a closed survey never change unless an admin resets a vote, so its page is
+rendered once into
+
+    RESULTS_PUBLISH_ROOT/<tree token>/results/<survey id>-<survey token>.html
+
+(together with `index.html`, the list of closed surveys). Pages are written only outside
+GET requests: when a survey is closed or changed (signals, after the transaction commits),
+by `run_jobs` for surveys whose end time has passed (`publish_pending()`, every
+RESULTS_PUBLISH_INTERVAL seconds), and by `python manage.py publish_results`. Only
+published surveys get pages; unpublishing a survey removes its page.
+
+Every view still goes through `results_detail`, so `voter_required` decides who sees a
+page (a logged-out or deactivated voter no longer does). `serve()` then streams the file,
+or with RESULTS_PUBLISH_ACCEL_URL hands it to the front web server (X-Accel-Redirect to an
+`internal` location, which clients cannot request themselves). The tree and survey tokens
+are HMACs of SECRET_KEY, per organization (core.tenancy) and per survey, so the files
+cannot be enumerated even if the directory were exposed. Files are written to a temporary
+name and renamed into place, so readers never see a partial page.
+"""
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import FileResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import get_script_prefix, set_script_prefix
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from core import tenancy
+from core.db_routers import primary_alias, primary_reads
+
+_state = {"checked": {}}  # database alias -> monotonic time of the last publish_pending()
+
+
+def tree_token(org=None):
+    org = org or tenancy.current()
+    value = "results-tree" if org.is_default else f"results-tree:{org.slug}"
+    return salted_hmac("core.publishing.results", value).hexdigest()[:32]
+
+
+def survey_token(survey_id):
+    return salted_hmac("core.publishing.survey", f"{tree_token()}:{survey_id}").hexdigest()[:32]
+
+
+def publish_root():
+    return Path(settings.RESULTS_PUBLISH_ROOT)
+
+
+def _results_dir():
+    return publish_root() / tree_token() / "results"
+
+
+def results_path(survey_id):
+    return _results_dir() / f"{survey_id}-{survey_token(survey_id)}.html"
+
+
+def index_path():
+    return _results_dir() / "index.html"
+
+
+def _survey_id(path):
+    """Survey id of a page file name, or None for the index and foreign files."""
+    head, _, _ = path.stem.partition("-")
+    return int(head) if head.isdigit() else None
+
+
+def is_published(survey_id):
+    return settings.RESULTS_PUBLISH_ENABLED and results_path(survey_id).is_file()
+
+
+def serve(path):
+    """Response with a published file, or None when it does not exist (any more)."""
+    if settings.RESULTS_PUBLISH_ACCEL_URL:
+        if not path.is_file():
+            return None
+        response = HttpResponse(content_type="text/html; charset=utf-8")
+        response["X-Accel-Redirect"] = settings.RESULTS_PUBLISH_ACCEL_URL + path.relative_to(publish_root()).as_posix()
+        return response
+    try:
+        return FileResponse(open(path, "rb"), content_type="text/html; charset=utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _render(template, context):
+    """Render a page with the organization's URLs, whatever request (if any) triggered it."""
+    previous = get_script_prefix()
+    set_script_prefix(tenancy.current().script_prefix)
+    try:
+        return render_to_string(template, {**context, "published_page": True})
+    finally:
+        set_script_prefix(previous)
+
+
+def _closed():
+    from core.models import Survey
+    return Survey.objects.filter(is_published=True, end_date_time__lte=timezone.now())
+
+
+def publish_survey(survey):
+    """Render the final results page of a closed, published survey; return False otherwise."""
+    from core.views.user_views import results_detail_context
+    if not survey.is_published or timezone.now() < survey.end_date_time:
+        return False
+    with primary_reads():  # never publish from a lagging replica
+        html = _render("user/results_detail.html", results_detail_context(survey))
+    _write_atomic(results_path(survey.pk), html)
+    return True
+
+
+def unpublish_survey(survey_id):
+    results_path(survey_id).unlink(missing_ok=True)
+
+
+def publish_index():
+    """Render the list of closed, published surveys with links to their results."""
+    with primary_reads():
+        surveys = list(_closed().order_by("-end_date_time"))
+    html = _render("user/results_index.html", {"surveys": surveys})
+    _write_atomic(index_path(), html)
+
+
+def publish_all():
+    """Render every closed, published survey and the index; remove all other pages."""
+    keep = set()
+    for survey in _closed().iterator():
+        publish_survey(survey)
+        keep.add(survey.pk)
+    for path in _results_dir().glob("*.html"):
+        survey_id = _survey_id(path)
+        if survey_id is not None and (survey_id not in keep or path != results_path(survey_id)):
+            path.unlink(missing_ok=True)
+    publish_index()
+    return len(keep)
+
+
+def publish_pending(force=False):
+    """
+    Render the pages of closed, published surveys that have none yet (their end time passed
+    since the last run), and the index if any was added; at most every
+    RESULTS_PUBLISH_INTERVAL seconds per organization unless `force`. Returns the count.
+    """
+    if not settings.RESULTS_PUBLISH_ENABLED:
+        return 0
+    alias, now = primary_alias(), time.monotonic()
+    if not force and now - _state["checked"].get(alias, float("-inf")) < settings.RESULTS_PUBLISH_INTERVAL:
+        return 0
+    _state["checked"][alias] = now
+    published = 0
+    with primary_reads():
+        for survey in _closed().iterator():
+            if not results_path(survey.pk).is_file():
+                published += publish_survey(survey)
+    if published or not index_path().is_file():
+        publish_index()
+    return published
+
+
+def refresh(survey_ids):
+    """Re-render the already published pages among `survey_ids` (their votes changed) and the index."""
+    published = [pk for pk in survey_ids if is_published(pk)]
+    if not published:
+        return
+    for survey in _closed().filter(pk__in=published):
+        publish_survey(survey)
+    publish_index()
+
+
+def remove_stale_trees():
+    """Delete trees published under an old SECRET_KEY or for an organization no longer served."""
+    current = {tree_token(org) for org in [tenancy.DEFAULT, *tenancy.organizations()]}
+    removed = 0
+    if publish_root().is_dir():
+        for path in publish_root().iterdir():
+            if path.is_dir() and path.name not in current:
+                shutil.rmtree(path)
+                removed += 1
+    return removed
+
+
+class _Republish:
+    """
+    on_commit callback of `republish_on_commit()`, one per transaction: it collects the survey
+    ids while queued, and is dropped with them if the transaction rolls back.
+    """
+
+    def __init__(self):
+        self.ids = set()
+
+    def __call__(self):
+        from core.models import Survey
+        surveys = {s.pk: s for s in Survey.objects.filter(pk__in=self.ids)}
+        for survey_id in self.ids:
+            survey = surveys.get(survey_id)
+            if survey is None or not publish_survey(survey):
+                unpublish_survey(survey_id)
+        publish_index()
+
+
+def republish_on_commit(survey_ids):
+    """Re-render (or remove) the surveys' pages, and the index once, when the current transaction commits."""
+    if not settings.RESULTS_PUBLISH_ENABLED:
+        return
+    alias = primary_alias()
+    queued = [func for _, func, _ in transaction.get_connection(alias).run_on_commit if isinstance(func, _Republish)]
+    if queued:
+        queued[-1].ids.update(survey_ids)
+        return
+    callback = _Republish()
+    callback.ids.update(survey_ids)
+    transaction.on_commit(callback, using=alias)
+
+
+# ----- Signal handlers -----
+def _vote_deleted(sender, instance, **kwargs):
+    if is_published(instance.survey_id):
+        republish_on_commit([instance.survey_id])
+
+
+def _survey_saved(sender, instance, **kwargs):
+    closed = instance.is_published and instance.end_date_time <= timezone.now()
+    if closed or is_published(instance.pk):  # closed now (e.g. "close now"), or its page is out of date
+        republish_on_commit([instance.pk])
+
+
+def _survey_deleted(sender, instance, **kwargs):
+    if is_published(instance.pk):
+        republish_on_commit([instance.pk])
+
+
+def connect_signals():
+    from core.models import Survey, Vote
+    post_delete.connect(_vote_deleted, sender=Vote, dispatch_uid="publishing_vote_deleted")
+    post_save.connect(_survey_saved, sender=Survey, dispatch_uid="publishing_survey_saved")
+    post_delete.connect(_survey_deleted, sender=Survey, dispatch_uid="publishing_survey_deleted")
@@ -0,0 +1,225 @@
+"""
+Full-text search over voters (full name, EnterPass) and surveys (question, option texts).
+
+SQLite uses the FTS5 virtual table `core_search`; PostgreSQL uses a table of the same name
+with a generated tsvector column and a GIN index (both created by migration 0005).
+Each document's rowid encodes the object: voter id * 2, or survey id * 2 + 1, so updates
+and deletes are primary-key operations.
+
+The index follows model saves and deletes through signals (connected in CoreConfig.ready).
+Bulk operations that bypass signals call `index_voters()` / `index_surveys()` / `remove()`
+themselves; `python manage.py rebuild_search_index` rebuilds everything.
+"""
+import re
+from django.db import connections, router
+from django.db.models.signals import post_delete, post_save
+
+VOTER = "voter"
+SURVEY = "survey"
+KINDS = (VOTER, SURVEY)
+_KIND_BIT = {VOTER: 0, SURVEY: 1}
+
+TABLE = "core_search"
+# Whole-index rebuild; the same statements fill the index in migration 0005.
+REBUILD_SQL = {
+    "sqlite": [
+        f"DELETE FROM {TABLE}",
+        f"INSERT INTO {TABLE} (rowid, title, body) SELECT id * 2, full_name, enter_pass FROM core_voter",
+        f"INSERT INTO {TABLE} (rowid, title, body) "
+        "SELECT s.id * 2 + 1, s.question_text, COALESCE(group_concat(o.option_text, ' '), '') "
+        "FROM core_survey s LEFT JOIN core_option o ON o.survey_id = s.id GROUP BY s.id",
+    ],
+    "postgresql": [
+        f"DELETE FROM {TABLE}",
+        f"INSERT INTO {TABLE} (rowid, title, body) SELECT id * 2, full_name, enter_pass FROM core_voter",
+        f"INSERT INTO {TABLE} (rowid, title, body) "
+        "SELECT s.id * 2 + 1, s.question_text, COALESCE(string_agg(o.option_text, ' '), '') "
+        "FROM core_survey s LEFT JOIN core_option o ON o.survey_id = s.id GROUP BY s.id",
+    ],
+}
+
+
+def _rowid(kind, pk):
+    return pk * 2 + _KIND_BIT[kind]
+
+
+def _connection():
+    from core.models import Voter
+    return connections[router.db_for_write(Voter)]
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def match_expression(query, vendor):
+    """Prefix query matching documents that contain every term, or None if `query` has no terms."""
+    terms = _terms(query)
+    if not terms:
+        return None
+    if vendor == "postgresql":
+        return " & ".join(f"{t}:*" for t in terms)
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _upsert(rows):
+    if not rows:
+        return
+    connection = _connection()
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s) "
+                "ON CONFLICT (rowid) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body",
+                rows,
+            )
+        else:
+            cursor.executemany(f"INSERT OR REPLACE INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)", rows)
+
+
+def index_voters(voters):
+    _upsert([(_rowid(VOTER, v.pk), v.full_name, v.enter_pass) for v in voters])
+
+
+def index_surveys(surveys):
+    from core.models import Option
+    surveys = list(surveys)
+    option_texts = {}
+    for survey_id, text in Option.objects.filter(survey__in=surveys).order_by("id").values_list("survey_id", "option_text"):
+        option_texts.setdefault(survey_id, []).append(text)
+    _upsert([(_rowid(SURVEY, s.pk), s.question_text, " ".join(option_texts.get(s.pk, []))) for s in surveys])
+
+
+def remove(kind, pks):
+    rowids = [(_rowid(kind, pk),) for pk in pks]
+    if rowids:
+        with _connection().cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", rowids)
+
+
+def rebuild():
+    connection = _connection()
+    with connection.cursor() as cursor:
+        for sql in REBUILD_SQL[connection.vendor]:
+            cursor.execute(sql)
+
+
+def search(query, kind=None, page=1, per_page=20):
+    """
+    Ranked prefix search. Returns (hits, has_next); each hit is a dict with `kind` and
+    `obj` (the Voter or Survey). Title matches rank above body matches.
+    """
+    from core.models import Voter, Survey
+    connection = _connection()
+    expression = match_expression(query, connection.vendor)
+    if expression is None:
+        return [], False
+    offset = (max(page, 1) - 1) * per_page
+    kind_filter = f"AND rowid %% 2 = {_KIND_BIT[kind]}" if kind in _KIND_BIT else ""
+    if connection.vendor == "postgresql":
+        sql = (
+            f"SELECT rowid FROM {TABLE} WHERE document @@ to_tsquery('simple', %s) {kind_filter} "
+            "ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC, rowid LIMIT %s OFFSET %s"
+        )
+        params = [expression, expression, per_page + 1, offset]
+    else:
+        sql = (
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s {kind_filter} "
+            f"ORDER BY bm25({TABLE}, 10.0, 1.0), rowid LIMIT %s OFFSET %s"
+        )
+        params = [expression, per_page + 1, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rowids = [row[0] for row in cursor.fetchall()]
+    has_next = len(rowids) > per_page
+    rowids = rowids[:per_page]
+    voters = Voter.objects.in_bulk([r // 2 for r in rowids if r % 2 == 0])
+    surveys = Survey.objects.in_bulk([r // 2 for r in rowids if r % 2 == 1])
+    hits = []
+    for r in rowids:
+        obj = surveys.get(r // 2) if r % 2 else voters.get(r // 2)
+        if obj is not None:
+            hits.append({"kind": SURVEY if r % 2 else VOTER, "obj": obj})
+    return hits, has_next
+
+
+def matching_ids_sql(kind, query, vendor):
+    """
+    (sql, params) of a subquery selecting the ids of `kind` objects matching `query`, for
+    use in `pk__in=RawSQL(...)`; None if `query` has no terms.
+    """
+    expression = match_expression(query, vendor)
+    if expression is None:
+        return None
+    if vendor == "postgresql":
+        where = "document @@ to_tsquery('simple', %s)"
+    else:
+        where = f"{TABLE} MATCH %s"
+    return f"SELECT rowid / 2 FROM {TABLE} WHERE {where} AND rowid %% 2 = {_KIND_BIT[kind]}", [expression]
+
+
+# ----- Typeahead lookups (capped, index-backed) -----
+def suggest_surveys(query, limit=20):
+    """Surveys for a picker: best text matches, or the most recently closing ones without a query."""
+    from core.models import Survey
+    if not _terms(query):
+        return list(Survey.objects.order_by("-end_date_time")[:limit])
+    hits, _ = search(query, kind=SURVEY, per_page=limit)
+    return [hit["obj"] for hit in hits]
+
+
+def suggest_voters(survey, query, limit=20):
+    """Voters who voted on `survey`, narrowed by a name/EnterPass prefix query."""
+    from django.db.models.expressions import RawSQL
+    from core.models import Vote
+    votes = Vote.objects.filter(survey=survey).select_related("voter")
+    subquery = matching_ids_sql(VOTER, query, _connection().vendor)
+    if subquery is not None:
+        votes = votes.filter(voter_id__in=RawSQL(*subquery))
+    # (survey, voter) is unique, so this ordering walks that index and stops at `limit`.
+    return [vote.voter for vote in votes.order_by("voter_id")[:limit]]
+
+
+def suggest_active_voters(query, limit=20):
+    """Active voters for a picker, narrowed by a name/EnterPass prefix query, by name."""
+    from django.db.models.expressions import RawSQL
+    from core.models import Voter
+    voters = Voter.objects.filter(is_active=True)
+    subquery = matching_ids_sql(VOTER, query, _connection().vendor)
+    if subquery is not None:
+        voters = voters.filter(pk__in=RawSQL(*subquery))
+    return list(voters.order_by("full_name")[:limit])
+
+
+# ----- Signal handlers -----
+def _voter_saved(sender, instance, **kwargs):
+    index_voters([instance])
+
+
+def _voter_deleted(sender, instance, **kwargs):
+    remove(VOTER, [instance.pk])
+
+
+def _survey_saved(sender, instance, **kwargs):
+    index_surveys([instance])
+
+
+def _survey_deleted(sender, instance, **kwargs):
+    remove(SURVEY, [instance.pk])
+
+
+def _option_changed(sender, instance, **kwargs):
+    from core.models import Survey
+    survey = Survey.objects.filter(pk=instance.survey_id).first()
+    if survey is not None:
+        index_surveys([survey])
+
+
+def connect_signals():
+    from core.models import Voter, Survey, Option
+    post_save.connect(_voter_saved, sender=Voter, dispatch_uid="search_voter_saved")
+    post_delete.connect(_voter_deleted, sender=Voter, dispatch_uid="search_voter_deleted")
+    post_save.connect(_survey_saved, sender=Survey, dispatch_uid="search_survey_saved")
+    post_delete.connect(_survey_deleted, sender=Survey, dispatch_uid="search_survey_deleted")
+    post_save.connect(_option_changed, sender=Option, dispatch_uid="search_option_saved")
+    post_delete.connect(_option_changed, sender=Option, dispatch_uid="search_option_deleted")
@@ -0,0 +1,124 @@
+"""
+Cold-start measurement: import a deployment entry point (wsgi/asgi) in a fresh interpreter,
+time `django.setup()` and the first request, and count loaded modules.
+
+Used by `python manage.py bench_startup` and by the startup budget test in core/tests.py.
+Both run the probe against a freshly migrated scratch database (`temporary_database()`),
+never the working copy's db.sqlite3. The time budgets depend on the machine, so only
+`bench_startup` enforces them; the test checks the module count and deferred imports.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Recorded budget for a cold start (setup + first request). Raise deliberately, not casually.
+STARTUP_BUDGET = {
+    "setup_seconds": 2.0,
+    "first_request_seconds": 1.0,
+    "modules": 650,
+}
+TIMING_KEYS = ("setup_seconds", "first_request_seconds")
+
+# Rarely used dependencies that must only be imported by the code paths that need them.
+DEFERRED_MODULES = ["openpyxl"]
+
+_PROBE = r"""
+import json, os, sys, time
+entry, path = sys.argv[1], sys.argv[2]
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "questionnaire_site.settings")
+modules_before = len(sys.modules)
+t0 = time.perf_counter()
+if entry == "asgi":
+    from questionnaire_site.asgi import application
+else:
+    from questionnaire_site.wsgi import application
+t1 = time.perf_counter()
+environ = {
+    "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+    "SERVER_NAME": "127.0.0.1", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+    "REMOTE_ADDR": "127.0.0.1", "wsgi.url_scheme": "http", "wsgi.input": __import__("io").BytesIO(),
+    "wsgi.errors": sys.stderr, "wsgi.version": (1, 0), "wsgi.multithread": False,
+    "wsgi.multiprocess": True, "wsgi.run_once": False,
+}
+status = []
+if entry == "asgi":
+    import asyncio
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"127.0.0.1")],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80),
+    }
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    asyncio.run(application(scope, receive, send))
+else:
+    body = application(environ, lambda s, h, exc_info=None: status.append(int(s.split()[0])))
+    b"".join(body)
+    getattr(body, "close", lambda: None)()
+t2 = time.perf_counter()
+print(json.dumps({
+    "entry": entry,
+    "setup_seconds": t1 - t0,
+    "first_request_seconds": t2 - t1,
+    "status": status[0] if status else None,
+    "modules": len(sys.modules) - modules_before,
+    "loaded": sorted({m.split(".")[0] for m in sys.modules} & set(json.loads(sys.argv[3]))),
+}))
+"""
+
+
+def _env(database):
+    env = {k: v for k, v in os.environ.items() if k not in ("QUESTIONNAIRE_TENANTS", "QUESTIONNAIRE_TENANT")}
+    env["QUESTIONNAIRE_DB"] = str(database)
+    env["QUESTIONNAIRE_VAR"] = str(Path(database).parent / "var")  # keep metrics snapshots out of var/
+    return env
+
+
+@contextmanager
+def temporary_database():
+    """Path of a migrated SQLite file in a temporary directory, removed afterwards."""
+    with tempfile.TemporaryDirectory(prefix="startup-probe-") as tmp:
+        database = Path(tmp) / "db.sqlite3"
+        subprocess.run(
+            [sys.executable, "manage.py", "migrate", "--noinput", "--verbosity", "0"],
+            cwd=BASE_DIR, env=_env(database), capture_output=True, text=True, check=True,
+        )
+        yield database
+
+
+def measure(entry="wsgi", path="/login/", database=None):
+    """Cold-start one entry point ("wsgi" or "asgi") in a subprocess and return its timings.
+    `database` is a migrated SQLite file (see `temporary_database`)."""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE, entry, path, json.dumps(DEFERRED_MODULES)],
+        cwd=BASE_DIR,
+        env=_env(database) if database is not None else None,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def over_budget(sample, timings=True):
+    """Return a list of human-readable budget violations for one `measure()` result
+    (without the machine-dependent time budgets when `timings` is false)."""
+    problems = []
+    for key, limit in STARTUP_BUDGET.items():
+        if key in TIMING_KEYS and not timings:
+            continue
+        if sample[key] > limit:
+            problems.append(f"{key} {sample[key]:g} exceeds budget {limit}")
+    if sample["loaded"]:
+        problems.append("deferred modules imported at startup: " + ", ".join(sample["loaded"]))
+    return problems
@@ -0,0 +1,198 @@
+"""
+Bulk survey authoring from JSON, YAML or XLSX files.
+
+JSON / YAML: a list of surveys, or {"surveys": [...]}, each like
+
+    {"question": "Lunch order?", "options": ["Pizza", "Salad"], "end": "2026-11-01 18:00", "published": true}
+
+XLSX: a header row with Question, End date/time, Published, then one column per option
+(Option 1, Option 2, ...); one survey per row.
+
+A missing or empty `published` publishes the survey, like the create form does. An `end`
+with a date only (a YAML date or "2026-11-01") closes the survey at the end of
+that day.
+
+`load()` parses and validates the whole file and raises `ImportErrors` listing every
+problem; `create_surveys()` then inserts all surveys and options with two bulk inserts
+in one transaction. `python manage.py import_surveys` and the admin import page use both.
+"""
+import json
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from core import coherence, search
+from core.db_routers import primary_alias
+from core.models import Option, Survey
+
+FORMATS = (".json", ".yaml", ".yml", ".xlsx")
+OPTION_MAX_LENGTH = Option._meta.get_field("option_text").max_length
+
+
+class ImportErrors(Exception):
+    """The file cannot be imported; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} problem(s) found")
+        self.errors = errors
+
+
+def _parse_xlsx(fh):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(fh, read_only=True, data_only=True)
+    rows = wb.active.iter_rows(values_only=True)
+    header = [str(c or "").strip().lower() for c in next(rows, [])]
+    try:
+        question_col = header.index("question")
+    except ValueError:
+        raise ImportErrors(["Header row must contain 'Question'."])
+    end_col = next((i for i, h in enumerate(header) if h in ("end date/time", "end", "end_date_time")), None)
+    published_col = header.index("published") if "published" in header else None
+    option_cols = [i for i, h in enumerate(header) if h.startswith("option")]
+    surveys = []
+    for row in rows:
+        row = list(row) + [None] * len(header)
+        if not any(c not in (None, "") for c in row):
+            continue
+        surveys.append({
+            "question": row[question_col],
+            "end": row[end_col] if end_col is not None else None,
+            "published": row[published_col] if published_col is not None else None,
+            "options": [row[i] for i in option_cols if row[i] not in (None, "")],
+        })
+    return surveys
+
+
+def parse(fh, filename):
+    """Raw survey dicts from an open binary file; the format follows the file extension."""
+    suffix = Path(filename).suffix.lower()
+    if suffix not in FORMATS:
+        raise ImportErrors([f"Unsupported file type '{suffix}'; use " + ", ".join(FORMATS) + "."])
+    if suffix == ".xlsx":
+        return _parse_xlsx(fh)
+    try:
+        if suffix == ".json":
+            data = json.load(fh)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportErrors(["YAML files need the PyYAML package (pip install pyyaml)."])
+            data = yaml.safe_load(fh)
+    except ImportErrors:
+        raise
+    except Exception as exc:
+        raise ImportErrors([f"Could not parse the file: {exc}"])
+    if isinstance(data, dict):
+        data = data.get("surveys")
+    if not isinstance(data, list):
+        raise ImportErrors(["Expected a list of surveys (or an object with a 'surveys' list)."])
+    return data
+
+
+def _end_time(value):
+    if isinstance(value, str):
+        text = value.strip()
+        value = parse_datetime(text.replace(" ", "T", 1)) or parse_date(text)
+    if isinstance(value, datetime):
+        end = value
+    elif isinstance(value, date):
+        end = datetime.combine(value + timedelta(days=1), time.min)  # end of that day
+    else:
+        return None
+    return timezone.make_aware(end) if timezone.is_naive(end) else end
+
+
+def _published(value):
+    if value in (None, ""):
+        return Survey._meta.get_field("is_published").default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y"):
+        return True
+    if text in ("0", "false", "no", "n"):
+        return False
+    return None
+
+
+def validate(raw_surveys):
+    """Check every survey; return [(question, end, published, [options])] or raise ImportErrors."""
+    surveys, errors = [], []
+    for number, raw in enumerate(raw_surveys, 1):
+        if not isinstance(raw, dict):
+            errors.append(f"Survey {number}: expected an object with question, options and end.")
+            continue
+        question = str(raw.get("question") or "").strip()
+        label = f"Survey {number}" + (f" ({question[:40]})" if question else "")
+        problems = []
+        if not question:
+            problems.append("question is required")
+        end = _end_time(raw.get("end"))
+        if end is None:
+            problems.append("end must be a date/time such as 2026-11-01 18:00")
+        published = _published(raw.get("published"))
+        if published is None:
+            problems.append("published must be true or false")
+        options = raw.get("options")
+        if not isinstance(options, list):
+            problems.append("options must be a list")
+            options = []
+        options = [str(o).strip() for o in options if o is not None and str(o).strip()]
+        if len(options) < 2:
+            problems.append("at least 2 options are required")
+        if len(set(options)) != len(options):
+            problems.append("options must be distinct")
+        if any(len(o) > OPTION_MAX_LENGTH for o in options):
+            problems.append(f"options are limited to {OPTION_MAX_LENGTH} characters")
+        if problems:
+            errors.append(f"{label}: " + "; ".join(problems) + ".")
+        else:
+            surveys.append((question, end, published, options))
+    if not raw_surveys:
+        errors.append("The file contains no surveys.")
+    if errors:
+        raise ImportErrors(errors)
+    return surveys
+
+
+def load(fh, filename):
+    """Parse and validate a definitions file; raise ImportErrors if anything is wrong."""
+    return validate(parse(fh, filename))
+
+
+def create_surveys(definitions):
+    """Insert validated definitions (from `load()`) in one transaction; return the new surveys."""
+    with transaction.atomic(using=primary_alias()):
+        surveys = Survey.objects.bulk_create([
+            Survey(question_text=question, end_date_time=end, is_published=published)
+            for question, end, published, _ in definitions
+        ])
+        Option.objects.bulk_create([
+            Option(survey=survey, option_text=option_text)
+            for survey, (_, _, _, option_texts) in zip(surveys, definitions)
+            for option_text in option_texts
+        ], batch_size=1000)
+        search.index_surveys(surveys)
+        coherence.bump(coherence.SURVEYS)
+    return surveys
+
+
+def clone_survey(survey):
+    """
+    Unpublished standalone copy of a survey and its options (one bulk insert for the options).
+    A closed survey's copy ends as long after now as the original ran after its creation.
+    """
+    end = survey.end_date_time
+    if end <= timezone.now():
+        end = timezone.now() + max(end - survey.created_at, timedelta(days=1))
+    with transaction.atomic(using=primary_alias()):
+        copy = Survey.objects.create(question_text=survey.question_text, kind=survey.kind, end_date_time=end, is_published=False)
+        Option.objects.bulk_create([
+            Option(survey=copy, option_text=text)
+            for text in survey.options.order_by("id").values_list("option_text", flat=True)
+        ])
+        search.index_surveys([copy])
+    return copy
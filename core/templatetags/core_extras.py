@@ -1,5 +1,6 @@
 from django import template
 from django.utils import timezone
+from django.utils.html import format_html
 
 register = template.Library()
 
@@ -26,3 +27,10 @@ def closes_in(dt):
     if minutes or not parts:
         parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
     return " ".join(parts)
+
+
+@register.simple_tag
+def vote_token():
+    """Hidden one-time submission token of a vote form (core.idempotency)."""
+    from core import idempotency
+    return format_html('<input type="hidden" name="{}" value="{}">', idempotency.FIELD, idempotency.new_token())
@@ -0,0 +1,150 @@
+"""
+Multi-organization tenancy: one deployment serves several organizations, each with its own database.
+
+Organizations are configured in `settings.TENANTS` as {slug: {"name", "hosts"}}. Each one
+gets the database `tenant_<slug>`: the SQLite file TENANT_DB_ROOT/<slug>.sqlite3, or the
+entry's own "database" settings (e.g. PostgreSQL with one schema per organization through
+OPTIONS search_path). `TenantMiddleware` resolves the organization of each request from its
+host (one of the "hosts") or from a /o/<slug>/ path prefix. The prefix is moved from
+path_info to the script prefix, so `reverse()` keeps links inside the organization.
+Requests that match no organization are served from the "default" database, as before.
+
+`core.db_routers.TenantRouter` sends every model to the current organization's database:
+voters, surveys, options and votes, but also sessions and staff users, so a login in one
+organization means nothing in another. Each organization's SQLite file has its own write
+lock, so one organization's load never blocks another's writes. Per-process caches, turnout
+timelines, published results and job and profile files are kept per organization as well.
+
+Outside requests (management commands, `run_jobs` workers), the organization is the one
+named by the QUESTIONNAIRE_TENANT environment variable, or the default one; `activated()`
+switches it for a block. `python manage.py migrate_tenants` migrates every database.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import Http404
+from django.http.request import split_domain_port
+from django.urls import get_script_prefix, set_script_prefix
+
+DEFAULT_ALIAS = "default"
+ENV_VAR = "QUESTIONNAIRE_TENANT"
+
+
+class Organization:
+    """A tenant: slug (None for the default organization), name, host names and database alias."""
+
+    def __init__(self, slug, name, hosts=()):
+        self.slug = slug
+        self.name = name
+        self.hosts = [h.lower() for h in hosts]
+        self.alias = f"tenant_{slug}" if slug else DEFAULT_ALIAS
+
+    def __repr__(self):
+        return f"<Organization {self.slug or '(default)'}>"
+
+    @property
+    def is_default(self):
+        return self.slug is None
+
+    @property
+    def script_prefix(self):
+        """Prefix of this organization's URLs outside requests: "/" on its own hosts, else /o/<slug>/."""
+        return f"/{settings.TENANT_PATH_PREFIX}/{self.slug}/" if self.slug and not self.hosts else "/"
+
+    def path(self, root):
+        """This organization's directory under a file root (the root itself for the default one)."""
+        root = Path(root)
+        return root if self.is_default else root / "tenants" / self.slug
+
+
+DEFAULT = Organization(None, "")
+
+_current = ContextVar("organization", default=None)
+_registry = {"config": None, "by_slug": {}, "by_host": {}}
+
+
+def _load():
+    config = settings.TENANTS
+    if _registry["config"] is not config:
+        by_slug = {slug: Organization(slug, entry.get("name", slug), entry.get("hosts", ())) for slug, entry in config.items()}
+        _registry.update(config=config, by_slug=by_slug, by_host={h: org for org in by_slug.values() for h in org.hosts})
+    return _registry
+
+
+def organizations():
+    """The configured organizations, without the default one."""
+    return list(_load()["by_slug"].values())
+
+
+def get(slug):
+    """The organization with this slug, or None."""
+    return _load()["by_slug"].get(slug)
+
+
+def current():
+    """The organization the code runs for: the request's, or the one named by QUESTIONNAIRE_TENANT."""
+    org = _current.get()
+    if org is not None:
+        return org
+    slug = os.environ.get(ENV_VAR)
+    if not slug:
+        return DEFAULT
+    org = get(slug)
+    if org is None:
+        raise ImproperlyConfigured(f"{ENV_VAR}={slug} is not in settings.TENANTS.")
+    return org
+
+
+@contextmanager
+def activated(org):
+    """Run the block for `org` (an Organization or a slug; None for the default organization)."""
+    if not isinstance(org, Organization):
+        org = get(org) if org else DEFAULT
+    token = _current.set(org)
+    try:
+        yield org
+    finally:
+        _current.reset(token)
+
+
+def resolve(request):
+    """(organization, path prefix to strip or "") of a request; Http404 for an unknown /o/<slug>/."""
+    registry = _load()
+    domain, _ = split_domain_port(request.get_host())
+    org = registry["by_host"].get(domain)
+    if org is not None:
+        return org, ""
+    marker = f"/{settings.TENANT_PATH_PREFIX}/"
+    if request.path_info.startswith(marker):
+        slug = request.path_info[len(marker):].split("/", 1)[0]
+        org = registry["by_slug"].get(slug)
+        if org is None:
+            raise Http404("Unknown organization.")
+        return org, f"{marker}{slug}"
+    return DEFAULT, ""
+
+
+class TenantMiddleware:
+    """Run each request for its organization (see `resolve`); sets `request.organization`."""
+
+    def __init__(self, get_response):
+        if not settings.TENANTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        org, prefix = resolve(request)
+        request.organization = org
+        script_prefix = get_script_prefix()
+        if prefix:
+            request.path_info = request.path_info[len(prefix):] or "/"
+            set_script_prefix(script_prefix + prefix.lstrip("/") + "/")
+        token = _current.set(org)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            set_script_prefix(script_prefix)
@@ -0,0 +1,43 @@
+"""
+Test runner for the project.
+
+It keeps test runs out of var/: the file roots below point into a temporary directory
+removed after the run, so metrics snapshots, job files, profiles, published results and
+traffic traces written by tests never mix with a development server's.
+
+It also empties the per-process caches (core.coherence) before every test: a TestCase rolls
+its changes back, entity versions included, so a later test can reach the same versions
+and would otherwise be served values cached from rolled-back data.
+"""
+import tempfile
+import unittest
+from pathlib import Path
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from core import coherence
+
+VAR_SETTINGS = ("JOB_ARTIFACT_ROOT", "METRICS_ROOT", "PROFILE_ROOT", "RESULTS_PUBLISH_ROOT", "TRAFFIC_ROOT")
+
+
+class _ResetCaches:
+    def startTest(self, test):
+        coherence.reset()
+        super().startTest(test)
+
+
+class TestRunner(DiscoverRunner):
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+        return type(base.__name__, (_ResetCaches, base), {})
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._var = tempfile.TemporaryDirectory(prefix="questionnaire-test-")
+        root = Path(self._var.name)
+        self._var_settings = override_settings(**{name: root / name.lower() for name in VAR_SETTINGS})
+        self._var_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._var_settings.disable()
+        self._var.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1400 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.messages import get_messages
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections, router, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, set_script_prefix
+from django.utils import timezone
+
+from core import (
+    coherence, delegation, deletion, idempotency, jobs, loadtest, metrics, middleware, paper_votes, participation,
+    profiling, publishing, ranked, search, survey_import, tenancy, traffic, turnout,
+)
+from core.db_routers import ReplicaPinningMiddleware, replica_reads
+from core.management.commands.replay_traffic import Command as ReplayTraffic
+from core.models import (
+    Ballot, Delegation, EffectiveWeight, EntityVersion, Job, Option, Participation, Survey, Vote, Voter, VoteSubmission,
+)
+from core.startup_bench import STARTUP_BUDGET, measure, over_budget, temporary_database
+
+
+def voter_client(client, voter):
+    """Log `client` in as `voter` (EnterPass login stores these session keys)."""
+    session = client.session
+    session["voter_id"] = voter.pk
+    session["voter_full_name"] = voter.full_name
+    session.save()
+    return client
+
+
+def open_survey(hours=1, **kwargs):
+    survey = Survey.objects.create(question_text="Lunch?", end_date_time=timezone.now() + timedelta(hours=hours), **kwargs)
+    Option.objects.bulk_create([Option(survey=survey, option_text=text) for text in ("Yes", "No")])
+    return survey
+
+
+_migrated = {}  # slug -> a freshly migrated database file, copied instead of migrating again
+
+
+def add_organization(test, slug, **entry):
+    """Configure organization `slug` for the rest of `test`, with a freshly migrated SQLite database."""
+    alias = f"tenant_{slug}"
+    path = Path(test.enterContext(tempfile.TemporaryDirectory())) / f"{slug}.sqlite3"
+    test.enterContext(mock.patch.dict(settings.DATABASES, {alias: {**connections["default"].settings_dict, "NAME": str(path)}}))
+    test.enterContext(override_settings(TENANTS={**settings.TENANTS, slug: {"name": slug.title(), **entry}}))
+
+    def drop_connection():
+        connections[alias].close()
+        del connections[alias]
+
+    test.addCleanup(drop_connection)
+    if slug in _migrated:
+        path.write_bytes(_migrated[slug])
+    else:
+        call_command("migrate_tenants", slug, verbosity=0, stdout=StringIO())
+        connections[alias].close()
+        _migrated[slug] = path.read_bytes()
+    return tenancy.get(slug)
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """Cold start of the deployment entry points stays within the recorded module budget
+    (time budgets are machine-dependent: `python manage.py bench_startup` checks them)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.database = cls.enterClassContext(temporary_database())
+
+    def test_wsgi_cold_start_within_budget(self):
+        sample = measure("wsgi", database=self.database)
+        self.assertEqual(sample["status"], 200)
+        self.assertEqual(over_budget(sample, timings=False), [], f"budget {STARTUP_BUDGET}, measured {sample}")
+
+    def test_asgi_cold_start_within_budget(self):
+        sample = measure("asgi", database=self.database)
+        self.assertEqual(sample["status"], 200)
+        self.assertEqual(over_budget(sample, timings=False), [], f"budget {STARTUP_BUDGET}, measured {sample}")
+
+
+class IdempotentVoteTests(TestCase):
+    """A vote form posted twice (double tap, retry after a lost response) is recorded once."""
+
+    def setUp(self):
+        self.voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("2"))
+        self.survey = open_survey()
+        self.option = self.survey.options.first()
+        self.url = reverse("core:survey_vote", args=[self.survey.pk])
+        self.token = idempotency.new_token()
+        voter_client(self.client, self.voter)
+
+    def vote(self):
+        return self.client.post(self.url, {"option": self.option.pk, idempotency.FIELD: self.token})
+
+    def test_repeated_post_replays_the_recorded_outcome(self):
+        self.vote()
+        response = self.vote()
+        self.assertRedirects(response, reverse("core:survey_list"), fetch_redirect_response=False)
+        self.assertEqual(Vote.objects.filter(survey=self.survey, voter=self.voter).count(), 1)
+        self.assertEqual(VoteSubmission.objects.filter(token=self.token).count(), 1)
+        replayed = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertTrue(any("was not submitted again" in m for m in replayed), replayed)
+
+    def test_load_generators_post_the_rendered_token(self):
+        other = open_survey()
+        body = self.client.get(reverse("core:survey_list")).content
+        token = loadtest.vote_token(body, self.url)
+        self.assertEqual(loadtest.TOKEN_FIELD, idempotency.FIELD)
+        self.assertRegex(token, r"\A[0-9a-f]{32}\Z")
+        self.assertNotEqual(token, loadtest.vote_token(body, reverse("core:survey_vote", args=[other.pk])))
+        self.assertIsNone(loadtest.vote_token(body, reverse("core:survey_vote", args=[0])))
+        self.token = token
+        self.vote()
+        self.vote()  # vote_storm --double-submit
+        self.assertEqual(Vote.objects.filter(survey=self.survey, voter=self.voter).count(), 1)
+        self.assertEqual(VoteSubmission.objects.get(voter=self.voter).token, token)
+
+    def test_find_ignores_other_voters_and_expired_tokens(self):
+        self.vote()
+        other = Voter.objects.create(full_name="Bob", enter_pass="BO02", vote_weight=Decimal("1"))
+        self.assertIsNotNone(idempotency.find(self.voter, self.token))
+        self.assertIsNone(idempotency.find(other, self.token))
+        self.assertIsNone(idempotency.find(self.voter, None))
+        with override_settings(VOTE_TOKEN_TTL=0):
+            self.assertIsNone(idempotency.find(self.voter, self.token))
+
+    def test_reset_vote_forgets_its_submission(self):
+        self.vote()
+        staff = User.objects.create_user("admin", password="x", is_staff=True)
+        admin = self.client_class()
+        admin.force_login(staff)
+        admin.post(reverse("core:admin_vote_reset"), {"survey": self.survey.pk, "voter": self.voter.pk})
+        self.assertFalse(Vote.objects.filter(survey=self.survey, voter=self.voter).exists())
+        self.assertIsNone(idempotency.find(self.voter, self.token))
+        self.vote()  # the old form votes again instead of reporting the reset vote
+        self.assertEqual(Vote.objects.filter(survey=self.survey, voter=self.voter).count(), 1)
+
+
+class VoteResetTests(TestCase):
+    """Staff can reset any recorded vote, including one of a voter deactivated since."""
+
+    def setUp(self):
+        self.survey = open_survey()
+        self.voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("1"), is_active=False)
+        Vote.objects.create(survey=self.survey, voter=self.voter, option=self.survey.options.first(), recorded_weight=Decimal("1"))
+        self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+
+    def reset(self, voter):
+        return self.client.post(reverse("core:admin_vote_reset"), {"survey": self.survey.pk, "voter": voter.pk})
+
+    def test_lookup_offers_and_reset_accepts_a_deactivated_voter(self):
+        lookup = search.suggest_voters(self.survey, "ada")
+        self.assertEqual(lookup, [self.voter])
+        self.assertRedirects(self.reset(self.voter), reverse("core:admin_vote_reset"), fetch_redirect_response=False)
+        self.assertFalse(Vote.objects.filter(survey=self.survey).exists())
+
+    def test_voter_without_a_vote_is_rejected(self):
+        other = Voter.objects.create(full_name="Bob", enter_pass="BO02", vote_weight=Decimal("1"))
+        response = self.reset(other)
+        self.assertContains(response, "This user has not voted on the selected survey.")
+        self.assertTrue(Vote.objects.filter(survey=self.survey).exists())
+
+
+class ParticipationTests(TestCase):
+    """Participation rows follow votes as they are cast, reset and rebuilt."""
+
+    def setUp(self):
+        self.voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("2"))
+        self.surveys = [open_survey(), open_survey()]
+
+    def cast(self, survey, weight="2"):
+        return Vote.objects.create(survey=survey, voter=self.voter, option=survey.options.first(), recorded_weight=Decimal(weight))
+
+    def row(self):
+        return Participation.objects.filter(voter=self.voter).first()
+
+    def test_saved_votes_add_to_the_row(self):
+        first = self.cast(self.surveys[0])
+        last = self.cast(self.surveys[1], "3")
+        row = self.row()
+        self.assertEqual((row.votes_cast, row.weighted_total), (2, Decimal("5")))
+        self.assertEqual(row.last_vote_at, max(first.created_at, last.created_at))
+
+    def test_deleted_vote_refreshes_the_row(self):
+        self.cast(self.surveys[0])
+        later = self.cast(self.surveys[1], "3")
+        Vote.objects.filter(pk=later.pk).delete()
+        row = self.row()
+        self.assertEqual((row.votes_cast, row.weighted_total), (1, Decimal("2")))
+        Vote.objects.filter(voter=self.voter).delete()
+        self.assertIsNone(self.row())
+
+    def test_rebuild_matches_votes(self):
+        self.cast(self.surveys[0])
+        Vote.objects.bulk_create([Vote(survey=self.surveys[1], voter=self.voter, option=self.surveys[1].options.first(), recorded_weight=Decimal("3"))])
+        self.assertEqual(self.row().votes_cast, 1)  # bulk inserts bypass the signals
+        self.assertEqual(participation.rebuild(), 1)
+        self.assertEqual((self.row().votes_cast, self.row().weighted_total), (2, Decimal("5")))
+
+
+class TurnoutBucketTests(TestCase):
+    """Settled turnout buckets come from the cache; only newer votes are counted again."""
+
+    def setUp(self):
+        cache.clear()
+        self.survey = open_survey()
+        self.voters = Voter.objects.bulk_create([
+            Voter(full_name=f"Voter {i}", enter_pass=f"TV{i:02d}", vote_weight=Decimal("1")) for i in range(4)
+        ])
+
+    def cast(self, voter, minutes_ago):
+        vote = Vote.objects.create(survey=self.survey, voter=voter, option=self.survey.options.first(), recorded_weight=Decimal("1"))
+        Vote.objects.filter(pk=vote.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return vote
+
+    def counts(self):
+        return sum(votes for _, votes, _ in turnout.buckets(self.survey, "minute"))
+
+    def test_settled_buckets_are_cached_and_new_votes_counted(self):
+        self.cast(self.voters[0], 10)
+        self.assertEqual(self.counts(), 1)
+        self.cast(self.voters[1], 10)  # lands in a bucket the cache already settled
+        self.cast(self.voters[2], 0)
+        self.assertEqual(self.counts(), 2)
+        turnout.invalidate([self.survey.pk])
+        self.assertEqual(self.counts(), 3)
+
+    def test_deleted_vote_invalidates_the_timeline(self):
+        vote = self.cast(self.voters[0], 10)
+        self.cast(self.voters[1], 10)
+        self.assertEqual(self.counts(), 2)
+        vote.delete()
+        self.assertEqual(self.counts(), 1)
+        points = turnout.timeline(self.survey, "minute")
+        self.assertEqual(points[-1]["cumulative_votes"], 1)
+
+
+@override_settings(CLOSED_SURVEYS_PER_PAGE=2)
+class ClosedSurveyPagingTests(TestCase):
+    """The voter page lists closed surveys newest first, page by page on an (end, id) cursor."""
+
+    def setUp(self):
+        voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("1"))
+        voter_client(self.client, voter)
+        ended = timezone.now() - timedelta(hours=1)
+        ends = [ended, ended, ended, ended - timedelta(hours=1), ended + timedelta(minutes=30)]
+        self.closed = [Survey.objects.create(question_text=f"Closed {i}", end_date_time=end) for i, end in enumerate(ends)]
+        Survey.objects.create(question_text="Hidden", end_date_time=ended, is_published=False)
+
+    def test_pages_cover_every_closed_survey_once(self):
+        response = self.client.get(reverse("core:survey_list"))
+        seen = [survey.pk for survey, _ in response.context["closed_with_preview"]]
+        cursor = response.context["closed_cursor"]
+        while cursor is not None:
+            response = self.client.get(reverse("core:closed_surveys"), cursor)
+            self.assertEqual(response.status_code, 200)
+            seen += [survey.pk for survey, _ in response.context["closed_with_preview"]]
+            cursor = response.context["closed_cursor"]
+        expected = sorted(self.closed, key=lambda s: (s.end_date_time, s.pk), reverse=True)
+        self.assertEqual(seen, [s.pk for s in expected])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("core:closed_surveys"), {"end": "yesterday", "id": "1"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TrafficRecordingTests(TestCase):
+    """Recorded traces keep the request shape and a pseudonymous identity, nothing else."""
+
+    def setUp(self):
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(TRAFFIC_RECORD_ENABLED=True, TRAFFIC_ROOT=self.root))
+        self.addCleanup(self.close_log)
+        self.voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("1"))
+
+    @staticmethod
+    def close_log():
+        if traffic._log._fh is not None:
+            traffic._log._fh.close()
+        traffic._log._day = traffic._log._fh = None
+
+    def test_requests_are_recorded_pseudonymously(self):
+        client = voter_client(self.client_class(), self.voter)
+        client.get(reverse("core:survey_list"), {"q": "secret"})
+        client.get("/metrics/")  # excluded path
+        records = traffic.read_trace([self.root])
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual((record["m"], record["p"], record["v"], record["s"]), ("GET", reverse("core:survey_list"), "core:survey_list", 200))
+        self.assertTrue(record["id"].startswith(traffic.VOTER + ":"))
+        line = json.dumps(record)
+        self.assertNotIn("secret", line)
+        self.assertNotIn(self.voter.enter_pass, line)
+
+
+class ReplayPathTests(SimpleTestCase):
+    """Recorded paths under /o/<slug>/ are resolved inside their organization."""
+
+    def test_tenant_prefix_is_stripped(self):
+        path = reverse("core:survey_vote", args=[12])
+        self.assertEqual(ReplayTraffic._split(path), ("", path))
+        self.assertEqual(ReplayTraffic._split("/o/acme" + path), ("acme", path))
+        self.assertEqual(ReplayTraffic._pk("/o/acme" + path), 12)
+        self.assertEqual(ReplayTraffic._local("/o/acme" + path, "core:login"), "/o/acme" + reverse("core:login"))
+        self.assertIsNone(ReplayTraffic._pk("/o/acme/nowhere/"))
+
+
+class CoherenceBumpTests(TransactionTestCase):
+    """Every committed transaction that changes an entity advances its version exactly once."""
+
+    def votes_version(self):
+        return EntityVersion.objects.filter(name=coherence.VOTES).values_list("version", flat=True).first() or 0
+
+    def bump_in_transaction(self):
+        with transaction.atomic():
+            transaction.on_commit(lambda: None)  # another handler queued first (e.g. publishing)
+            coherence.bump(coherence.VOTES)
+            coherence.bump(coherence.VOTES)
+
+    def test_consecutive_transactions_each_bump(self):
+        start = self.votes_version()
+        self.bump_in_transaction()
+        self.assertEqual(self.votes_version(), start + 1)
+        self.bump_in_transaction()
+        self.assertEqual(self.votes_version(), start + 2)
+
+    def test_rolled_back_bump_is_not_remembered(self):
+        start = self.votes_version()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            coherence.bump(coherence.VOTES)
+            raise RuntimeError
+        self.assertEqual(self.votes_version(), start)
+        self.bump_in_transaction()
+        self.assertEqual(self.votes_version(), start + 1)
+
+    def test_bump_in_rolled_back_savepoint_is_redone(self):
+        start = self.votes_version()
+        with transaction.atomic():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                coherence.bump(coherence.VOTES)
+                raise RuntimeError
+            coherence.bump(coherence.VOTES)
+        self.assertEqual(self.votes_version(), start + 1)
+
+
+class RepublishOnCommitTests(TransactionTestCase):
+    """Pages queued for re-rendering are written when, and only when, their transaction commits."""
+
+    def setUp(self):
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(RESULTS_PUBLISH_ENABLED=True, RESULTS_PUBLISH_ROOT=root))
+        self.survey = open_survey(hours=-1)
+        publishing.unpublish_survey(self.survey.pk)  # published when saved closed
+
+    def test_rollback_then_commit_publishes(self):
+        path = publishing.results_path(self.survey.pk)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            publishing.republish_on_commit([self.survey.pk])
+            raise RuntimeError
+        self.assertFalse(path.exists())
+        with transaction.atomic():
+            transaction.on_commit(lambda: None)  # another handler queued first
+            publishing.republish_on_commit([self.survey.pk])
+            self.assertFalse(path.exists())
+        self.assertTrue(path.is_file())
+        self.assertTrue(publishing.index_path().is_file())
+
+    def test_one_callback_per_transaction(self):
+        other = open_survey(hours=-2)
+        publishing.unpublish_survey(other.pk)
+        with transaction.atomic():
+            publishing.republish_on_commit([self.survey.pk])
+            publishing.republish_on_commit([other.pk])
+            queued = [f for _, f, _ in transaction.get_connection().run_on_commit if isinstance(f, publishing._Republish)]
+            self.assertEqual(len(queued), 1)
+        self.assertTrue(publishing.results_path(other.pk).is_file())
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """With a second SQLite file as the replica: reads of decorated views go to it, writes and
+    sessions that just wrote go to the primary."""
+
+    def setUp(self):
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "replica.sqlite3"
+        self.voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("1"))
+        self.copied = open_survey(hours=-1)
+        target = sqlite3.connect(path)
+        connections["default"].connection.backup(target)  # "replication" up to here
+        target.close()
+        self.enterContext(mock.patch.dict(settings.DATABASES, {"replica": {**connections["default"].settings_dict, "NAME": str(path)}}))
+        self.addCleanup(self.drop_replica_connection)
+        self.fresh = open_survey(hours=-1)  # not replicated yet
+        voter_client(self.client, self.voter)
+
+    @staticmethod
+    def drop_replica_connection():
+        connections["replica"].close()
+        del connections["replica"]
+
+    def detail(self, survey):
+        return self.client.get(reverse("core:results_detail", args=[survey.pk])).status_code
+
+    def test_decorated_views_read_from_the_replica(self):
+        self.assertEqual(self.detail(self.copied), 200)
+        self.assertEqual(self.detail(self.fresh), 404)  # the replica lags
+
+    def test_write_pins_the_session_to_the_primary(self):
+        survey = open_survey()
+        survey_id = survey.pk
+        self.client.post(reverse("core:survey_vote", args=[survey_id]), {"option": survey.options.first().pk})
+        self.assertTrue(Vote.objects.using("default").filter(survey_id=survey_id, voter=self.voter).exists())
+        self.assertFalse(Vote.objects.using("replica").filter(survey_id=survey_id).exists())
+        self.assertEqual(self.detail(self.fresh), 200)  # reads its own writes while pinned
+
+    def test_writes_go_to_the_primary(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Survey), "replica")
+            self.assertEqual(router.db_for_write(Survey), "default")
+            survey = Survey.objects.create(question_text="Written", end_date_time=timezone.now())
+        self.assertEqual(survey._state.db, "default")
+        self.assertTrue(Survey.objects.using("default").filter(pk=survey.pk).exists())
+        self.assertFalse(Survey.objects.using("replica").filter(pk=survey.pk).exists())
+
+
+class ReplicaMiddlewareTests(SimpleTestCase):
+    def test_unused_without_a_replica(self):
+        self.assertNotIn("replica", settings.DATABASES)
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaPinningMiddleware(lambda request: None)
+
+
+class SearchIndexTests(TestCase):
+    """The FTS5 index follows saves and deletes and ranks prefix matches."""
+
+    def rows(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute(f"SELECT rowid, title, body FROM {search.TABLE} ORDER BY rowid")
+            return {rowid: (title, body) for rowid, title, body in cursor.fetchall()}
+
+    def found(self, query, kind=None):
+        return [(hit["kind"], hit["obj"].pk) for hit in search.search(query, kind=kind)[0]]
+
+    def test_rowids_split_voters_and_surveys(self):
+        voter = Voter.objects.create(full_name="Greta Lind", enter_pass="GL01", vote_weight=Decimal("1"))
+        survey = open_survey()
+        search.index_surveys([survey])  # options were bulk-created, as the admin views do
+        rows = self.rows()
+        self.assertEqual(rows[voter.pk * 2], ("Greta Lind", "GL01"))
+        self.assertEqual(rows[survey.pk * 2 + 1], ("Lunch?", "Yes No"))
+
+    def test_index_follows_saves_and_deletes(self):
+        voter = Voter.objects.create(full_name="Greta Lind", enter_pass="GL01", vote_weight=Decimal("1"))
+        voter.full_name = "Greta Berg"
+        voter.save()
+        self.assertEqual(self.found("berg"), [(search.VOTER, voter.pk)])
+        self.assertEqual(self.found("lind"), [])
+        survey = open_survey()
+        option = Option.objects.create(survey=survey, option_text="Pizza")
+        self.assertEqual(self.found("pizza"), [(search.SURVEY, survey.pk)])
+        option.delete()
+        self.assertEqual(self.found("pizza"), [])
+        voter.delete()
+        survey.delete()
+        self.assertEqual(self.rows(), {})
+
+    def test_prefix_matching_and_kind_filter(self):
+        voter = Voter.objects.create(full_name="Canteen Keeper", enter_pass="CK01", vote_weight=Decimal("1"))
+        survey = Survey.objects.create(question_text="Canteen opening hours", end_date_time=timezone.now())
+        self.assertEqual(sorted(self.found("cant")), sorted([(search.VOTER, voter.pk), (search.SURVEY, survey.pk)]))
+        self.assertEqual(self.found("can ope"), [(search.SURVEY, survey.pk)])  # every term, as a prefix
+        self.assertEqual(self.found("cant", kind=search.VOTER), [(search.VOTER, voter.pk)])
+        self.assertEqual(self.found("ck01"), [(search.VOTER, voter.pk)])
+        self.assertEqual(self.found("?!"), [])
+
+    def test_title_matches_rank_above_body_matches(self):
+        in_body = open_survey()
+        Option.objects.create(survey=in_body, option_text="Garden party")
+        in_title = Survey.objects.create(question_text="Garden budget", end_date_time=timezone.now())
+        self.assertEqual(self.found("garden"), [(search.SURVEY, in_title.pk), (search.SURVEY, in_body.pk)])
+
+    def test_pagination(self):
+        Voter.objects.bulk_create([Voter(full_name=f"Hugo {i}", enter_pass=f"HU{i:02d}", vote_weight=1) for i in range(5)])
+        search.rebuild()
+        first, has_next = search.search("hugo", per_page=3)
+        second, more = search.search("hugo", page=2, per_page=3)
+        self.assertEqual((len(first), has_next, len(second), more), (3, True, 2, False))
+        self.assertFalse({h["obj"].pk for h in first} & {h["obj"].pk for h in second})
+
+    def test_queries_use_the_index(self):
+        with connections["default"].cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN SELECT rowid FROM {search.TABLE} WHERE {search.TABLE} MATCH %s", ['"a"*'])
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+
+    def test_bench_runs_within_a_generous_budget(self):
+        out = StringIO()
+        call_command("bench_search", voters=2000, surveys=100, repeat=2, budget_ms=1000, stdout=out)
+        self.assertIn("EnterPass", out.getvalue())
+        self.assertFalse(Voter.objects.exists())  # synthetic data rolled back
+
+
+class ChunkedDeletionTests(TransactionTestCase):
+    """Voters and surveys are deleted chunk by chunk, each chunk committed on its own, and
+    everything derived from them follows."""
+
+    def setUp(self):
+        cache.clear()
+        self.surveys = [open_survey(), open_survey()]
+        self.voters = Voter.objects.bulk_create([
+            Voter(full_name=f"Voter {i}", enter_pass=f"DV{i:02d}", vote_weight=Decimal("1")) for i in range(5)
+        ])
+        search.rebuild()
+        for survey in self.surveys:
+            for voter in self.voters[:4]:
+                Vote.objects.create(survey=survey, voter=voter, option=survey.options.first(), recorded_weight=Decimal("1"))
+        self.progress = []
+
+    def versions(self):
+        return dict(EntityVersion.objects.values_list("name", "version"))
+
+    def test_voters_are_deactivated_and_deleted_in_chunks(self):
+        doomed = [v.pk for v in self.voters[:2]]
+        delegate = self.voters[4]
+        Delegation.objects.create(delegator=self.voters[0], delegate=delegate)
+        delegation.rebuild()
+        self.assertEqual(delegation.weight_for(delegate)[0], Decimal("2"))
+        turnout.buckets(self.surveys[0], "minute")  # cached with 4 votes
+        before = self.versions()
+
+        def progress(done, total):
+            self.progress.append((done, total))
+            self.assertFalse(Voter.objects.filter(pk__in=doomed, is_active=True).exists())
+
+        self.assertEqual(deletion.delete_voters(doomed, progress=progress, chunk_size=1), (2, 4))
+        self.assertGreater(len(self.progress), 3)  # one step per chunk
+        self.assertEqual(self.progress[-1], (6, 6))
+        self.assertFalse(Voter.objects.filter(pk__in=doomed).exists())
+        self.assertFalse(Vote.objects.filter(voter_id__in=doomed).exists())
+        self.assertFalse(Participation.objects.filter(voter_id__in=doomed).exists())
+        self.assertFalse(EffectiveWeight.objects.filter(voter_id__in=doomed).exists())
+        self.assertEqual(delegation.weight_for(delegate), (Decimal("1"), None))
+        self.assertEqual(len(search.search("voter", kind=search.VOTER)[0]), 3)
+        self.assertEqual(sum(n for _, n, _ in turnout.buckets(self.surveys[0], "minute")), 2)
+        after = self.versions()
+        self.assertGreater(after[coherence.VOTERS], before.get(coherence.VOTERS, 0))
+        self.assertGreater(after[coherence.VOTES], before.get(coherence.VOTES, 0))
+
+    def test_surveys_are_unpublished_and_deleted_in_chunks(self):
+        survey = self.surveys[0]
+        search.index_surveys(self.surveys)
+        voter = self.voters[0]
+        self.assertEqual(Participation.objects.get(voter=voter).votes_cast, 2)
+        before = self.versions()
+
+        def progress(done, total):
+            self.progress.append((done, total))
+            self.assertFalse(Survey.objects.filter(pk=survey.pk, is_published=True).exists())
+
+        self.assertEqual(deletion.delete_surveys([survey.pk], progress=progress, chunk_size=3), (1, 4))
+        self.assertEqual(self.progress[-1], (7, 7))  # 4 votes, 2 options, the survey
+        self.assertFalse(Survey.objects.filter(pk=survey.pk).exists())
+        self.assertFalse(Option.objects.filter(survey_id=survey.pk).exists())
+        self.assertEqual(Participation.objects.get(voter=voter).votes_cast, 1)
+        self.assertEqual([h["obj"].pk for h in search.search("lunch", kind=search.SURVEY)[0]], [self.surveys[1].pk])
+        self.assertEqual(turnout.buckets(survey, "minute"), [])
+        after = self.versions()
+        self.assertGreater(after[coherence.SURVEYS], before.get(coherence.SURVEYS, 0))
+        self.assertGreater(after[coherence.VOTES], before.get(coherence.VOTES, 0))
+
+    def test_missing_ids_are_skipped(self):
+        self.assertEqual(deletion.delete_voters([10 ** 6]), (0, 0))
+        self.assertEqual(deletion.delete_surveys([10 ** 6]), (0, 0))
+
+
+class PaperVoteImportTests(TestCase):
+    """Paper sheets are checked row by row; the insert reports exactly the rows it wrote."""
+
+    def setUp(self):
+        self.survey = open_survey()
+        self.yes, self.no = self.survey.options.order_by("pk")
+        self.ada = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("2"))
+        self.bob = Voter.objects.create(full_name="Bob", enter_pass="BO02", vote_weight=Decimal("1"))
+        self.cid = Voter.objects.create(full_name="Cid", enter_pass="CI03", vote_weight=Decimal("3"))
+        Delegation.objects.create(delegator=self.cid, delegate=self.bob)
+        delegation.rebuild()
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "paper.csv"
+        self.path.write_text("\n".join([
+            "EnterPass,Survey ID,Option,Weight",
+            f"AD01,{self.survey.pk},Yes,",
+            f"bo02,{self.survey.pk},{self.no.pk},4",
+            f"ZZ99,{self.survey.pk},Yes,",
+            f"CI03,{self.survey.pk},Yes,",
+            f"AD01,{self.survey.pk},No,",
+            f"BO02,{self.survey.pk},Maybe,",
+        ]) + "\n", encoding="utf-8")
+
+    def outcomes(self, report):
+        return [(line, status, reason) for line, _, _, _, status, reason in report]
+
+    def test_report_and_recorded_weights(self):
+        report, accepted = paper_votes.ingest(paper_votes.read_rows(self.path))
+        self.assertEqual(accepted, 2)
+        self.assertEqual(self.outcomes(report), [
+            (2, paper_votes.ACCEPTED, ""),
+            (3, paper_votes.ACCEPTED, ""),
+            (4, paper_votes.REJECTED, "unknown voter"),
+            (5, paper_votes.REJECTED, "voter has delegated their vote on this survey"),
+            (6, paper_votes.REJECTED, "duplicate of row 2"),
+            (7, paper_votes.REJECTED, "option is not part of this survey"),
+        ])
+        votes = {v.voter_id: (v.option_id, v.recorded_weight, v.source) for v in Vote.objects.filter(survey=self.survey)}
+        self.assertEqual(votes, {
+            self.ada.pk: (self.yes.pk, Decimal("2"), Vote.PAPER),
+            self.bob.pk: (self.no.pk, Decimal("4"), Vote.PAPER),  # own 1 + Cid's 3
+        })
+        self.assertEqual(Participation.objects.get(voter=self.bob).weighted_total, Decimal("4"))
+
+    def test_reimport_inserts_nothing(self):
+        paper_votes.ingest(paper_votes.read_rows(self.path))
+        report, accepted = paper_votes.ingest(paper_votes.read_rows(self.path))
+        self.assertEqual(accepted, 0)
+        self.assertEqual(Vote.objects.filter(survey=self.survey).count(), 2)
+        self.assertEqual(self.outcomes(report)[:2], [
+            (2, paper_votes.REJECTED, "voter already voted on this survey"),
+            (3, paper_votes.REJECTED, "voter already voted on this survey"),
+        ])
+
+    def test_row_that_lost_a_race_is_rejected(self):
+        rows = paper_votes.read_rows(self.path)
+        real_load = paper_votes._load_maps
+
+        def load_then_vote_online(rows):
+            maps = real_load(rows)
+            Vote.objects.create(survey=self.survey, voter=self.ada, option=self.no, recorded_weight=Decimal("2"))
+            return maps
+
+        with mock.patch.object(paper_votes, "_load_maps", load_then_vote_online):
+            report, accepted = paper_votes.ingest(rows)
+        self.assertEqual(accepted, 1)
+        self.assertEqual(self.outcomes(report)[0], (2, paper_votes.REJECTED, "voter already voted on this survey (online, during the import)"))
+        self.assertEqual(Vote.objects.get(survey=self.survey, voter=self.ada).source, Vote.ONLINE)
+
+    def test_insert_returns_only_new_rows(self):
+        now = timezone.now()
+        rows = [(self.survey.pk, self.ada.pk, self.yes.pk, Decimal("2")), (self.survey.pk, self.bob.pk, self.yes.pk, Decimal("1"))]
+        self.assertEqual(paper_votes._insert(rows[:1], now), {(self.survey.pk, self.ada.pk)})
+        self.assertEqual(paper_votes._insert(rows, now), {(self.survey.pk, self.bob.pk)})
+
+
+class SurveyImportTests(TestCase):
+    """Every file format yields the same definitions; one bad survey blocks the whole file."""
+
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+
+    def load(self, name, content):
+        path = self.dir / name
+        path.write_bytes(content) if isinstance(content, bytes) else path.write_text(content, encoding="utf-8")
+        with path.open("rb") as fh:
+            return survey_import.load(fh, name)
+
+    def test_json(self):
+        (question, end, published, options), = self.load("s.json", json.dumps({"surveys": [
+            {"question": "Lunch?", "options": ["Pizza", "Salad"], "end": "2026-11-01 18:00", "published": "no"},
+        ]}))
+        self.assertEqual((question, published, options), ("Lunch?", False, ["Pizza", "Salad"]))
+        self.assertEqual(timezone.localtime(end).replace(tzinfo=None), datetime(2026, 11, 1, 18, 0))
+
+    def test_yaml_dates_and_default_published(self):
+        definitions = self.load("s.yaml", "\n".join([
+            "- question: Day only",
+            "  options: [A, B]",
+            "  end: 2026-11-01",
+            "- question: Date and time",
+            "  options: [A, B]",
+            "  end: 2026-11-01 18:00:00",
+            "  published: false",
+        ]))
+        ends = [timezone.localtime(end).replace(tzinfo=None) for _, end, _, _ in definitions]
+        self.assertEqual(ends, [datetime(2026, 11, 2), datetime(2026, 11, 1, 18, 0)])
+        self.assertEqual([published for _, _, published, _ in definitions], [True, False])
+
+    def test_xlsx(self):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        wb.active.append(["Question", "End date/time", "Published", "Option 1", "Option 2", "Option 3"])
+        wb.active.append(["Budget?", datetime(2026, 11, 1, 18, 0), None, "Yes", "No", None])
+        wb.active.append([None, None, None, None, None, None])
+        wb.active.append(["Venue?", "2026-11-03", "0", "Hall", "Park", "Online"])
+        wb.save(self.dir / "s.xlsx")
+        with (self.dir / "s.xlsx").open("rb") as fh:
+            definitions = survey_import.load(fh, "s.xlsx")
+        self.assertEqual([(q, p, o) for q, _, p, o in definitions], [
+            ("Budget?", True, ["Yes", "No"]),
+            ("Venue?", False, ["Hall", "Park", "Online"]),
+        ])
+        created = survey_import.create_surveys(definitions)
+        self.assertEqual([s.options.count() for s in created], [2, 3])
+        self.assertTrue(Survey.objects.get(question_text="Budget?").is_published)
+
+    def test_every_problem_is_reported_and_nothing_is_created(self):
+        content = json.dumps([
+            {"question": "Fine", "options": ["A", "B"], "end": "2026-11-01"},
+            {"question": "", "options": ["A"], "end": "soon"},
+            {"question": "Dupes", "options": ["A", "A"], "end": "2026-11-01", "published": "maybe"},
+            "not an object",
+        ])
+        before = Survey.objects.count()
+        self.client.force_login(User.objects.create_user("staff", password="x", is_staff=True))
+        response = self.client.post(
+            reverse("core:admin_survey_import"), {"file": SimpleUploadedFile("s.json", content.encode())},
+        )
+        self.assertContains(response, "Survey 3 (Dupes): published must be true or false")
+        self.assertEqual(Survey.objects.count(), before)
+        with self.assertRaises(survey_import.ImportErrors) as caught:
+            self.load("s.json", content)
+        self.assertEqual(caught.exception.errors, [
+            "Survey 2: question is required; end must be a date/time such as 2026-11-01 18:00; at least 2 options are required.",
+            "Survey 3 (Dupes): published must be true or false; options must be distinct.",
+            "Survey 4: expected an object with question, options and end.",
+        ])
+
+    def test_unreadable_files(self):
+        for name, content, message in [
+            ("s.csv", "", "Unsupported file type '.csv'"),
+            ("s.json", "{", "Could not parse the file"),
+            ("s.json", '{"items": []}', "Expected a list of surveys"),
+            ("s.json", "[]", "The file contains no surveys."),
+        ]:
+            with self.subTest(name=name, content=content), self.assertRaises(survey_import.ImportErrors) as caught:
+                self.load(name, content)
+            self.assertTrue(caught.exception.errors[0].startswith(message))
+
+
+class ProfilerTests(TestCase):
+    """Only staff requests carrying the parameter or the signed cookie are profiled, with their SQL."""
+
+    def setUp(self):
+        root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROFILER_ENABLED=True, PROFILE_ROOT=Path(root)))
+        self.staff = User.objects.create_user("admin", password="x", is_staff=True)
+        open_survey()
+
+    def profiled(self, response):
+        profile_id = response.get("X-Profile-Id")
+        return profile_id and profiling.load_profile(profile_id)
+
+    def test_disabled_middleware_is_not_installed(self):
+        with override_settings(PROFILER_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilerMiddleware(lambda request: None)
+
+    def test_staff_parameter_captures_sql(self):
+        self.client.force_login(self.staff)
+        self.assertIsNone(self.profiled(self.client.get(reverse("core:admin_survey_list"))))
+        profile = self.profiled(self.client.get(reverse("core:admin_survey_list"), {profiling.PROFILE_PARAM: "1"}))
+        self.assertEqual((profile["status"], profile["user"]), (200, "admin"))
+        self.assertEqual(profile["sql_count"], len(profile["queries"]))
+        self.assertTrue(any("core_survey" in q["sql"] and q["alias"] == "default" for q in profile["queries"]))
+        self.assertTrue(profile["by_cumtime"])
+        self.assertEqual(profile["tree"][0]["depth"], 0)  # the middleware chain is the root
+        self.assertEqual([p["id"] for p in profiling.list_profiles()], [profile["id"]])
+
+    def test_voters_and_forged_cookies_are_not_profiled(self):
+        voter = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=1)
+        response = voter_client(self.client, voter).get(reverse("core:survey_list"), {profiling.PROFILE_PARAM: "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.profiled(response))
+        self.client.force_login(self.staff)
+        self.client.cookies[profiling.COOKIE_NAME] = "1"
+        self.assertIsNone(self.profiled(self.client.get(reverse("core:admin_survey_list"))))
+
+    def test_signed_cookie_profiles_every_request(self):
+        self.client.force_login(self.staff)
+        self.client.post(reverse("core:admin_profile_toggle"))
+        self.assertIsNotNone(self.profiled(self.client.get(reverse("core:admin_survey_list"))))
+        self.client.post(reverse("core:admin_profile_toggle"))
+        self.assertIsNone(self.profiled(self.client.get(reverse("core:admin_survey_list"))))
+
+
+class MetricsTests(TestCase):
+    """Snapshots of all processes are summed; exited ones are folded into retired.json."""
+
+    def setUp(self):
+        self.root = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(METRICS_ROOT=self.root, METRICS_TOKEN="s3cret"))
+        self.stale = time.time() - settings.METRICS_STALE_SECONDS - 60
+
+    def snapshot(self, name, votes, in_progress, mtime=None):
+        path = self.root / f"{name}.json"
+        path.write_text(json.dumps({
+            "qm_votes_total": [[["acme", "survey", "recorded"], votes]],
+            "qm_http_requests_in_progress": [[["acme"], in_progress]],
+            "qm_results_build_seconds": [[["acme", "results"], [[1] + [0] * 11, 0.004]]],
+            "qm_logins_total": [[["acme"], 99]],  # written without the result label: skipped
+        }))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        return process.pid
+
+    def acme(self, merged):
+        return (
+            merged["qm_votes_total"].get(("acme", "survey", "recorded")),
+            merged["qm_http_requests_in_progress"].get(("acme",)),
+            merged["qm_results_build_seconds"].get(("acme", "results")),
+            [key for key in merged["qm_logins_total"] if key[0] == "acme"],
+        )
+
+    def test_snapshots_are_merged(self):
+        self.snapshot(f"{os.getpid()}-aaaaaaaa", 2, 1)
+        self.snapshot(f"{os.getpid()}-bbbbbbbb", 3, 4)
+        self.snapshot(f"{os.getpid()}-cccccccc", 5, 7, mtime=self.stale)  # silent, but alive
+        votes, in_progress, latency, logins = self.acme(metrics.collect())
+        self.assertEqual((votes, in_progress, logins), (10, 5, []))
+        self.assertEqual(latency, [[3] + [0] * 11, 0.012])
+        self.assertEqual(len(list(self.root.glob("*.json"))), 4)  # three written here + this process
+
+    def test_exited_processes_are_folded(self):
+        dead = self.snapshot(f"{self.dead_pid()}-dddddddd", 5, 7, mtime=self.stale)
+        recent = self.snapshot(f"{self.dead_pid()}-eeeeeeee", 1, 2)
+        self.assertEqual(self.acme(metrics.collect())[:2], (6, 2))
+        self.assertFalse(dead.exists())
+        self.assertTrue(recent.exists())
+        retired = json.loads((self.root / "retired.json").read_text())
+        self.assertEqual(retired["qm_votes_total"], [[["acme", "survey", "recorded"], 5]])
+        self.assertNotIn("qm_http_requests_in_progress", retired)
+        self.snapshot(f"{self.dead_pid()}-ffffffff", 4, 1, mtime=self.stale)
+        self.assertEqual(metrics.retire(time.time() - settings.METRICS_STALE_SECONDS), 1)
+        self.assertEqual(self.acme(metrics.collect())[:2], (10, 2))
+
+    def test_scrape_needs_the_token_or_staff(self):
+        self.snapshot(f"{os.getpid()}-aaaaaaaa", 2, 1)
+        url = reverse("core:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Basic s3cret").status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertContains(response, 'qm_votes_total{organization="acme",kind="survey",result="recorded"} 2')
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+            self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class FakeBrotli:
+    """Stands in for the optional brotli package; zlib streams, so the output can be checked."""
+
+    @staticmethod
+    def compress(data, quality):
+        return zlib.compress(data)
+
+    class Compressor:
+        def __init__(self, quality):
+            self.stream = zlib.compressobj()
+
+        def process(self, data):
+            return self.stream.compress(data)
+
+        def flush(self):
+            return self.stream.flush(zlib.Z_SYNC_FLUSH)
+
+        def finish(self):
+            return self.stream.flush()
+
+
+class CompressionTests(SimpleTestCase):
+    """HTML is always gzipped (BREACH padding); other content uses brotli when accepted and installed."""
+
+    body = b'{"votes": [' + b", ".join(b'{"option": %d}' % i for i in range(200)) + b"]}"
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(middleware, "_brotli", FakeBrotli))
+
+    def compress(self, response, accept="gzip, deflate, br"):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept)
+        return middleware.CompressionMiddleware(lambda request: response)(request)
+
+    def content(self, response):
+        return b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_html_is_gzipped(self):
+        html = b"<html><body>" + b"<p>Lunch?</p>" * 100 + b"</body></html>"
+        response = self.compress(HttpResponse(html, content_type="text/html; charset=utf-8"))
+        self.assertEqual((response["Content-Encoding"], response["Vary"]), ("gzip", "Accept-Encoding"))
+        self.assertEqual(gzip.decompress(response.content), html)
+
+    def test_other_content_uses_brotli(self):
+        response = HttpResponse(self.body, content_type="application/json")
+        response["ETag"] = '"abc"'
+        response = self.compress(response)
+        self.assertEqual((response["Content-Encoding"], response["Vary"], response["ETag"]), ("br", "Accept-Encoding", 'W/"abc"'))
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(zlib.decompress(response.content), self.body)
+
+    def test_streaming_brotli(self):
+        chunks = [self.body[i:i + 500] for i in range(0, len(self.body), 500)]
+        response = self.compress(StreamingHttpResponse(iter(chunks), content_type="text/csv"))
+        self.assertEqual((response["Content-Encoding"], response["Vary"]), ("br", "Accept-Encoding"))
+        self.assertFalse(response.has_header("Content-Length"))
+        self.assertEqual(zlib.decompress(self.content(response)), self.body)
+
+    def test_gzip_without_brotli(self):
+        for accept, brotli in [("gzip", FakeBrotli), ("gzip, br", False)]:
+            with self.subTest(accept=accept), mock.patch.object(middleware, "_brotli", brotli):
+                response = self.compress(HttpResponse(self.body, content_type="application/json"), accept)
+                self.assertEqual(response["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_left_alone(self):
+        encoded = HttpResponse(b"x" * 500, content_type="application/json")
+        encoded["Content-Encoding"] = "identity-ish"
+        cases = [
+            ("too small", HttpResponse(b'{"ok": true}', content_type="application/json"), "gzip, br"),
+            ("already encoded", encoded, "gzip, br"),
+            ("not accepted", HttpResponse(self.body, content_type="application/json"), "identity"),
+        ]
+        for label, response, accept in cases:
+            with self.subTest(label):
+                content = response.content
+                response = self.compress(response, accept)
+                self.assertEqual(response.content, content)
+                self.assertNotIn(response.get("Content-Encoding"), ("br", "gzip"))
+
+
+class PageSizesTests(TestCase):
+    def test_report_leaves_the_database_unchanged(self):
+        Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=1)
+        before = (Voter.objects.count(), Survey.objects.count(), User.objects.count())
+        out = StringIO()
+        with mock.patch.object(middleware, "_brotli", FakeBrotli):
+            call_command("page_sizes", "--voters", "30", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ["Page", "identity", "gzip", "br"])
+        sizes = {line.split()[0]: [int(n.replace(",", "")) for n in line.split()[1:]] for line in lines[1:]}
+        self.assertEqual(set(sizes), {"admin_user_list", "admin_survey_votes", "survey_list", "results_detail"})
+        self.assertTrue(all(identity > gzipped for identity, gzipped, _ in sizes.values()))
+        self.assertEqual((Voter.objects.count(), Survey.objects.count(), User.objects.count()), before)
+
+
+class InlinePool:
+    """ProcessPoolExecutor stand-in for run_jobs: runs each job when it is submitted."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+class JobTests(TransactionTestCase):
+    """Claiming, interrupted jobs, the export/import tasks and run_jobs' turns across organizations."""
+
+    def setUp(self):
+        self.ada = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("2"))
+        self.bob = Voter.objects.create(full_name="Bob", enter_pass="BO02", vote_weight=Decimal("1"))
+
+    def run_job(self, kind, params=None):
+        job = jobs.enqueue(kind, params)
+        self.assertEqual(jobs.claim_next(), job.pk)
+        jobs.execute(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def workbook(self, job):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(jobs.artifact_root() / job.artifact, read_only=True)
+        return {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+
+    def upload(self, rows):
+        import openpyxl
+
+        wb = openpyxl.Workbook()
+        for row in rows:
+            wb.active.append(row)
+        name = "uploads/users.xlsx"
+        (jobs.artifact_root() / "uploads").mkdir(parents=True, exist_ok=True)
+        wb.save(jobs.artifact_root() / name)
+        return {"upload": name}
+
+    def test_claim_takes_each_job_once_oldest_first(self):
+        first, second = jobs.enqueue("export_users"), jobs.enqueue("export_users")
+        self.assertEqual([jobs.claim_next(), jobs.claim_next(), jobs.claim_next()], [first.pk, second.pk, None])
+        self.assertEqual(set(Job.objects.values_list("status", flat=True)), {Job.RUNNING})
+        with self.assertRaises(ValueError):
+            jobs.enqueue("no_such_task")
+
+    def test_fail_orphaned_only_touches_running_jobs(self):
+        running, queued = jobs.enqueue("export_users"), jobs.enqueue("export_results")
+        Job.objects.filter(pk=running.pk).update(status=Job.RUNNING)
+        self.assertEqual(jobs.fail_orphaned(), 1)
+        running.refresh_from_db()
+        self.assertEqual((running.status, running.message), (Job.FAILED, "Worker stopped before the job finished."))
+        self.assertIsNotNone(running.finished_at)
+        self.assertEqual(Job.objects.get(pk=queued.pk).status, Job.QUEUED)
+
+    def test_failing_task_is_recorded(self):
+        with mock.patch.object(sys, "stderr", StringIO()):  # execute() prints the traceback
+            job = self.run_job("import_users", self.upload([["Name", "Weight"], ["Cid", 1]]))
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.message, "ValueError: Header row must contain 'Full Name' and 'Vote Weight'.")
+
+    def test_export_users(self):
+        Voter.objects.filter(pk=self.bob.pk).update(is_active=False)
+        job = self.run_job("export_users")
+        self.assertEqual((job.status, job.message, job.progress, job.total), (Job.DONE, "Exported 2 user(s).", 2, 2))
+        self.assertEqual(self.workbook(job)["Users"], [
+            ["Full Name", "EnterPass", "Vote Weight", "Status"],
+            ["Ada", "AD01", 2, "Active"],
+            ["Bob", "BO02", 1, "Inactive"],
+        ])
+
+    def test_export_results(self):
+        survey = open_survey()
+        yes, no = survey.options.order_by("pk")
+        Vote.objects.create(survey=survey, voter=self.ada, option=yes, recorded_weight=Decimal("2"))
+        Vote.objects.create(survey=survey, voter=self.bob, option=yes, recorded_weight=Decimal("1"))
+        job = self.run_job("export_results")
+        self.assertEqual(job.message, "Exported 1 survey(s), 2 vote(s).")
+        sheets = self.workbook(job)
+        self.assertEqual([row[4:] for row in sheets["Summary"][1:]], [["Yes", 2, 3], ["No", 0, 0]])
+        self.assertEqual([row[2:5] for row in sheets["Votes"][1:]], [["Ada", "Yes", 2], ["Bob", "Yes", 1]])
+
+    def test_import_users_in_batches(self):
+        params = self.upload([
+            ["Full Name", "EnterPass", "Vote Weight", "Status"],
+            ["Ada Lovelace", "ad01", 3, "Active"],   # updates Ada
+            ["Cid", "CI03", 1, "Active"],
+            ["Dee", "", 1, "Inactive"],              # generated EnterPass
+            [None, None, None, None],
+            ["Eve", "CI03", 2, "Active"],            # repeats a code created above: gets its own
+            ["Fay", "FA05", "lots", "Active"],
+            ["Bob", "BO02", 1, "Inactive"],          # updates Bob
+        ])
+        with mock.patch.object(jobs, "IMPORT_BATCH_SIZE", 2), CaptureQueriesContext(connections["default"]) as queries:
+            job = self.run_job("import_users", params)
+        self.assertEqual(job.message, "Created 3, updated 2 user(s). Skipped 1: row 7: invalid vote weight")
+        voters = {v.full_name: v for v in Voter.objects.all()}
+        self.assertEqual(set(voters), {"Ada Lovelace", "Bob", "Cid", "Dee", "Eve"})
+        self.assertEqual((voters["Ada Lovelace"].pk, voters["Ada Lovelace"].vote_weight), (self.ada.pk, Decimal("3")))
+        self.assertFalse(voters["Bob"].is_active or voters["Dee"].is_active)
+        self.assertEqual(voters["Cid"].enter_pass, "CI03")
+        self.assertEqual(len({v.enter_pass for v in voters.values()}), 5)
+        self.assertEqual([hit["obj"].pk for hit in search.search("Lovelace")[0]], [self.ada.pk])
+        # EnterPass lookups are per batch, never a scan of every voter
+        voter_reads = [q["sql"] for q in queries if q["sql"].startswith('SELECT "core_voter"')]
+        self.assertTrue(voter_reads and all(" WHERE " in sql for sql in voter_reads))
+
+    def test_run_jobs_takes_organizations_in_turn(self):
+        acme = add_organization(self, "acme")
+        default_jobs = [jobs.enqueue("export_users").pk for _ in range(2)]
+        with tenancy.activated(acme):
+            Voter.objects.create(full_name="Acme voter", enter_pass="AC01", vote_weight=1)
+            acme_jobs = [jobs.enqueue("export_users").pk for _ in range(2)]
+            interrupted = jobs.enqueue("export_users")
+            Job.objects.filter(pk=interrupted.pk).update(status=Job.RUNNING)
+        out = StringIO()
+        with mock.patch.dict(os.environ, {}), mock.patch("core.management.commands.run_jobs.ProcessPoolExecutor", InlinePool):
+            os.environ.pop(tenancy.ENV_VAR, None)
+            call_command("run_jobs", "--once", "--workers", "1", stdout=out)
+        started = [line.split()[2:] for line in out.getvalue().splitlines() if line.startswith("  started")]
+        self.assertEqual(started, [
+            [f"#{default_jobs[0]}", "of", "the", "default", "organization"], [f"#{acme_jobs[0]}", "of", "acme"],
+            [f"#{default_jobs[1]}", "of", "the", "default", "organization"], [f"#{acme_jobs[1]}", "of", "acme"],
+        ])
+        self.assertIn("Marked 1 interrupted job(s) of acme as failed.", out.getvalue())
+        self.assertEqual(set(Job.objects.values_list("status", flat=True)), {Job.DONE})
+        with tenancy.activated(acme):
+            self.assertEqual(Job.objects.get(pk=interrupted.pk).status, Job.FAILED)
+            job = Job.objects.get(pk=acme_jobs[0])
+            self.assertEqual(job.message, "Exported 1 user(s).")
+            self.assertTrue((jobs.artifact_root() / job.artifact).is_file())
+            self.assertEqual(jobs.artifact_root().parts[-2:], ("tenants", "acme"))
+
+
+class RankedTallyTests(TestCase):
+    """Instant runoff with weights in cents: transfers, exhausted ballots and the tie-break order."""
+
+    def summary(self, result, option_ids):
+        """Per round: ({option id: cents}, eliminated id, {option id: cents received}, exhausted cents)."""
+        return [
+            (
+                {option_ids[i]: w for i, w in r.weights.items()},
+                option_ids[r.eliminated] if r.eliminated is not None else None,
+                {option_ids[i]: w for i, w in r.transfers.items()},
+                r.exhausted_weight,
+            )
+            for r in result.rounds
+        ]
+
+    def test_transfers_and_exhaustion(self):
+        a, b, c, d = options = [10, 20, 30, 40]
+        result = ranked.tally([
+            ([a, b], 400, 4),
+            ([b, a], 300, 3),
+            ([c, b], 150, 1),
+            (ranked.encode_ranking([c, b]), 100, 1),  # same ranking, encoded: merged with the line above
+            ([d], 100, 1),                            # exhausted once d is out
+            ([99, c], 50, 1),                         # deleted option skipped: counts for c
+        ], options)
+        self.assertEqual(self.summary(result, options), [
+            ({a: 400, b: 300, c: 300, d: 100}, d, {}, 0),
+            ({a: 400, b: 300, c: 300}, c, {b: 250}, 100),
+            ({a: 400, b: 550}, None, {}, 150),
+        ])
+        self.assertEqual((result.winner, result.ballots), (b, 11))
+        self.assertEqual(result.rounds[-1].counts, {0: 4, 1: 5})
+
+    def test_tie_breaks(self):
+        p, q, r, s = options = [1, 2, 3, 4]
+        # q and r tie in round 2 on weight and count; r was weaker in round 1 and goes first.
+        result = ranked.tally([([p], 300, 3), ([q], 200, 2), ([r, q], 150, 1), ([s, r], 50, 1)], options)
+        self.assertEqual([options[x.eliminated] for x in result.rounds if x.eliminated is not None], [s, r])
+        self.assertEqual(result.winner, q)
+        # Equal weight: fewer votes is weaker.
+        result = ranked.tally([([p], 300, 3), ([q, p], 200, 2), ([r, p], 200, 1)], options[:3])
+        self.assertEqual(result.rounds[0].eliminated, options.index(r))
+        # Equal in everything: the later-created option goes first.
+        result = ranked.tally([([p], 200, 1), ([q], 100, 1), ([r, p], 100, 1)], options[:3])
+        self.assertEqual((result.rounds[0].eliminated, result.winner), (options.index(r), p))
+
+    def test_no_votes(self):
+        result = ranked.tally([], [1, 2])
+        self.assertEqual((result.winner, len(result.rounds), result.rounds[0].weights), (None, 1, {0: 0, 1: 0}))
+
+    def test_votes_are_tallied_from_the_database(self):
+        survey = Survey.objects.create(question_text="Venue?", kind=Survey.RANKED, end_date_time=timezone.now() + timedelta(hours=1))
+        hall, park, online = Option.objects.bulk_create([Option(survey=survey, option_text=t) for t in ("Hall", "Park", "Online")])
+        ballots = [("A", 3, [online, park]), ("B", 2, [hall]), ("C", 2, [park, hall])]
+        for name, weight, ranking in ballots:
+            voter = Voter.objects.create(full_name=name, enter_pass=f"{name}001"[:4], vote_weight=weight)
+            form = {f"rank_{i}": o.pk for i, o in enumerate(ranking, 1)}
+            self.assertEqual(voter_client(self.client, voter).post(reverse("core:survey_vote", args=[survey.pk]), form).status_code, 302)
+        vote = Vote.objects.get(voter__full_name="A")
+        self.assertEqual((vote.option_id, list(ranked.decode_ranking(vote.ranking))), (online.pk, [online.pk, park.pk]))
+        paper = Voter.objects.create(full_name="D", enter_pass="D001", vote_weight=1)
+        Vote.objects.create(survey=survey, voter=paper, option=hall, recorded_weight=1, source=Vote.PAPER)  # first choice only
+        result = ranked.tally(ranked.survey_ballots(survey), [hall.pk, park.pk, online.pk])
+        # Round 1: Hall 3, Park 2, Online 3 -> Park out, C moves to Hall; round 2: Hall 5 of 8.
+        self.assertEqual([r.weights for r in result.rounds], [{0: 300, 1: 200, 2: 300}, {0: 500, 2: 300}])
+        self.assertEqual(result.winner, hall.pk)
+
+
+class DelegationTests(TestCase):
+    """Chains, cycles and survey overrides; the incremental refresh matches a full rebuild."""
+
+    def setUp(self):
+        self.a, self.b, self.c, self.d, self.e = [
+            Voter.objects.create(full_name=name, enter_pass=f"{name}00{weight}", vote_weight=Decimal(weight))
+            for name, weight in [("A", 1), ("B", 2), ("C", 3), ("D", 4), ("E", 5)]
+        ]
+        self.survey = open_survey()
+
+    def delegate(self, delegator, delegate, survey=None):
+        Delegation.objects.create(delegator=delegator, delegate=delegate, survey=survey)
+
+    def weights(self):
+        return {
+            (row.voter.full_name, row.survey_id): (row.weight, row.delegate and row.delegate.full_name)
+            for row in EffectiveWeight.objects.select_related("voter", "delegate")
+        }
+
+    def assert_weight(self, voter, expected, survey_id=delegation.GENERAL):
+        weight, delegate = delegation.weight_for(voter, survey_id)
+        self.assertEqual((weight, delegate and delegate.full_name), expected)
+
+    def test_chain(self):
+        self.delegate(self.a, self.b)
+        self.delegate(self.b, self.c)
+        self.assertEqual(delegation.rebuild(), 3)
+        self.assert_weight(self.c, (Decimal("6"), None))
+        self.assert_weight(self.a, (Decimal("0"), "C"))
+        self.assert_weight(self.b, (Decimal("0"), "C"), self.survey.pk)
+        self.assert_weight(self.d, (Decimal("4"), None))  # not involved: no row, own weight
+
+    def test_cycle_is_void(self):
+        self.delegate(self.a, self.d)  # runs into the cycle below
+        self.delegate(self.d, self.e)
+        self.delegate(self.e, self.d)
+        delegation.rebuild()
+        self.assertEqual(self.weights(), {
+            ("A", None): (Decimal("1"), None), ("D", None): (Decimal("4"), None), ("E", None): (Decimal("5"), None),
+        })
+        self.assertIsNone(delegation.check(self.c, self.a))  # A's chain is void: C would keep their own vote
+        self.assertEqual(delegation.check(self.e, self.a), "A already delegates (directly or through others) to E.")
+
+    def test_survey_delegation_overrides_the_general_one(self):
+        self.delegate(self.a, self.b)
+        self.delegate(self.a, self.c, self.survey)
+        delegation.rebuild()
+        self.assert_weight(self.b, (Decimal("3"), None))
+        self.assert_weight(self.b, (Decimal("2"), None), self.survey.pk)
+        self.assert_weight(self.c, (Decimal("4"), None), self.survey.pk)
+        self.assert_weight(self.a, (Decimal("0"), "C"), self.survey.pk)
+        other = open_survey()
+        self.assert_weight(self.a, (Decimal("0"), "B"), other.pk)
+
+    def test_refresh_matches_rebuild_after_edits(self):
+        def edits():
+            yield delegation.assign(self.a, self.b)
+            yield delegation.assign(self.b, self.c)
+            yield delegation.assign(self.d, self.a, self.survey)
+            yield delegation.assign(self.e, self.d)
+            yield delegation.assign(self.a, self.e)  # replaces A -> B
+            Voter.objects.filter(pk=self.c.pk).update(vote_weight=Decimal("7"))  # no signal
+            yield delegation.refresh([self.c.pk])
+            self.d.is_active = False
+            yield self.d.save()  # signal: refresh around D
+            yield delegation.revoke(Delegation.objects.get(delegator=self.d, survey=self.survey))
+            self.d.is_active = True
+            yield self.d.save()
+            yield delegation.revoke(Delegation.objects.get(delegator=self.b))
+
+        for step, _ in enumerate(edits(), 1):
+            refreshed = self.weights()
+            delegation.rebuild()
+            self.assertEqual(self.weights(), refreshed, f"after edit {step}")
+
+    def test_check_refuses_a_delegator_who_voted(self):
+        Vote.objects.create(survey=self.survey, voter=self.a, option=self.survey.options.first(), recorded_weight=1)
+        self.assertEqual(delegation.check(self.a, self.b), "A has already voted on an open survey; delegate per survey instead.")
+        self.assertEqual(delegation.check(self.a, self.b, self.survey), "A has already voted on this survey.")
+        self.assertEqual(delegation.check(self.c, self.a), "A has already voted on an open survey; the delegated vote would be lost there. Delegate per survey instead.")
+        self.assertIsNone(delegation.check(self.c, self.a, open_survey()))
+
+
+class BallotVoteTests(TestCase):
+    """A ballot is answered in one POST: all questions or none, with the general delegation weight."""
+
+    def setUp(self):
+        self.ballot = Ballot.objects.create(title="AGM", end_date_time=timezone.now() + timedelta(hours=1))
+        self.questions = []
+        for text in ("Budget?", "Chair?"):
+            survey = Survey.objects.create(question_text=text, ballot=self.ballot, end_date_time=self.ballot.end_date_time)
+            Option.objects.bulk_create([Option(survey=survey, option_text=t) for t in ("Yes", "No")])
+            self.questions.append(survey)
+        self.ada = Voter.objects.create(full_name="Ada", enter_pass="AD01", vote_weight=Decimal("2"))
+        self.bob = Voter.objects.create(full_name="Bob", enter_pass="BO02", vote_weight=Decimal("1"))
+        voter_client(self.client, self.ada)
+
+    def answers(self, *texts):
+        return {f"q{q.pk}": q.options.get(option_text=t).pk for q, t in zip(self.questions, texts)}
+
+    def submit(self, data, token=None):
+        return self.client.post(reverse("core:ballot_vote", args=[self.ballot.pk]), {**data, idempotency.FIELD: token or idempotency.new_token()})
+
+    def recorded(self):
+        return sorted(Vote.objects.values_list("survey__question_text", "voter__full_name", "option__option_text", "recorded_weight"))
+
+    def test_whole_ballot_in_one_post(self):
+        Delegation.objects.create(delegator=self.bob, delegate=self.ada)
+        Delegation.objects.create(delegator=self.bob, delegate=self.ada, survey=open_survey())  # not a ballot scope
+        delegation.rebuild()
+        token, answers = idempotency.new_token(), self.answers("Yes", "No")
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.submit(answers, token)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith('INSERT INTO "core_vote"')]), 1)  # one bulk insert
+        self.assertEqual(self.recorded(), [
+            ("Budget?", "Ada", "Yes", Decimal("3")), ("Chair?", "Ada", "No", Decimal("3")),
+        ])
+        self.assertEqual(Participation.objects.get(voter=self.ada).weighted_total, Decimal("6"))
+        self.submit(self.answers("No", "No"), token)  # retried form: replayed, not recorded again
+        self.assertEqual(len(self.recorded()), 2)
+
+    def test_incomplete_ballot_records_nothing(self):
+        data = self.answers("Yes", "No")
+        data.pop(f"q{self.questions[1].pk}")
+        response = self.submit(data)
+        self.assertEqual(self.recorded(), [])
+        self.assertEqual([str(m) for m in get_messages(response.wsgi_request)], ["Please answer every question on the ballot."])
+
+    def test_delegated_voter_cannot_vote(self):
+        Delegation.objects.create(delegator=self.ada, delegate=self.bob)
+        delegation.rebuild()
+        response = self.submit(self.answers("Yes", "Yes"))
+        self.assertEqual(self.recorded(), [])
+        self.assertEqual([str(m) for m in get_messages(response.wsgi_request)], ["You have delegated your vote to Bob."])
+
+    def test_questions_cannot_be_voted_on_one_by_one(self):
+        question = self.questions[0]
+        response = self.client.post(reverse("core:survey_vote", args=[question.pk]), {"option": question.options.first().pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.recorded(), [])
+
+    def test_results_per_question(self):
+        self.submit(self.answers("Yes", "No"))
+        voter_client(self.client, self.bob)
+        self.submit(self.answers("Yes", "Yes"))
+        Survey.objects.filter(ballot=self.ballot).update(end_date_time=timezone.now())
+        Ballot.objects.filter(pk=self.ballot.pk).update(end_date_time=timezone.now())
+        response = self.client.get(reverse("core:ballot_results", args=[self.ballot.pk]))
+        totals = [
+            (survey.question_text, [(o.option_text, o.vote_count, o.weighted_total) for o in options])
+            for survey, options in response.context["question_stats"]
+        ]
+        self.assertEqual(totals, [
+            ("Budget?", [("Yes", 2, Decimal("3")), ("No", 0, None)]),
+            ("Chair?", [("Yes", 1, Decimal("1")), ("No", 1, Decimal("2"))]),
+        ])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])  # real logins, fast hashing
+class TenancyTests(TransactionTestCase):
+    """A second organization with its own database: routing, /o/<slug>/ and host selection, separate logins."""
+
+    def setUp(self):
+        self.acme = add_organization(self, "acme", hosts=["vote.acme.example"])
+        self.enterContext(override_settings(ALLOWED_HOSTS=["testserver", "vote.acme.example"]))
+        with tenancy.activated(self.acme):
+            Voter.objects.create(full_name="Acme voter", enter_pass="AC01", vote_weight=1)
+            User.objects.create_user("acme-admin", password="pw-acme", is_staff=True)
+        Voter.objects.create(full_name="Default voter", enter_pass="DE01", vote_weight=1)
+        User.objects.create_user("admin", password="pw-default", is_staff=True)
+
+    def test_router_uses_the_current_organizations_database(self):
+        self.assertEqual((router.db_for_read(Voter), router.db_for_write(Voter)), ("default", "default"))
+        with tenancy.activated("acme"):
+            self.assertEqual((router.db_for_read(Voter), router.db_for_write(User)), ("tenant_acme", "tenant_acme"))
+            with replica_reads():
+                self.assertEqual(router.db_for_read(Survey), "tenant_acme")  # no replica configured
+            acme_voter = Voter.objects.get()
+        self.assertEqual(acme_voter.full_name, "Acme voter")
+        self.assertFalse(router.allow_relation(acme_voter, Voter.objects.get()))
+        self.assertEqual(self.acme.script_prefix, "/")  # has its own host
+        self.assertEqual(tenancy.Organization("beta", "Beta").script_prefix, "/o/beta/")
+
+    def test_path_prefix_selects_the_organization(self):
+        response = self.client.post("/o/acme" + reverse("core:login"), {"enter_pass": "AC01"})
+        self.assertRedirects(response, "/o/acme" + reverse("core:survey_list"), fetch_redirect_response=False)
+        self.assertContains(self.client.get("/o/acme" + reverse("core:survey_list")), "Acme voter")
+        self.assertEqual(self.client.get("/o/nope" + reverse("core:login")).status_code, 404)
+        response = self.client.post(reverse("core:login"), {"enter_pass": "AC01"})  # unknown in the default organization
+        self.assertEqual(response.status_code, 200)
+
+    def test_host_selects_the_organization(self):
+        response = self.client.post(reverse("core:login"), {"enter_pass": "AC01"}, HTTP_HOST="vote.acme.example")
+        self.assertRedirects(response, reverse("core:survey_list"), fetch_redirect_response=False)
+
+    def test_sessions_and_staff_are_per_organization(self):
+        login = reverse("core:admin_login")
+        surveys = reverse("core:admin_survey_list")
+        self.assertEqual(self.client.post("/o/acme" + login, {"username": "admin", "password": "pw-default"}).status_code, 200)
+        self.client.post("/o/acme" + login, {"username": "acme-admin", "password": "pw-acme"})
+        self.assertEqual(self.client.get("/o/acme" + surveys).status_code, 200)
+        self.assertEqual(self.client.get(surveys).status_code, 302)  # the session exists in acme's database only
+        with tenancy.activated("acme"):
+            self.assertTrue(Session.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_migrate_tenants(self):
+        out = StringIO()
+        call_command("migrate_tenants", "acme", stdout=out)
+        self.assertIn("Migrating acme (tenant_acme)", out.getvalue())
+        self.assertIn("No migrations to apply.", out.getvalue())
+        with self.assertRaisesMessage(CommandError, "Unknown organization(s): nope"):
+            call_command("migrate_tenants", "nope")
+
+    def test_static_url_ignores_the_organization_prefix(self):
+        # Django prefixes a relative STATIC_URL with the script prefix of the moment it is
+        # first read, which under /o/<slug>/ is that organization's; the absolute one is shared.
+        set_script_prefix("/o/acme/")
+        self.addCleanup(set_script_prefix, "/")
+        self.assertEqual(settings._add_script_prefix("static/"), "/o/acme/static/")
+        self.assertEqual(settings._add_script_prefix(settings.STATIC_URL), "/static/")
@@ -0,0 +1,118 @@
+"""
+Opt-in recorder of production request traces, replayed by `python manage.py replay_traffic`.
+
+With TRAFFIC_RECORD_ENABLED, `TrafficRecorderMiddleware` appends one JSON line per request
+to TRAFFIC_ROOT/traffic-<date>-<pid>.jsonl (one file per process, so writers never
+interleave):
+
+    {"t": 1760000000.123, "m": "POST", "p": "/surveys/12/vote/", "v": "core:survey_vote",
+     "id": "v:3f9a0c1d2e4b", "s": 302, "ms": 41.7, "b": 0}
+
+t is the arrival time, ms the time spent in Django and b the response body size (after
+compression). id is an HMAC of the logged-in voter or staff user ("v:"/"s:"), or of the
+session key for anonymous visitors ("a:"). Query strings, request bodies, client
+addresses and names are never stored.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+VOTER = "v"
+STAFF = "s"
+ANONYMOUS = "a"
+
+
+def identity(request):
+    """Pseudonymous, stable id of whoever made the request, or "" without a session."""
+    session = getattr(request, "session", None)
+    user = getattr(request, "user", None)
+    if session is not None and session.get("voter_id"):
+        kind, value = VOTER, f"voter:{session['voter_id']}"
+    elif user is not None and user.is_authenticated:
+        kind, value = STAFF, f"user:{user.pk}"
+    elif session is not None and session.session_key:
+        kind, value = ANONYMOUS, f"session:{session.session_key}"
+    else:
+        return ""
+    return f"{kind}:{salted_hmac('core.traffic.identity', value).hexdigest()[:12]}"
+
+
+def _body_size(response):
+    if response.streaming:
+        length = response.get("Content-Length")
+        return int(length) if length else None
+    return len(response.content)
+
+
+class _Log:
+    """This process's trace file for the current day, line-buffered."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = self._fh = None
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            day = timezone.now().strftime("%Y%m%d")
+            if day != self._day:
+                if self._fh is not None:
+                    self._fh.close()
+                root = Path(settings.TRAFFIC_ROOT)
+                root.mkdir(parents=True, exist_ok=True)
+                self._fh = open(root / f"traffic-{day}-{os.getpid()}.jsonl", "a", encoding="utf-8", buffering=1)
+                self._day = day
+            self._fh.write(line)
+
+
+_log = _Log()
+
+
+class TrafficRecorderMiddleware:
+    """Append a trace record for every request not under TRAFFIC_EXCLUDE_PATHS."""
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_RECORD_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(tuple(settings.TRAFFIC_EXCLUDE_PATHS)):
+            return self.get_response(request)
+        arrived = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
+        _log.write({
+            "t": round(arrived, 3),
+            "m": request.method,
+            "p": request.path,
+            "v": match.view_name if match else "",
+            "id": identity(request),
+            "s": response.status_code,
+            "ms": round(elapsed * 1000, 1),
+            "b": _body_size(response),
+        })
+        return response
+
+
+def read_trace(paths):
+    """All records of the given .jsonl / .jsonl.gz files (or directories of them), by arrival time."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob("traffic-*.jsonl*")) if path.is_dir() else [path])
+    records = []
+    for path in files:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as fh:
+            records.extend(json.loads(line) for line in fh if line.strip())
+    records.sort(key=lambda r: r["t"])
+    return records
@@ -0,0 +1,110 @@
+"""
+Turnout timeline of a survey: votes and weighted total per time bucket, plus running sums.
+
+Buckets come from one grouped query (Trunc on `Vote.created_at`, served by the
+(survey, created_at) index). The result is kept in the Django cache. On later views only
+votes at or after `settled` — the start of the bucket that was still filling up when the
+entry was built, less SETTLE for transactions that commit late — are queried again and
+merged in, so an open survey is never rescanned from its first vote and a closed one is
+not queried at all.
+
+Vote deletions (signal, chunked deletion) and paper imports drop the survey's entry.
+They also bump the VOTES version (core.coherence), which is part of every key. Other
+worker processes therefore stop using their copies at their next request, even with the
+default per-process cache.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from core import coherence, metrics
+from core.db_routers import primary_alias
+from core.models import Vote
+
+INTERVALS = ("minute", "hour", "day")
+SETTLE = timedelta(seconds=30)  # votes may commit this long after their created_at
+
+
+def interval_for(survey):
+    """Bucket size for the survey's whole voting period, so it never changes while open."""
+    span = survey.end_date_time - survey.created_at
+    if span <= timedelta(hours=6):
+        return "minute"
+    if span <= timedelta(days=14):
+        return "hour"
+    return "day"
+
+
+def _key(survey_id, interval):
+    return f"turnout:{primary_alias()}:{coherence.version(coherence.VOTES)}:{survey_id}:{interval}"
+
+
+def _floor(moment, interval):
+    """Start of the bucket containing `moment` (same time zone as Trunc)."""
+    moment = timezone.localtime(moment)
+    if interval == "day":
+        moment = moment.replace(hour=0)
+    if interval in ("day", "hour"):
+        moment = moment.replace(minute=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def _query(survey, interval, since=None):
+    votes = Vote.objects.filter(survey=survey)
+    if since is not None:
+        votes = votes.filter(created_at__gte=since)
+    rows = (
+        votes.annotate(bucket=Trunc("created_at", interval))
+        .values("bucket")
+        .annotate(votes=Count("id"), weight=Sum("recorded_weight"))
+        .order_by("bucket")
+    )
+    return [(row["bucket"], row["votes"], row["weight"] or Decimal(0)) for row in rows]
+
+
+def buckets(survey, interval=None):
+    """[(bucket start, votes, weighted total)] in time order, from the cache where possible."""
+    interval = interval or interval_for(survey)
+    key = _key(survey.pk, interval)
+    now = timezone.now()
+    entry = cache.get(key)
+    metrics.record_cache("turnout", entry is not None)
+    if entry is not None and entry["settled"] > survey.end_date_time + SETTLE:
+        return entry["buckets"]
+    if entry is None:
+        rows = _query(survey, interval)
+    else:
+        since = entry["settled"]
+        rows = [b for b in entry["buckets"] if b[0] < since] + _query(survey, interval, since)
+    settled = _floor(now - SETTLE, interval)  # buckets before this one are final
+    cache.set(key, {"settled": settled, "buckets": rows}, settings.TURNOUT_CACHE_TIMEOUT)
+    return rows
+
+
+def timeline(survey, interval=None):
+    """Buckets with running totals, as dicts for the template / chart."""
+    points, total_votes, total_weight = [], 0, Decimal(0)
+    for start, votes, weight in buckets(survey, interval):
+        total_votes += votes
+        total_weight += weight
+        points.append({
+            "start": start, "votes": votes, "weight": weight,
+            "cumulative_votes": total_votes, "cumulative_weight": total_weight,
+        })
+    return points
+
+
+def invalidate(survey_ids):
+    cache.delete_many([_key(pk, interval) for pk in survey_ids for interval in INTERVALS])
+
+
+def _vote_deleted(sender, instance, **kwargs):
+    invalidate([instance.survey_id])
+
+
+def connect_signals():
+    post_delete.connect(_vote_deleted, sender=Vote, dispatch_uid="turnout_vote_deleted")
@@ -2,26 +2,52 @@ from django.urls import path
 from core.views.login_views import login, voter_logout, AdminLoginView
 from core.views.user_views import (
     survey_list,
+    closed_surveys,
     survey_detail,
     survey_vote,
     results_list,
     results_detail,
+    ballot_vote,
+    ballot_results,
 )
 from core.views.admin_views import (
     admin_dashboard,
     admin_survey_list,
     admin_survey_create,
+    admin_survey_import,
+    admin_survey_clone,
+    admin_survey_delete,
     admin_survey_edit,
     admin_survey_toggle_publish,
     admin_survey_close_now,
     admin_survey_votes,
+    admin_not_voted,
+    admin_ballot_list,
+    admin_ballot_create,
+    admin_ballot_toggle_publish,
+    admin_ballot_close_now,
     admin_user_list,
     admin_user_create,
     admin_user_deactivate,
     admin_user_activate,
     admin_user_delete,
+    admin_user_bulk_delete,
     admin_user_export,
+    admin_user_import,
+    admin_results_export,
+    admin_search,
+    admin_profile_list,
+    admin_profile_toggle,
+    admin_profile_detail,
+    metrics_scrape,
+    admin_job_list,
+    admin_job_download,
+    admin_paper_vote_import,
     admin_vote_reset,
+    admin_delegation_list,
+    admin_delegation_delete,
+    admin_lookup_surveys,
+    admin_lookup_voters,
 )
 
 app_name = "core"
@@ -33,23 +59,49 @@ urlpatterns = [
     path("admin-auth/login/", AdminLoginView.as_view(), name="admin_login"),
     # User area
     path("surveys/", survey_list, name="survey_list"),
+    path("surveys/closed/", closed_surveys, name="closed_surveys"),
     path("surveys/<int:pk>/", survey_detail, name="survey_detail"),
     path("surveys/<int:pk>/vote/", survey_vote, name="survey_vote"),
     path("results/", results_list, name="results_list"),
     path("results/<int:pk>/", results_detail, name="results_detail"),
+    path("ballots/<int:pk>/vote/", ballot_vote, name="ballot_vote"),
+    path("ballots/<int:pk>/results/", ballot_results, name="ballot_results"),
     # Admin area
     path("admin/dashboard/", admin_dashboard, name="admin_dashboard"),
     path("admin/surveys/", admin_survey_list, name="admin_survey_list"),
     path("admin/surveys/new/", admin_survey_create, name="admin_survey_create"),
+    path("admin/surveys/import/", admin_survey_import, name="admin_survey_import"),
+    path("admin/surveys/<int:pk>/clone/", admin_survey_clone, name="admin_survey_clone"),
+    path("admin/surveys/<int:pk>/delete/", admin_survey_delete, name="admin_survey_delete"),
     path("admin/surveys/<int:pk>/edit/", admin_survey_edit, name="admin_survey_edit"),
     path("admin/surveys/<int:pk>/toggle-publish/", admin_survey_toggle_publish, name="admin_survey_toggle_publish"),
     path("admin/surveys/<int:pk>/close-now/", admin_survey_close_now, name="admin_survey_close_now"),
     path("admin/surveys/<int:pk>/votes/", admin_survey_votes, name="admin_survey_votes"),
+    path("admin/not-voted/", admin_not_voted, name="admin_not_voted"),
+    path("admin/ballots/", admin_ballot_list, name="admin_ballot_list"),
+    path("admin/ballots/new/", admin_ballot_create, name="admin_ballot_create"),
+    path("admin/ballots/<int:pk>/toggle-publish/", admin_ballot_toggle_publish, name="admin_ballot_toggle_publish"),
+    path("admin/ballots/<int:pk>/close-now/", admin_ballot_close_now, name="admin_ballot_close_now"),
     path("admin/users/", admin_user_list, name="admin_user_list"),
     path("admin/users/new/", admin_user_create, name="admin_user_create"),
     path("admin/users/export/", admin_user_export, name="admin_user_export"),
+    path("admin/users/import/", admin_user_import, name="admin_user_import"),
     path("admin/users/<int:pk>/deactivate/", admin_user_deactivate, name="admin_user_deactivate"),
     path("admin/users/<int:pk>/activate/", admin_user_activate, name="admin_user_activate"),
     path("admin/users/<int:pk>/delete/", admin_user_delete, name="admin_user_delete"),
+    path("admin/users/delete/", admin_user_bulk_delete, name="admin_user_bulk_delete"),
+    path("admin/votes/import/", admin_paper_vote_import, name="admin_paper_vote_import"),
     path("admin/vote-reset/", admin_vote_reset, name="admin_vote_reset"),
+    path("admin/delegations/", admin_delegation_list, name="admin_delegation_list"),
+    path("admin/delegations/<int:pk>/delete/", admin_delegation_delete, name="admin_delegation_delete"),
+    path("admin/lookup/surveys/", admin_lookup_surveys, name="admin_lookup_surveys"),
+    path("admin/lookup/voters/", admin_lookup_voters, name="admin_lookup_voters"),
+    path("admin/search/", admin_search, name="admin_search"),
+    path("metrics/", metrics_scrape, name="metrics"),
+    path("admin/profiles/", admin_profile_list, name="admin_profile_list"),
+    path("admin/profiles/toggle/", admin_profile_toggle, name="admin_profile_toggle"),
+    path("admin/profiles/<str:profile_id>/", admin_profile_detail, name="admin_profile_detail"),
+    path("admin/results/export/", admin_results_export, name="admin_results_export"),
+    path("admin/jobs/", admin_job_list, name="admin_job_list"),
+    path("admin/jobs/<int:pk>/download/", admin_job_download, name="admin_job_download"),
 ]
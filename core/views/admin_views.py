@@ -1,17 +1,36 @@
-"""Admin views: dashboard, survey CRUD, user CRUD, export, vote reset."""
-import io
+"""Admin views: dashboard, survey CRUD, user CRUD, export/import jobs, vote reset, turnout chasing."""
+from decimal import Decimal
+from pathlib import Path
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
 from django.contrib import messages
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.formats import date_format
 from django.db import transaction
-from core.decorators import staff_required
-from core.models import Voter, Survey, Option, Vote
-from core.forms import SurveyForm, OptionFormSetFactory, VoterCreateForm, VoteResetForm
-import openpyxl
-from django.utils.crypto import get_random_string
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from core import coherence, delegation, deletion, idempotency, jobs, metrics, profiling, ranked, search, survey_import, turnout
+from core.db_routers import primary_alias
+from core.decorators import read_replica, staff_required
+from core.models import Voter, Ballot, Survey, Option, Vote, Job, Delegation
+from core.forms import (
+    SurveyForm,
+    BallotQuestionForm,
+    BallotForm,
+    OptionFormSetFactory,
+    VoterCreateForm,
+    VoterImportForm,
+    SurveyImportForm,
+    PaperVoteImportForm,
+    VoteResetForm,
+    DelegationForm,
+)
+from django.utils.crypto import constant_time_compare, get_random_string
+
+LOOKUP_LIMIT = 20  # results per typeahead lookup
 
 
 def _generate_enter_pass():
@@ -26,16 +45,24 @@ def _generate_enter_pass():
 
 # ----- Dashboard -----
 @staff_required
+@read_replica
 @require_http_methods(["GET"])
 def admin_dashboard(request):
-    return render(request, "admin/dashboard.html")
+    now = timezone.now()
+    stats = {
+        "active_voters": Voter.objects.filter(is_active=True).count(),
+        "open_surveys": Survey.objects.filter(end_date_time__gt=now).count(),
+        "closed_surveys": Survey.objects.filter(end_date_time__lte=now).count(),
+        "votes": Vote.objects.count(),
+    }
+    return render(request, "admin/dashboard.html", {"stats": stats})
 
 
 # ----- Surveys -----
 @staff_required
 @require_http_methods(["GET"])
 def admin_survey_list(request):
-    surveys = Survey.objects.all().order_by("-created_at").prefetch_related("options")
+    surveys = Survey.objects.all().order_by("-created_at").select_related("ballot").prefetch_related("options")
     return render(request, "admin/survey_list.html", {"surveys": surveys})
 
 
@@ -45,20 +72,50 @@ def admin_survey_list(request):
 def admin_survey_create(request):
     form = SurveyForm(request.POST or None)
     formset = OptionFormSetFactory(request.POST or None, instance=Survey())
-    if request.method == "POST":
-        if form.is_valid():
+    if request.method == "POST" and form.is_valid() and formset.is_valid():
+        with transaction.atomic(using=primary_alias()):
             survey = form.save()
-            formset = OptionFormSetFactory(request.POST, instance=survey)
-            if formset.is_valid():
-                formset.save()
-                messages.success(request, "Survey created.")
-                return redirect("core:admin_survey_list")
-            survey.delete()
-        else:
-            formset = OptionFormSetFactory(request.POST, instance=Survey())
+            Option.objects.bulk_create([
+                Option(survey=survey, option_text=f.cleaned_data["option_text"])
+                for f in formset.forms
+                if f.cleaned_data and not f.cleaned_data.get("DELETE")
+            ])
+            search.index_surveys([survey])
+        messages.success(request, "Survey created.")
+        return redirect("core:admin_survey_list")
     return render(request, "admin/survey_form.html", {"form": form, "formset": formset, "survey": None})
 
 
+@staff_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def admin_survey_import(request):
+    """Create many surveys from a JSON/YAML/XLSX file; nothing is created unless every survey is valid."""
+    form = SurveyImportForm(request.POST or None, request.FILES or None)
+    errors = []
+    if request.method == "POST" and form.is_valid():
+        upload = form.cleaned_data["file"]
+        try:
+            definitions = survey_import.load(upload, upload.name)
+        except survey_import.ImportErrors as exc:
+            errors = exc.errors
+        else:
+            surveys = survey_import.create_surveys(definitions)
+            messages.success(request, f"Imported {len(surveys)} survey(s).")
+            return redirect("core:admin_survey_list")
+    return render(request, "admin/survey_import.html", {"form": form, "errors": errors})
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_survey_clone(request, pk):
+    survey = get_object_or_404(Survey, pk=pk)
+    copy = survey_import.clone_survey(survey)
+    messages.success(request, "Survey copied (unpublished). Adjust it and publish when ready.")
+    return redirect("core:admin_survey_edit", pk=copy.pk)
+
+
 @staff_required
 @require_http_methods(["GET", "POST"])
 @csrf_protect
@@ -67,11 +124,12 @@ def admin_survey_edit(request, pk):
     if timezone.now() >= survey.end_date_time:
         messages.error(request, "Cannot edit a closed survey.")
         return redirect("core:admin_survey_list")
-    form = SurveyForm(request.POST or None, instance=survey)
+    form_class = BallotQuestionForm if survey.ballot_id else SurveyForm
+    form = form_class(request.POST or None, instance=survey)
     has_votes = survey.votes.exists()
     formset = OptionFormSetFactory(request.POST or None, instance=survey)
     if request.method == "POST" and form.is_valid() and formset.is_valid():
-        with transaction.atomic():
+        with transaction.atomic(using=primary_alias()):
             form.save()
             formset.save()
         messages.success(request, "Survey updated.")
@@ -86,6 +144,9 @@ def admin_survey_edit(request, pk):
 @csrf_protect
 def admin_survey_toggle_publish(request, pk):
     survey = get_object_or_404(Survey, pk=pk)
+    if survey.ballot_id:
+        messages.error(request, "This survey is part of a ballot; publish the ballot instead.")
+        return redirect("core:admin_ballot_list")
     survey.is_published = not survey.is_published
     survey.save(update_fields=["is_published"])
     status = "published" if survey.is_published else "unpublished"
@@ -99,26 +160,185 @@ def admin_survey_toggle_publish(request, pk):
 def admin_survey_close_now(request, pk):
     """Close the survey immediately (regardless of end date)."""
     survey = get_object_or_404(Survey, pk=pk)
+    if survey.ballot_id:
+        messages.error(request, "This survey is part of a ballot; close the ballot instead.")
+        return redirect("core:admin_ballot_list")
     survey.end_date_time = timezone.now()
     survey.save(update_fields=["end_date_time"])
     messages.success(request, "Survey closed.")
     return redirect("core:admin_survey_list")
 
 
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_survey_delete(request, pk):
+    survey = get_object_or_404(Survey, pk=pk)
+    if survey.ballot_id:
+        messages.error(request, "This survey is part of a ballot and cannot be deleted on its own.")
+        return redirect("core:admin_survey_list")
+    return _delete_or_queue(request, deletion.SURVEYS, [survey.pk], "Survey", "core:admin_survey_list")
+
+
 @staff_required
 @require_http_methods(["GET"])
 def admin_survey_votes(request, pk):
-    """Show who voted for this survey (admin view)."""
+    """Show who voted for this survey and when (turnout timeline, see core.turnout)."""
     survey = get_object_or_404(Survey, pk=pk)
     votes = Vote.objects.filter(survey=survey).select_related("voter", "option").order_by("voter__full_name")
-    return render(request, "admin/survey_votes.html", {"survey": survey, "votes": votes})
+    if survey.is_ranked:
+        ranked.attach_rankings(votes, survey.options.all())
+    interval = request.GET.get("interval")
+    if interval not in turnout.INTERVALS:
+        interval = turnout.interval_for(survey)
+    points = turnout.timeline(survey, interval)
+    chart = {
+        "labels": [date_format(timezone.localtime(p["start"]), "SHORT_DATETIME_FORMAT") for p in points],
+        "votes": [p["votes"] for p in points],
+        "cumulative_votes": [p["cumulative_votes"] for p in points],
+        "weight": [float(p["weight"]) for p in points],
+        "cumulative_weight": [float(p["cumulative_weight"]) for p in points],
+    }
+    return render(request, "admin/survey_votes.html", {
+        "survey": survey, "votes": votes, "interval": interval, "intervals": turnout.INTERVALS,
+        "turnout": points, "turnout_chart": chart,
+    })
+
+
+NOT_VOTED_PAGE = 50
+NOT_VOTED_SORTS = {  # ?sort= value -> participation column; "-" prefix for descending
+    "name": "full_name",
+    "votes": "votes_cast",
+    "last": "last_vote_at",
+    "weight": "weighted_total",
+}
+NOT_VOTED_COLUMNS = [("name", "Full name"), ("", "EnterPass"), ("", "Weight"), ("votes", "Votes cast"), ("weight", "Weighted total"), ("last", "Last vote")]
+
+
+@staff_required
+@read_replica
+@require_http_methods(["GET"])
+def admin_not_voted(request):
+    """
+    Active voters who have not voted on an open survey yet, with their participation so far
+    (core.participation), for chasing turnout before the survey closes. Voters who delegated
+    their vote on the survey are left out.
+    """
+    now = timezone.now()
+    surveys = list(Survey.objects.filter(is_published=True, end_date_time__gt=now).order_by("end_date_time", "pk"))
+    survey = next((s for s in surveys if str(s.pk) == request.GET.get("survey")), surveys[0] if surveys else None)
+    query = request.GET.get("q", "").strip()
+    never = request.GET.get("never") == "1"
+    sort = request.GET.get("sort", "name")
+    if sort.lstrip("-") not in NOT_VOTED_SORTS:
+        sort = "name"
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    voters, has_next, summary = [], False, None
+    if survey is not None:
+        scope = delegation.scope_rows(survey).filter(voter=OuterRef("pk"))
+        weight = Coalesce(Subquery(scope.values("weight")[:1]), F("vote_weight"))  # includes votes delegated to them
+        pending = Voter.objects.filter(is_active=True).exclude(
+            Exists(Vote.objects.filter(survey=survey, voter=OuterRef("pk")))
+        ).alias(delegate=Subquery(scope.values("delegate")[:1])).filter(delegate__isnull=True)
+        if query:
+            pending = pending.filter(Q(full_name__icontains=query) | Q(enter_pass__iexact=query))
+        if never:
+            pending = pending.filter(participation__isnull=True)
+        summary = pending.aggregate(count=Count("pk"), weight=Sum(weight))
+        pending = pending.annotate(
+            votes_cast=Coalesce(F("participation__votes_cast"), 0),
+            weighted_total=Coalesce(F("participation__weighted_total"), Value(Decimal(0))),
+            last_vote_at=F("participation__last_vote_at"),
+            weight=weight,
+        )
+        column = F(NOT_VOTED_SORTS[sort.lstrip("-")])
+        order = column.desc(nulls_last=True) if sort.startswith("-") else column.asc(nulls_first=True)
+        offset = (page - 1) * NOT_VOTED_PAGE
+        voters = list(pending.order_by(order, "full_name", "pk")[offset:offset + NOT_VOTED_PAGE + 1])
+        has_next = len(voters) > NOT_VOTED_PAGE
+        voters = voters[:NOT_VOTED_PAGE]
+    return render(request, "admin/not_voted.html", {
+        "surveys": surveys, "survey": survey, "voters": voters, "summary": summary, "columns": NOT_VOTED_COLUMNS,
+        "query": query, "never": never, "sort": sort, "page": page, "has_next": has_next,
+    })
+
+
+# ----- Ballots -----
+@staff_required
+@require_http_methods(["GET"])
+def admin_ballot_list(request):
+    ballots = Ballot.objects.all().order_by("-created_at").annotate(question_count=Count("questions"))
+    return render(request, "admin/ballot_list.html", {"ballots": ballots})
+
+
+@staff_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def admin_ballot_create(request):
+    """Create a ballot and all its questions and options with bulk inserts in one transaction."""
+    form = BallotForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        with transaction.atomic(using=primary_alias()):
+            ballot = form.save()
+            questions = form.cleaned_data["questions"]
+            surveys = Survey.objects.bulk_create([
+                Survey(
+                    question_text=text,
+                    end_date_time=ballot.end_date_time,
+                    is_published=ballot.is_published,
+                    ballot=ballot,
+                    position=position,
+                )
+                for position, (text, _) in enumerate(questions)
+            ])
+            Option.objects.bulk_create([
+                Option(survey=survey, option_text=option_text)
+                for survey, (_, option_texts) in zip(surveys, questions)
+                for option_text in option_texts
+            ])
+            search.index_surveys(surveys)
+            coherence.bump(coherence.SURVEYS)
+        messages.success(request, f"Ballot created with {len(surveys)} questions.")
+        return redirect("core:admin_ballot_list")
+    return render(request, "admin/ballot_form.html", {"form": form})
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_ballot_toggle_publish(request, pk):
+    ballot = get_object_or_404(Ballot, pk=pk)
+    ballot.is_published = not ballot.is_published
+    with transaction.atomic(using=primary_alias()):
+        ballot.save(update_fields=["is_published"])
+        ballot.sync_questions()
+    status = "published" if ballot.is_published else "unpublished"
+    messages.success(request, f"Ballot {status}.")
+    return redirect("core:admin_ballot_list")
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_ballot_close_now(request, pk):
+    """Close the ballot and all its questions immediately."""
+    ballot = get_object_or_404(Ballot, pk=pk)
+    ballot.end_date_time = timezone.now()
+    with transaction.atomic(using=primary_alias()):
+        ballot.save(update_fields=["end_date_time"])
+        ballot.sync_questions()
+    messages.success(request, "Ballot closed.")
+    return redirect("core:admin_ballot_list")
 
 
 # ----- Users -----
 @staff_required
 @require_http_methods(["GET"])
 def admin_user_list(request):
-    users = Voter.objects.all().order_by("full_name")
+    users = Voter.objects.select_related("participation").order_by("full_name")
     return render(request, "admin/user_list.html", {"users": users})
 
 
@@ -128,7 +348,7 @@ def admin_user_list(request):
 def admin_user_create(request):
     form = VoterCreateForm(request.POST or None)
     if request.method == "POST" and form.is_valid():
-        with transaction.atomic():
+        with transaction.atomic(using=primary_alias()):
             voter = form.save(commit=False)
             voter.enter_pass = _generate_enter_pass()
             voter.save()
@@ -164,29 +384,201 @@ def admin_user_activate(request, pk):
 @csrf_protect
 def admin_user_delete(request, pk):
     voter = get_object_or_404(Voter, pk=pk)
-    name = voter.full_name
-    voter.delete()
-    messages.success(request, f"User {name} deleted.")
-    return redirect("core:admin_user_list")
+    return _delete_or_queue(request, deletion.VOTERS, [voter.pk], f"User {voter.full_name}", "core:admin_user_list")
 
 
 @staff_required
-@require_http_methods(["GET"])
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_user_bulk_delete(request):
+    pks = [int(pk) for pk in request.POST.getlist("ids") if pk.isdigit()]
+    if not pks:
+        messages.error(request, "Select at least one user.")
+        return redirect("core:admin_user_list")
+    return _delete_or_queue(request, deletion.VOTERS, pks, f"{len(pks)} user(s)", "core:admin_user_list")
+
+
+def _delete_or_queue(request, kind, pks, label, next_url):
+    """Delete now if few votes depend on the rows, otherwise hand the deletion to the job worker."""
+    if deletion.dependent_rows(kind, pks) > settings.DELETE_INLINE_MAX_VOTES:
+        jobs.enqueue("delete_records", {"kind": kind, "ids": pks}, user=request.user)
+        messages.success(request, f"Deletion of {label} queued; follow it on the Jobs page.")
+        return redirect("core:admin_job_list")
+    deleted, votes = deletion.delete(kind, pks)
+    messages.success(request, f"{label} deleted ({votes} vote(s) removed).")
+    return redirect(next_url)
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
 def admin_user_export(request):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Users"
-    ws.append(["Full Name", "EnterPass", "Vote Weight", "Status"])
-    for v in Voter.objects.all().order_by("full_name"):
-        ws.append([v.full_name, v.enter_pass, float(v.vote_weight), "Active" if v.is_active else "Inactive"])
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    response = HttpResponse(buf.getvalue(), content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = 'attachment; filename="users.xlsx"'
+    """Queue the users workbook; it is built by the job worker and downloaded from the jobs page."""
+    jobs.enqueue("export_users", user=request.user)
+    messages.success(request, "Users export queued.")
+    return redirect("core:admin_job_list")
+
+
+@staff_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def admin_user_import(request):
+    form = VoterImportForm(request.POST or None, request.FILES or None)
+    if request.method == "POST" and form.is_valid():
+        upload = jobs.save_upload(form.cleaned_data["file"])
+        jobs.enqueue("import_users", {"upload": upload}, user=request.user)
+        messages.success(request, "Users import queued.")
+        return redirect("core:admin_job_list")
+    return render(request, "admin/user_import.html", {"form": form})
+
+
+# ----- Delegations (proxy voting) -----
+@staff_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def admin_delegation_list(request):
+    """Delegations with the voter each one ends at and that voter's effective weight (core.delegation)."""
+    form = DelegationForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        data = form.cleaned_data
+        delegation.assign(data["delegator"], data["delegate"], data["survey"])
+        scope = f'on "{data["survey"]}"' if data["survey"] else "for all surveys"
+        messages.success(request, f"{data['delegator'].full_name} now delegates to {data['delegate'].full_name} {scope}.")
+        return redirect("core:admin_delegation_list")
+    delegations = list(Delegation.objects.select_related("delegator", "delegate", "survey"))
+    voters = {d.delegator_id: d.delegator for d in delegations} | {d.delegate_id: d.delegate for d in delegations}
+    weights = delegation.table(voters)
+    for d in delegations:
+        _, end = delegation.lookup(weights, d.delegator_id, d.survey_id, d.delegator.vote_weight)
+        d.resolved_to = voters.get(end)
+        if d.resolved_to is not None:
+            d.resolved_weight, _ = delegation.lookup(weights, end, d.survey_id, d.resolved_to.vote_weight)
+    selected = getattr(form, "cleaned_data", {})
+    return render(request, "admin/delegation_list.html", {
+        "form": form,
+        "delegations": delegations,
+        "selected_delegator": selected.get("delegator"),
+        "selected_delegate": selected.get("delegate"),
+        "selected_survey": selected.get("survey"),
+    })
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_delegation_delete(request, pk):
+    record = get_object_or_404(Delegation.objects.select_related("delegator", "delegate"), pk=pk)
+    delegation.revoke(record)
+    messages.success(request, f"Delegation from {record.delegator.full_name} to {record.delegate.full_name} removed.")
+    return redirect("core:admin_delegation_list")
+
+
+# ----- Search -----
+@staff_required
+@require_http_methods(["GET"])
+def admin_search(request):
+    """Ranked prefix search over voters and surveys (full-text index, see core.search)."""
+    query = request.GET.get("q", "").strip()
+    kind = request.GET.get("kind", "")
+    if kind not in search.KINDS:
+        kind = ""
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    hits, has_next = search.search(query, kind=kind or None, page=page) if query else ([], False)
+    return render(request, "admin/search.html", {
+        "query": query, "kind": kind, "hits": hits, "page": page, "has_next": has_next,
+    })
+
+
+# ----- Request profiles -----
+@staff_required
+@require_http_methods(["GET"])
+def admin_profile_list(request):
+    profiling_on = bool(request.get_signed_cookie(profiling.COOKIE_NAME, default=None, salt=profiling.COOKIE_SALT))
+    return render(request, "admin/profile_list.html", {
+        "profiles": profiling.list_profiles(),
+        "profiling_on": profiling_on,
+        "profile_param": profiling.PROFILE_PARAM,
+        "profiler_enabled": settings.PROFILER_ENABLED,
+    })
+
+
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_profile_toggle(request):
+    """Switch profiling of this browser's requests on or off (signed cookie)."""
+    response = redirect("core:admin_profile_list")
+    if request.get_signed_cookie(profiling.COOKIE_NAME, default=None, salt=profiling.COOKIE_SALT):
+        response.delete_cookie(profiling.COOKIE_NAME)
+        messages.success(request, "Request profiling switched off.")
+    else:
+        response.set_signed_cookie(profiling.COOKIE_NAME, "1", salt=profiling.COOKIE_SALT, httponly=True, samesite="Lax")
+        messages.success(request, "Request profiling switched on for this browser.")
     return response
 
 
+@staff_required
+@require_http_methods(["GET"])
+def admin_profile_detail(request, profile_id):
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise Http404("Profile not found.")
+    return render(request, "admin/profile_detail.html", {"profile": profile})
+
+
+# ----- Background jobs -----
+@staff_required
+@require_http_methods(["POST"])
+@csrf_protect
+def admin_results_export(request):
+    """Queue a results workbook covering all surveys."""
+    jobs.enqueue("export_results", user=request.user)
+    messages.success(request, "Results export queued.")
+    return redirect("core:admin_job_list")
+
+
+@staff_required
+@require_http_methods(["GET"])
+def admin_job_list(request):
+    job_list = list(Job.objects.select_related("created_by")[:50])
+    for job in job_list:
+        job.label = jobs.label_for(job.kind)
+        job.filename = Path(job.artifact).name if job.artifact else ""
+    has_pending = any(not job.is_finished for job in job_list)
+    return render(request, "admin/job_list.html", {"jobs": job_list, "has_pending": has_pending})
+
+
+@staff_required
+@require_http_methods(["GET"])
+def admin_job_download(request, pk):
+    job = get_object_or_404(Job, pk=pk, status=Job.DONE)
+    if not job.artifact:
+        raise Http404("This job has no file.")
+    root = jobs.artifact_root().resolve()
+    path = (root / job.artifact).resolve()
+    if root not in path.parents or not path.is_file():
+        raise Http404("File not found.")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=path.name)
+
+
+# ----- Paper votes -----
+@staff_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def admin_paper_vote_import(request):
+    """Queue a bulk import of paper ballots; the job's download is the per-row report."""
+    form = PaperVoteImportForm(request.POST or None, request.FILES or None)
+    if request.method == "POST" and form.is_valid():
+        upload = jobs.save_upload(form.cleaned_data["file"])
+        jobs.enqueue("import_paper_votes", {"upload": upload, "allow_closed": form.cleaned_data["allow_closed"]}, user=request.user)
+        messages.success(request, "Paper votes import queued.")
+        return redirect("core:admin_job_list")
+    return render(request, "admin/paper_vote_import.html", {"form": form})
+
+
 # ----- Vote reset -----
 @staff_required
 @require_http_methods(["GET", "POST"])
@@ -196,8 +588,57 @@ def admin_vote_reset(request):
     if request.method == "POST" and form.is_valid():
         survey = form.cleaned_data["survey"]
         voter = form.cleaned_data["voter"]
-        deleted, _ = Vote.objects.filter(survey=survey, voter=voter).delete()
+        with transaction.atomic(using=primary_alias()):
+            deleted, _ = Vote.objects.filter(survey=survey, voter=voter).delete()
+            idempotency.forget(voter, survey)  # a retried old form must not report the reset vote
         if deleted:
             messages.success(request, f"Vote reset for {voter.full_name} on this survey.")
         return redirect("core:admin_vote_reset")
-    return render(request, "admin/vote_reset.html", {"form": form})
+    selected = getattr(form, "cleaned_data", {})
+    return render(request, "admin/vote_reset.html", {
+        "form": form,
+        "selected_survey": selected.get("survey"),
+        "selected_voter": selected.get("voter"),
+        "lookup_limit": LOOKUP_LIMIT,
+    })
+
+
+@staff_required
+@require_http_methods(["GET"])
+def admin_lookup_surveys(request):
+    """Typeahead for the vote reset form: surveys matching `q` (JSON, capped)."""
+    surveys = search.suggest_surveys(request.GET.get("q", ""), limit=LOOKUP_LIMIT)
+    return JsonResponse({"results": [
+        {"id": s.pk, "text": s.question_text, "meta": date_format(timezone.localtime(s.end_date_time), "DATETIME_FORMAT")}
+        for s in surveys
+    ]})
+
+
+@staff_required
+@require_http_methods(["GET"])
+def admin_lookup_voters(request):
+    """
+    Typeahead for voter pickers, matching `q` (JSON, capped): with `survey` (vote reset
+    form), voters who voted on it; without (delegations), all active voters.
+    """
+    query = request.GET.get("q", "")
+    if "survey" not in request.GET:
+        voters = search.suggest_active_voters(query, limit=LOOKUP_LIMIT)
+        return JsonResponse({"results": [{"id": v.pk, "text": v.full_name, "meta": v.enter_pass} for v in voters]})
+    survey_id = request.GET["survey"]
+    survey = Survey.objects.filter(pk=survey_id).first() if survey_id.isdigit() else None
+    if survey is None:
+        return JsonResponse({"results": []})
+    voters = search.suggest_voters(survey, query, limit=LOOKUP_LIMIT)
+    return JsonResponse({"results": [{"id": v.pk, "text": v.full_name, "meta": v.enter_pass} for v in voters]})
+
+
+# ----- Metrics -----
+@require_http_methods(["GET"])
+def metrics_scrape(request):
+    """Prometheus scrape endpoint; staff users or a scraper sending the METRICS_TOKEN bearer token."""
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    authorized = bool(settings.METRICS_TOKEN) and scheme.lower() == "bearer" and constant_time_compare(token.strip(), settings.METRICS_TOKEN)
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden("Metrics are restricted to staff and the configured scraper token.")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -3,6 +3,7 @@ from django.contrib.auth import login as auth_login
 from django.contrib.auth.views import LoginView
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
+from core import metrics
 from core.forms import EnterPassLoginForm, AdminLoginForm
 
 
@@ -13,11 +14,13 @@ def login(request):
     if request.method == "POST":
         form = EnterPassLoginForm(request.POST)
         if form.is_valid():
+            metrics.logins.inc(result="success")
             voter = form.voter
             request.session["voter_id"] = voter.pk
             request.session["voter_full_name"] = voter.full_name
             next_url = request.session.pop("next_after_voter_login", None) or "core:survey_list"
             return redirect(next_url)
+        metrics.logins.inc(result="failure")
     else:
         form = EnterPassLoginForm()
     return render(request, "login.html", {"form": form})
@@ -1,56 +1,158 @@
 """User-area views: active surveys, voting, results."""
+import copy
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
-from django.db import transaction
-from django.db.models import Count, Sum
-from core.decorators import voter_required
-from core.models import Survey, Vote
-from core.forms import VoteForm
+from django.contrib import messages
+from django.http import HttpResponseBadRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch, Q, Sum
+from django.utils.dateparse import parse_datetime
+from core import coherence, delegation, idempotency, metrics, participation, publishing, ranked, turnout
+from core.db_routers import primary_alias
+from core.decorators import read_replica, voter_required
+from core.models import Ballot, Survey, Vote
+from core.forms import BallotVoteForm, RankedVoteForm, VoteForm
 
 
-@voter_required
-@require_http_methods(["GET"])
-def survey_list(request):
-    """Single surveys page: active surveys with inline vote form, closed surveys with results preview."""
+# Per-process caches, emptied when surveys or (closed surveys') votes change anywhere (core.coherence).
+_open_lists = coherence.LocalCache("survey_lists", [coherence.SURVEYS])
+_closed_results = coherence.LocalCache("closed_results", [coherence.SURVEYS, coherence.VOTES])
+
+
+def _finish_option_stats(option_stats):
+    """Add vote/weighted percentages and the weighted-winner flag to options carrying
+    `vote_count` and `weighted_total`; return them as a list."""
+    option_stats = list(option_stats)
+    total_votes = sum(o.vote_count for o in option_stats)
+    total_weighted = sum(o.weighted_total or 0 for o in option_stats)
+    for o in option_stats:
+        o.vote_pct = (100 * o.vote_count / total_votes) if total_votes else 0
+        o.weighted_pct = (100 * (o.weighted_total or 0) / total_weighted) if total_weighted else 0
+    max_weighted = max((o.weighted_total or 0 for o in option_stats), default=0)
+    for o in option_stats:
+        o.is_weighted_winner = (o.weighted_total or 0) == max_weighted and max_weighted > 0
+    return option_stats
+
+
+def _ballot_questions(ballot_queryset):
+    """Ballots with their questions (in order) and options prefetched."""
+    questions = Survey.objects.order_by("position", "id").prefetch_related("options")
+    return ballot_queryset.prefetch_related(Prefetch("questions", queryset=questions))
+
+
+def _open_surveys_and_ballots():
+    """Published standalone surveys and ballots still open now, with their options."""
     now = timezone.now()
-    voter = request.voter
-    active_surveys = Survey.objects.filter(
+    surveys = Survey.objects.filter(
         is_published=True,
         end_date_time__gt=now,
+        ballot__isnull=True,
     ).order_by("end_date_time").prefetch_related("options")
-    closed_surveys = Survey.objects.filter(
+    ballots = _ballot_questions(Ballot.objects.filter(
         is_published=True,
-        end_date_time__lte=now,
-    ).order_by("-end_date_time").prefetch_related("options")
+        end_date_time__gt=now,
+    ).order_by("end_date_time"))
+    return list(surveys), list(ballots)
+
+
+def _closed_option_stats(survey):
+    return _finish_option_stats(survey.options.annotate(
+        vote_count=Count("votes"),
+        weighted_total=Sum("votes__recorded_weight"),
+    ).order_by("id"))
+
+
+@voter_required
+@read_replica
+@require_http_methods(["GET"])
+def survey_list(request):
+    """Single surveys page: active surveys with inline vote form, the newest closed surveys with
+    results preview (older ones load page by page from `closed_surveys`)."""
+    now = timezone.now()
+    voter = request.voter
+    # Cached objects are shared: copy them before setting per-voter attributes.
+    open_surveys, open_ballots = _open_lists.get_or_set("open", _open_surveys_and_ballots)
+    active_surveys = [copy.copy(s) for s in open_surveys if s.end_date_time > now]
+    active_ballots = [copy.copy(b) for b in open_ballots if b.end_date_time > now]
     # For each active survey: (survey, existing_vote or None, form or None)
     active_with_forms = []
+    weights = delegation.weights_for(voter, [s.pk for s in active_surveys])
     for survey in active_surveys:
+        survey.effective_weight, survey.delegated_to = weights[survey.pk]
         existing = Vote.objects.filter(survey=survey, voter=voter).select_related("option").first()
         if existing:
+            if survey.is_ranked:
+                ranked.attach_rankings([existing], survey.options.all())
             active_with_forms.append((survey, existing, None))
         else:
-            active_with_forms.append((survey, None, VoteForm(survey)))
-    # For each closed survey: option_stats (vote_count, %, weighted_total, %) for preview
-    closed_with_preview = []
-    for survey in closed_surveys:
-        option_stats = survey.options.annotate(
-            vote_count=Count("votes"),
-            weighted_total=Sum("votes__recorded_weight"),
-        ).order_by("id")
-        total_votes = sum(o.vote_count for o in option_stats)
-        total_weighted = sum(o.weighted_total or 0 for o in option_stats)
-        for o in option_stats:
-            o.vote_pct = (100 * o.vote_count / total_votes) if total_votes else 0
-            o.weighted_pct = (100 * (o.weighted_total or 0) / total_weighted) if total_weighted else 0
-        max_weighted = max((o.weighted_total or 0 for o in option_stats), default=0)
-        for o in option_stats:
-            o.is_weighted_winner = (o.weighted_total or 0) == max_weighted and max_weighted > 0
-        closed_with_preview.append((survey, list(option_stats)))
+            active_with_forms.append((survey, None, (RankedVoteForm if survey.is_ranked else VoteForm)(survey)))
+    # For each active ballot: (ballot, [(question, existing_vote), ...] already answered, form or None)
+    ballot_votes = {
+        v.survey_id: v
+        for v in Vote.objects.filter(voter=voter, survey__ballot__in=active_ballots).select_related("option")
+    }
+    ballots_with_forms = []
+    ballot_weight, ballot_delegate = delegation.weight_for(voter) if active_ballots else (voter.vote_weight, None)
+    for ballot in active_ballots:
+        ballot.effective_weight, ballot.delegated_to = ballot_weight, ballot_delegate
+        questions = list(ballot.questions.all())
+        answered = [(q, ballot_votes[q.pk]) for q in questions if q.pk in ballot_votes]
+        pending = [q for q in questions if q.pk not in ballot_votes]
+        ballots_with_forms.append((ballot, answered, BallotVoteForm(pending) if pending else None))
+    closed_with_preview, closed_cursor = _closed_page(now)
     return render(request, "user/survey_list.html", {
         "active_with_forms": active_with_forms,
+        "ballots_with_forms": ballots_with_forms,
+        "closed_with_preview": closed_with_preview,
+        "closed_cursor": closed_cursor,
+    })
+
+
+def _closed_page(now, after=None):
+    """
+    One page of published closed surveys, newest first, with their result previews, and the
+    cursor of the next page (None on the last). Keyset pagination on (end_date_time, id):
+    each page is an index range scan, however long the history.
+    """
+    per_page = settings.CLOSED_SURVEYS_PER_PAGE
+    surveys = Survey.objects.filter(is_published=True, end_date_time__lte=now)
+    if after is not None:
+        end, pk = after
+        surveys = surveys.filter(Q(end_date_time__lt=end) | Q(end_date_time=end, pk__lt=pk))
+    page = list(surveys.order_by("-end_date_time", "-pk").select_related("ballot")[:per_page + 1])
+    cursor = None
+    if len(page) > per_page:
+        page = page[:per_page]
+        cursor = {"end": page[-1].end_date_time.isoformat(), "id": page[-1].pk}
+    # option_stats (vote_count, %, weighted_total, %) for each survey shown, cached once votes
+    # committed just before closing have landed.
+    closed_with_preview = []
+    settled = now - turnout.SETTLE
+    for survey in page:
+        if survey.end_date_time <= settled:
+            option_stats = _closed_results.get_or_set(survey.pk, lambda: _closed_option_stats(survey))
+        else:
+            option_stats = _closed_option_stats(survey)
+        closed_with_preview.append((survey, option_stats))
+    return closed_with_preview, cursor
+
+
+@voter_required
+@read_replica
+@require_http_methods(["GET"])
+def closed_surveys(request):
+    """Fragment with the next page of closed surveys after the `end`/`id` cursor (loaded by survey_list)."""
+    end = parse_datetime(request.GET.get("end", ""))
+    pk = request.GET.get("id", "")
+    if end is None or not pk.isdigit():
+        return HttpResponseBadRequest("Invalid cursor.")
+    closed_with_preview, closed_cursor = _closed_page(timezone.now(), (end, int(pk)))
+    return render(request, "user/closed_surveys.html", {
         "closed_with_preview": closed_with_preview,
+        "closed_cursor": closed_cursor,
     })
 
 
@@ -58,29 +160,69 @@ def survey_list(request):
 @require_http_methods(["GET", "POST"])
 @csrf_protect
 def survey_vote(request, pk):
-    """Handle vote POST. GET redirects to survey list (voting is inline there)."""
+    """Handle vote POST (a repeat of an already recorded form gets its outcome back, see
+    core.idempotency). GET redirects to survey list (voting is inline there)."""
     if request.method == "GET":
         return redirect("core:survey_list")
-    survey = get_object_or_404(Survey, pk=pk)
+    voter = request.voter
+    token = idempotency.token_from(request)
+    submission = idempotency.find(voter, token)
+    if submission is not None:
+        # A retry of a form that already voted: answer it before any other check.
+        return _replay(request, "survey", submission)
+    # Ballot questions are answered together through ballot_vote (general delegation, one transaction).
+    survey = get_object_or_404(Survey, pk=pk, ballot__isnull=True)
     now = timezone.now()
     if now >= survey.end_date_time:
+        metrics.votes.inc(kind="survey", result="closed")
         return redirect("core:results_detail", pk=pk)
     if not survey.is_published:
+        metrics.votes.inc(kind="survey", result="unpublished")
         return redirect("core:survey_list")
-    voter = request.voter
     if Vote.objects.filter(survey=survey, voter=voter).exists():
+        metrics.votes.inc(kind="survey", result="duplicate")
+        messages.info(request, "Your vote on this survey was already recorded.")
+        return redirect("core:survey_list")
+    weight, delegate = delegation.weight_for(voter, survey.pk)
+    if delegate is not None:
+        metrics.votes.inc(kind="survey", result="delegated")
+        messages.error(request, f"You have delegated your vote on this survey to {delegate.full_name}.")
         return redirect("core:survey_list")
-    form = VoteForm(survey, request.POST)
-    if form.is_valid():
-        option = form.cleaned_data["option"]
-        if option.survey_id == survey.pk:
-            with transaction.atomic():
-                Vote.objects.create(
-                    survey=survey,
-                    voter=voter,
-                    option=option,
-                    recorded_weight=voter.vote_weight,
-                )
+    if survey.is_ranked:
+        form = RankedVoteForm(survey, request.POST)
+        if not form.is_valid():
+            metrics.votes.inc(kind="ranked", result="invalid")
+            messages.error(request, next(iter(form.errors.values()))[0])
+            return redirect("core:survey_list")
+        ranking = form.cleaned_data["ranking"]
+        texts = dict(form.fields["rank_1"].choices)
+        vote = Vote(survey=survey, voter=voter, option_id=ranking[0], ranking=ranked.encode_ranking(ranking), recorded_weight=weight)
+        summary = "Your ranking " + ", ".join(f"“{texts[pk]}”" for pk in ranking)
+        kind = "ranked"
+    else:
+        form = VoteForm(survey, request.POST)
+        option = form.cleaned_data["option"] if form.is_valid() else None
+        if option is None or option.survey_id != survey.pk:
+            metrics.votes.inc(kind="survey", result="invalid")
+            return redirect("core:survey_list")
+        vote = Vote(survey=survey, voter=voter, option=option, recorded_weight=weight)
+        summary = f"Your vote for “{option.option_text}”"
+        kind = "survey"
+    try:
+        with transaction.atomic(using=primary_alias()):
+            vote.save()
+            idempotency.record(voter, token, summary, survey=survey)
+    except IntegrityError:
+        # A concurrent copy of this POST (or another tab) voted first; nothing was written.
+        return _replay(request, kind, idempotency.find(voter, token), "Your vote on this survey was already recorded.")
+    metrics.votes.inc(kind=kind, result="recorded")
+    return redirect("core:survey_list")
+
+
+def _replay(request, kind, submission, fallback=None):
+    """Tell the voter their vote was already recorded: the stored outcome of this form, else `fallback`."""
+    metrics.votes.inc(kind=kind, result="replayed" if submission is not None else "duplicate")
+    messages.info(request, idempotency.message(submission) if submission is not None else fallback)
     return redirect("core:survey_list")
 
 
@@ -97,34 +239,162 @@ def survey_detail(request, pk):
 @voter_required
 @require_http_methods(["GET"])
 def results_list(request):
-    """Redirect to survey list (closed surveys are shown there)."""
+    """The published list of closed surveys, else the survey list (closed surveys are shown there)."""
+    if settings.RESULTS_PUBLISH_ENABLED:
+        response = publishing.serve(publishing.index_path())
+        if response is not None:
+            return response
     return redirect("core:survey_list")
 
 
 @voter_required
+@read_replica
 @require_http_methods(["GET"])
 def results_detail(request, pk):
     """Results for one survey: per-option totals and named voter list."""
     survey = get_object_or_404(Survey, pk=pk)
     if timezone.now() < survey.end_date_time:
         return redirect("core:survey_vote", pk=pk)
+    if settings.RESULTS_PUBLISH_ENABLED:
+        # Final results: the static page written when the survey closed (core.publishing).
+        response = publishing.serve(publishing.results_path(survey.pk))
+        metrics.record_cache("published_results", response is not None)
+        if response is not None:
+            return response
+    return render(request, "user/results_detail.html", results_detail_context(survey))
+
+
+def results_detail_context(survey):
+    """Template context of a closed survey's results page (also used for the static copy)."""
     votes = Vote.objects.filter(survey=survey).select_related("voter", "option")
-    # Per-option: count, weighted total, and percentages
-    from django.db.models import Count, Sum
-    option_stats = survey.options.annotate(
-        vote_count=Count("votes"),
-        weighted_total=Sum("votes__recorded_weight"),
-    ).order_by("id")
-    total_votes = sum(o.vote_count for o in option_stats)
-    total_weighted = sum(o.weighted_total or 0 for o in option_stats)
-    for o in option_stats:
-        o.vote_pct = (100 * o.vote_count / total_votes) if total_votes else 0
-        o.weighted_pct = (100 * (o.weighted_total or 0) / total_weighted) if total_weighted else 0
-    max_weighted = max((o.weighted_total or 0 for o in option_stats), default=0)
-    for o in option_stats:
-        o.is_weighted_winner = (o.weighted_total or 0) == max_weighted and max_weighted > 0
-    return render(request, "user/results_detail.html", {
+    with metrics.results_build.time(page="survey"):
+        option_stats = _finish_option_stats(survey.options.annotate(
+            vote_count=Count("votes"),
+            weighted_total=Sum("votes__recorded_weight"),
+        ).order_by("id"))
+    context = {
         "survey": survey,
         "option_stats": option_stats,
         "votes": votes,
+    }
+    if survey.is_ranked:
+        with metrics.results_build.time(page="ranked"):
+            context["runoff"] = _runoff_table(survey, option_stats)
+        ranked.attach_rankings(votes, option_stats)
+    return context
+
+
+def _runoff_table(survey, option_stats):
+    """Instant-runoff rounds of a ranked survey as table rows: winner first, then by elimination (last out first)."""
+    result = ranked.tally(ranked.survey_ballots(survey), [o.pk for o in option_stats])
+    table = []
+    for index, option in enumerate(option_stats):
+        cells, out_in, previous = [], None, None
+        for r in result.rounds:
+            received = previous.transfers.get(index) if previous else None
+            previous = r
+            if index not in r.weights:
+                cells.append(None)
+                continue
+            total = sum(r.weights.values())
+            cells.append({
+                "weight": ranked.from_cents(r.weights[index]),
+                "count": r.counts[index],
+                "pct": 100 * r.weights[index] / total if total else 0,
+                "received": ranked.from_cents(received) if received else None,
+                "eliminated": r.eliminated == index,
+                "winner": r.winner == index,
+            })
+            if r.eliminated == index:
+                out_in = r.number
+        table.append({"option": option.option_text, "cells": cells, "out_in": out_in, "winner": option.pk == result.winner})
+    table.sort(key=lambda row: (not row["winner"], -(row["out_in"] or len(result.rounds) + 1)))
+    exhausted = [ranked.from_cents(r.exhausted_weight) for r in result.rounds]
+    return {
+        "rounds": [r.number for r in result.rounds],
+        "rows": table,
+        "exhausted": exhausted if any(exhausted) else None,
+        "winner": next((row["option"] for row in table if row["winner"]), None),
+    }
+
+
+@voter_required
+@require_http_methods(["GET", "POST"])
+@csrf_protect
+def ballot_vote(request, pk):
+    """Record answers to every unanswered ballot question from one POST, in one transaction."""
+    if request.method == "GET":
+        return redirect("core:survey_list")
+    voter = request.voter
+    token = idempotency.token_from(request)
+    submission = idempotency.find(voter, token)
+    if submission is not None:
+        return _replay(request, "ballot", submission)
+    ballot = get_object_or_404(_ballot_questions(Ballot.objects.all()), pk=pk)
+    if timezone.now() >= ballot.end_date_time:
+        metrics.votes.inc(kind="ballot", result="closed")
+        return redirect("core:ballot_results", pk=pk)
+    if not ballot.is_published:
+        metrics.votes.inc(kind="ballot", result="unpublished")
+        return redirect("core:survey_list")
+    weight, delegate = delegation.weight_for(voter)  # ballot questions follow the general delegation
+    if delegate is not None:
+        metrics.votes.inc(kind="ballot", result="delegated")
+        messages.error(request, f"You have delegated your vote to {delegate.full_name}.")
+        return redirect("core:survey_list")
+    questions = list(ballot.questions.all())
+    answered = set(Vote.objects.filter(voter=voter, survey__in=questions).values_list("survey_id", flat=True))
+    pending = [q for q in questions if q.pk not in answered]
+    if not pending:
+        metrics.votes.inc(kind="ballot", result="duplicate")
+        messages.info(request, "Your ballot was already recorded.")
+        return redirect("core:survey_list")
+    form = BallotVoteForm(pending, request.POST)
+    if not form.is_valid():
+        metrics.votes.inc(kind="ballot", result="invalid")
+        messages.error(request, "Please answer every question on the ballot.")
+        return redirect("core:survey_list")
+    votes = [
+        Vote(survey=survey, voter=voter, option_id=option_id, recorded_weight=weight)
+        for survey, option_id in form.selections()
+    ]
+    try:
+        with transaction.atomic(using=primary_alias()):
+            Vote.objects.bulk_create(votes)  # no post_save signals
+            participation.record(votes)
+            idempotency.record(voter, token, f"Your ballot “{ballot.title}”", ballot=ballot)
+    except IntegrityError:
+        # A concurrent submission of the same ballot won the race; nothing was written.
+        return _replay(request, "ballot", idempotency.find(voter, token), "Your ballot was already recorded.")
+    metrics.votes.inc(kind="ballot", result="recorded")
+    return redirect("core:survey_list")
+
+
+@voter_required
+@read_replica
+@require_http_methods(["GET"])
+def ballot_results(request, pk):
+    """Per-question totals for a closed ballot, aggregated in one grouped query."""
+    ballot = get_object_or_404(_ballot_questions(Ballot.objects.all()), pk=pk)
+    if timezone.now() < ballot.end_date_time:
+        return redirect("core:survey_list")
+    with metrics.results_build.time(page="ballot"):
+        totals = {
+            row["option_id"]: row
+            for row in Vote.objects.filter(survey__ballot=ballot).values("option_id").annotate(
+                vote_count=Count("id"),
+                weighted_total=Sum("recorded_weight"),
+            ).order_by()
+        }
+        question_stats = []
+        for survey in ballot.questions.all():
+            options = list(survey.options.all())
+            for o in options:
+                row = totals.get(o.pk, {})
+                o.vote_count = row.get("vote_count", 0)
+                o.weighted_total = row.get("weighted_total")
+            question_stats.append((survey, _finish_option_stats(options)))
+    return render(request, "user/ballot_results.html", {
+        "ballot": ballot,
+        "question_stats": question_stats,
     })
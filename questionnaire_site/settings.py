@@ -10,10 +10,15 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Runtime files (metrics snapshots, job files, profiles, ...); QUESTIONNAIRE_VAR moves them
+# elsewhere (e.g. for the startup probe's scratch runs).
+VAR_ROOT = Path(os.environ.get("QUESTIONNAIRE_VAR") or BASE_DIR / "var")
 
 
 # Quick-start development settings - unsuitable for production
@@ -42,10 +47,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.tenancy.TenantMiddleware",
+    "core.metrics.MetricsMiddleware",
+    "core.traffic.TrafficRecorderMiddleware",
+    "core.middleware.CompressionMiddleware",
+    "core.coherence.CoherenceMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
+    "core.db_routers.ReplicaPinningMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.profiling.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -77,10 +89,48 @@ WSGI_APPLICATION = "questionnaire_site.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # QUESTIONNAIRE_DB points at another SQLite file (e.g. the startup probe's scratch database).
+        "NAME": os.environ.get("QUESTIONNAIRE_DB") or BASE_DIR / "db.sqlite3",
     }
 }
 
+# Optional read replica for voter and results reads (see core/db_routers.py). For local
+# testing, point QUESTIONNAIRE_REPLICA_DB at a second SQLite file and fill it with
+# `python manage.py sync_replica`.
+if os.environ.get("QUESTIONNAIRE_REPLICA_DB"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["QUESTIONNAIRE_REPLICA_DB"],
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICA_ALIAS = "replica"
+
+# Organizations served by this deployment (core/tenancy.py), read from the JSON file named
+# by QUESTIONNAIRE_TENANTS: {"<slug>": {"name": ..., "hosts": [...]}}. Each one has its own
+# database `tenant_<slug>`: TENANT_DB_ROOT/<slug>.sqlite3, or the entry's "database" settings
+# (e.g. a PostgreSQL schema); an optional "replica" names a SQLite replica file. Requests for
+# no organization use "default". Create the databases with `python manage.py migrate_tenants`.
+TENANT_DB_ROOT = VAR_ROOT / "tenants"
+TENANT_PATH_PREFIX = "o"  # /o/<slug>/... selects an organization on any host
+TENANTS = {}
+if os.environ.get("QUESTIONNAIRE_TENANTS"):
+    with open(os.environ["QUESTIONNAIRE_TENANTS"], encoding="utf-8") as fh:
+        TENANTS = json.load(fh)
+for _slug, _tenant in TENANTS.items():
+    DATABASES[f"tenant_{_slug}"] = _tenant.get("database") or {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": TENANT_DB_ROOT / f"{_slug}.sqlite3",
+    }
+    if _tenant.get("replica"):
+        DATABASES[f"tenant_{_slug}_replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": _tenant["replica"],
+            "TEST": {"MIRROR": f"tenant_{_slug}"},
+        }
+DATABASE_ROUTERS = ["core.db_routers.TenantRouter"]
+# Seconds a session keeps reading from the primary after a write (covers replication lag)
+DATABASE_REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,13 +172,64 @@ USE_L10N = False
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
-STATIC_URL = "static/"
+STATIC_URL = "/static/"  # absolute: shared by every organization, whatever its path prefix
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# `manage.py test` writes the var/ file roots (metrics, jobs, profiles, ...) to a temporary directory
+TEST_RUNNER = "core.test_runner.TestRunner"
+
 # Session timeout (configurable); default 2 hours
 SESSION_COOKIE_AGE = 7200
 SESSION_SAVE_EVERY_REQUEST = True
+
+# Background jobs (python manage.py run_jobs): result files and uploads, worker pool size
+JOB_ARTIFACT_ROOT = VAR_ROOT / "jobs"
+JOB_WORKERS = 2
+
+# Voter/survey deletion (core/deletion.py): rows per DELETE transaction, and deletions
+# touching more votes than DELETE_INLINE_MAX_VOTES run as a background job
+DELETE_CHUNK_SIZE = 2000
+DELETE_INLINE_MAX_VOTES = 5000
+
+# Closed surveys shown on the voter's survey page up front; older ones load on demand
+CLOSED_SURVEYS_PER_PAGE = 10
+
+# Vote forms carry a one-time token (core/idempotency.py); a POST repeating a recorded
+# one within this many seconds gets the original outcome back instead of voting again
+VOTE_TOKEN_TTL = 3600
+
+# Staff request profiler (core/profiling.py): ?_profile=1 or the toggle on the Profiles page.
+# Off unless QUESTIONNAIRE_PROFILER=1, so the middleware is not installed by default
+PROFILER_ENABLED = os.environ.get("QUESTIONNAIRE_PROFILER") == "1"
+PROFILE_ROOT = VAR_ROOT / "profiles"
+PROFILE_KEEP = 100
+
+# Metrics (core/metrics.py): per-process snapshots merged by the /metrics/ scrape endpoint
+METRICS_ENABLED = True
+METRICS_ROOT = VAR_ROOT / "metrics"
+METRICS_FLUSH_SECONDS = 1.0
+METRICS_STALE_SECONDS = 300  # gauges of processes silent for longer are dropped, exited ones folded
+# Scrapers send "Authorization: Bearer <token>"; unset, only staff users can read /metrics/
+METRICS_TOKEN = os.environ.get("QUESTIONNAIRE_METRICS_TOKEN", "")
+
+# Static copies of final results (core/publishing.py), written when surveys close and served
+# by the results views after their login check. Set RESULTS_PUBLISH_ACCEL_URL to an `internal`
+# front-server location aliasing RESULTS_PUBLISH_ROOT to hand the file over (X-Accel-Redirect)
+# instead of streaming it from Django. `run_jobs` publishes surveys whose end time passed.
+RESULTS_PUBLISH_ENABLED = False
+RESULTS_PUBLISH_ROOT = VAR_ROOT / "published"
+RESULTS_PUBLISH_ACCEL_URL = ""  # e.g. "/_published/"
+RESULTS_PUBLISH_INTERVAL = 60  # seconds between run_jobs' checks for newly closed surveys
+
+# Turnout timelines (core/turnout.py) are cached in the default cache for this many seconds;
+# a shared CACHES backend saves each worker process building its own copy.
+TURNOUT_CACHE_TIMEOUT = 24 * 3600
+
+# Request trace recording for `replay_traffic` (core/traffic.py); off unless enabled.
+TRAFFIC_RECORD_ENABLED = False
+TRAFFIC_ROOT = VAR_ROOT / "traffic"
+TRAFFIC_EXCLUDE_PATHS = ["/metrics/", "/static/"]